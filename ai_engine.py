@@ -1,5 +1,6 @@
 import os
 import random
+import uuid
 from datetime import datetime, timedelta
 from openai import OpenAI
 from anthropic import Anthropic
@@ -7,6 +8,15 @@ import requests
 from PIL import Image
 from io import BytesIO
 import re
+import json
+from text_replace import ReplacementTable
+from keyword_index import KeywordIndex
+import media_store
+from job_queue import JobCancelled, current_job
+from llm_client import (
+    chat_completion, stream_chat_completion, chat_url, LLMError, LLMOverloaded, LLMUnavailable,
+    PRIORITY_INTERACTIVE, PRIORITY_TRANSLATION, PRIORITY_BACKGROUND,
+)
 
 # Try to import OpenCC for traditional->simplified conversion if available
 try:
@@ -46,6 +56,80 @@ def clean_think_tags(text):
     
     return text.strip()
 
+_THINK_TAG_RE = re.compile(r'<(/?)think', re.IGNORECASE)
+_THINK_TAG_PREFIXES = ('<think', '</think')
+
+class ThinkTagFilter:
+    """
+    clean_think_tags 的增量版本，用于流式输出
+    逐块喂入模型输出，只返回 <think>...</think> 之外可以立即显示的文本；
+    可能是标签开头的尾部字符会暂存，直到下一块到来再判断
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._in_think = False
+        self._started = False
+
+    def _emit(self, text):
+        if not self._started:
+            text = text.lstrip()
+            if text:
+                self._started = True
+        return text
+
+    def feed(self, chunk):
+        self._buffer += chunk or ''
+        out = []
+        while self._buffer:
+            match = _THINK_TAG_RE.search(self._buffer)
+            if self._in_think:
+                # 在思考块内：丢弃内容直到出现完整的结束标签
+                while match and not match.group(1):
+                    match = _THINK_TAG_RE.search(self._buffer, match.end())
+                if not match:
+                    self._buffer = self._buffer[self._partial_tag_start():]
+                    break
+                close = self._buffer.find('>', match.end())
+                if close == -1:
+                    self._buffer = self._buffer[match.start():]
+                    break
+                self._buffer = self._buffer[close + 1:]
+                self._in_think = False
+                continue
+
+            if not match:
+                keep_from = self._partial_tag_start()
+                out.append(self._buffer[:keep_from])
+                self._buffer = self._buffer[keep_from:]
+                break
+
+            out.append(self._buffer[:match.start()])
+            close = self._buffer.find('>', match.end())
+            if close == -1:
+                self._buffer = self._buffer[match.start():]
+                break
+            self._in_think = not match.group(1)
+            self._buffer = self._buffer[close + 1:]
+
+        return self._emit(''.join(out))
+
+    def flush(self):
+        """流结束时调用：未闭合的思考块直接丢弃，其余残留文本原样输出"""
+        remaining = '' if self._in_think else self._buffer
+        self._buffer = ''
+        return self._emit(remaining)
+
+    def _partial_tag_start(self):
+        """返回缓冲区尾部可能是半个 think 标签的起始位置（没有则返回缓冲区长度）"""
+        idx = self._buffer.rfind('<')
+        if idx == -1:
+            return len(self._buffer)
+        tail = self._buffer[idx:].lower()
+        if any(prefix.startswith(tail) for prefix in _THINK_TAG_PREFIXES):
+            return idx
+        return len(self._buffer)
+
 def check_story_similarity(title, content, category, limit=10):
     """
     检查新生成的故事是否与最近的故事太相似（避免重复和金鱼街过多）
@@ -338,50 +422,61 @@ def motifs_for(category_key):
     return mapping.get(category_key, [])
 
 
+def translation_backends():
+    """Identify the backends translate_text() tries, in order, e.g. for cache keys.
+
+    LM Studio comes first when configured; if it fails, translate_text falls
+    back to OpenAI, or to Anthropic when there is no OpenAI client.
+    """
+    backends = []
+    if os.getenv('LM_STUDIO_URL', '').rstrip('/'):
+        backends.append(f"lmstudio:{os.getenv('LM_STUDIO_MODEL', 'local-model')}")
+    if openai_client:
+        backends.append(f"openai:{os.getenv('AI_MODEL', 'gpt-3.5-turbo')}")
+    elif anthropic_client:
+        backends.append(f"anthropic:{os.getenv('AI_MODEL', 'claude-2')}")
+    return backends
+
+
 def translate_text(text, target='en'):
     """Translate text to target language using available AI client (OpenAI/Anthropic).
 
     Returns translated string or None if no translation service is available.
     """
+    return translate_text_with_backend(text, target=target)[0]
+
+
+def translate_text_with_backend(text, target='en'):
+    """translate_text() that also reports which backend produced the translation.
+
+    Returns (translated, backend), where backend is one of translation_backends(),
+    or (None, None) if no translation service is available.
+    """
     if not text:
-        return ''
+        return '', None
     # Try LM Studio local server first (useful when using qwen2.5-7b-instruct-1m)
     lm_studio_url = os.getenv('LM_STUDIO_URL', '').rstrip('/')
     use_lm_studio = bool(lm_studio_url)
 
     if use_lm_studio:
         try:
-            import subprocess, json
-            chat_url = f"{lm_studio_url}/v1/chat/completions"
             system = """你是翻译助手。将下面的中文贴文翻译成英文，保持原文的口吻与长度（若为第一人称求助贴，请保留求助语气）。只返回翻译内容，不要额外说明。"""
             user_prompt = f"{text}"
 
-            request_data = {
-                "messages": [
+            translated = chat_completion(
+                [
                     {"role": "system", "content": system},
                     {"role": "user", "content": user_prompt}
                 ],
-                "temperature": 0.1,
-                "max_tokens": 800
-            }
-
-            curl_cmd = [
-                'curl', '-s', '-X', 'POST', chat_url,
-                '-H', 'Content-Type: application/json',
-                '-d', json.dumps(request_data, ensure_ascii=False),
-                '--max-time', '60'
-            ]
-
-            proc = subprocess.run(curl_cmd, capture_output=True, text=True, timeout=65, encoding='utf-8', errors='ignore')
-            if proc.returncode == 0 and proc.stdout:
-                try:
-                    resp = json.loads(proc.stdout)
-                    translated = resp['choices'][0]['message']['content']
-                    return translated.strip()
-                except Exception as e:
-                    print(f"[translate_text] LM Studio parse failed: {e}")
-            else:
-                print(f"[translate_text] LM Studio request failed: {proc.stderr}")
+                temperature=0.1,
+                max_tokens=800,
+                timeout=60,
+                url=lm_studio_url,
+                priority=PRIORITY_TRANSLATION
+            )
+            return translated.strip(), f"lmstudio:{os.getenv('LM_STUDIO_MODEL', 'local-model')}"
+        except LLMError as e:
+            print(f"[translate_text] LM Studio request failed: {e}")
         except Exception as e:
             print(f"[translate_text] LM Studio translation error: {e}")
 
@@ -399,7 +494,7 @@ def translate_text(text, target='en'):
                 max_tokens=800
             )
             result = resp.choices[0].message.content
-            return result.strip()
+            return result.strip(), f"openai:{model}"
 
         if anthropic_client:
             model = os.getenv('AI_MODEL', 'claude-2')
@@ -411,13 +506,13 @@ def translate_text(text, target='en'):
             )
             if hasattr(resp, 'content'):
                 try:
-                    return resp.content[0].text.strip()
+                    return resp.content[0].text.strip(), f"anthropic:{model}"
                 except Exception:
-                    return None
+                    return None, None
     except Exception as e:
         print(f"[translate_text] translation failed: {e}")
 
-    return None
+    return None, None
 
 
 def add_title_tag(title, story_age_days=0):
@@ -467,36 +562,75 @@ def convert_to_simplified(text):
     lm_studio_url = os.getenv('LM_STUDIO_URL', '').rstrip('/')
     if lm_studio_url:
         try:
-            import subprocess, json
             system = """你是一个简体中文转换助手。请将下面的文本转换为简体中文，保持原文口吻与句意，不要添加说明，只返回转换后的文本。"""
-            request_data = {
-                "messages": [
+            converted = chat_completion(
+                [
                     {"role": "system", "content": system},
                     {"role": "user", "content": text}
                 ],
-                "temperature": 0.0,
-                "max_tokens": 1200
-            }
-            chat_url = f"{lm_studio_url}/v1/chat/completions"
-            curl_cmd = [
-                'curl', '-s', '-X', 'POST', chat_url,
-                '-H', 'Content-Type: application/json',
-                '-d', json.dumps(request_data, ensure_ascii=False),
-                '--max-time', '30'
-            ]
-            proc = subprocess.run(curl_cmd, capture_output=True, text=True, timeout=35, encoding='utf-8', errors='ignore')
-            if proc.returncode == 0 and proc.stdout:
-                try:
-                    resp = json.loads(proc.stdout)
-                    return resp['choices'][0]['message']['content'].strip()
-                except Exception:
-                    pass
+                temperature=0.0,
+                max_tokens=1200,
+                timeout=30,
+                url=lm_studio_url,
+                priority=PRIORITY_BACKGROUND
+            )
+            return converted.strip()
         except Exception:
             pass
 
     return text
 
 
+# ============================================
+# 文本过滤规则：导入时编译一次，供 post_process_story_text / filter_dialogue_and_horror 复用
+# ============================================
+
+# filter_dialogue_and_horror: 动作描述与对话结构
+_RE_ACTION_ASTERISK = re.compile(r'\*[^*]*\*')
+_RE_ACTION_PAREN = re.compile(r'\([^)]*\)')
+_RE_ACTION_FULLWIDTH = re.compile(r'（[^）]*）')
+_RE_ACTION_SQUARE = re.compile(r'\[[^]]*\]')
+_RE_DIALOGUE_SENTENCE = re.compile(r'[^。！？]*[说道讲]：[^。！？]*[。！？]?')
+_RE_DIALOGUE_LINE_END = re.compile(r'，[说道]：.*?$', re.MULTILINE)
+_RE_DIALOGUE_SPEAKER = re.compile(r'[他她我店主老板][^。！？]*[说道]：[^。！？]*')
+_RE_DIALOGUE_SUBJECT_COMMA = re.compile(r'[他她我][^。！？]*[说道讲]，')
+_RE_DIALOGUE_CLAUSE_COMMA = re.compile(r'，[^。！？]*[说道讲]，')
+_RE_REPEATED_STOPS = re.compile(r'[。！？]{2,}')
+_RE_WHITESPACE = re.compile(r'\s+')
+
+_HORROR_REPLACEMENTS = ReplacementTable([
+    ('鬼使神差', '不知怎么'), ('惊魂', '不安'), ('鬼', '那种感觉'),
+    ('恐怖', '不舒服'), ('可怕', '让人不安'), ('血腥', '红色的东西'),
+    ('死亡', '出事'), ('尸体', '躺着不动的'), ('邪恶', '不对劲'),
+    ('魔鬼', '说不出的东西'), ('诅咒', '不好的感觉'), ('地狱', '很糟糕的地方'),
+    ('吓人', '让人紧张'), ('恶心', '不太舒服'),
+])
+
+# post_process_story_text: 括号、舞台说明、引号、第一人称
+# 括号类型（不含标题标签用的【】），按顺序逐个删除
+_BRACKET_PATTERNS = [re.compile(p) for p in (r'\([^\)]*\)', r'\（[^\）]*\）', r'\[[^\]]*\]', r'\{[^\}]*\}')]
+_RE_STAGE_TRIGGERS = re.compile('|'.join(map(re.escape, ['动作', '镜头', '画面', '拍摄', '旁白', '场景', '注：', '说明：'])))
+_RE_MARKER_LINE = re.compile(r'^[\-\*•\s]{0,3}$')
+_RE_BLANK_LINES = re.compile(r'\n{2,}')
+_RE_MULTI_SPACE = re.compile(r'\s{2,}')
+_QUOTE_PATTERNS = [re.compile(p) for p in (r'“[^”]*”', r'『[^』]*』', r'「[^」]*」', r'"[^\"]*"', r"'[^']*'")]
+_STRAY_QUOTES = str.maketrans('', '', '“”「」『』')
+_RE_LEADING_THIRD_PERSON = re.compile(r'([。！？\n]|^)\s*(他|她|他们|她们|它|它们)\s+')
+_RE_START_THIRD_PERSON = re.compile(r'^(他|她|它)')
+_RE_THIRD_PERSON_VERB = re.compile(r'(他|她|它)(看到|听到|发现|经历|遇到|感觉|觉得)')
+
+# 露骨恐怖词汇替换为隐晦表达，随后把过于夸张的形容词换成"有点"
+_EXPLICIT_HORROR_REPLACEMENTS = ReplacementTable([
+    ('鬼', '那种东西'), ('鬼魂', '某种存在'), ('幽灵', '看不见的东西'),
+    ('诅咒', '不好的感觉'), ('恶魔', '不对劲的东西'), ('怪物', '说不出的东西'),
+    ('血腥', '红色的'), ('死亡', '不在了'), ('尸体', '躺着的人'),
+    ('恐怖', '不安'), ('可怕', '让人不舒服'), ('惊悚', '紧张'),
+    ('阴森', '安静得有点怪'), ('邪恶', '不对劲'), ('恶心', '不太舒服'),
+    ('血液', '红色液体'), ('死人', '没有反应的人'), ('杀害', '出事了'),
+    ('魔鬼', '不好的东西'), ('灵异', '说不清的'), ('超自然', '无法解释的'),
+] + [(word, '有点') for word in ['极其', '非常可怕', '十分恐怖', '异常恐怖', '极度', '超级']])
+
+
 def filter_dialogue_and_horror(text):
     """Filter out dialogue structures, action descriptions, and explicit horror words for subtle style"""
     if not text:
@@ -504,40 +638,34 @@ def filter_dialogue_and_horror(text):
     
     try:
         # Remove action descriptions in asterisks or parentheses
-        text = re.sub(r'\*[^*]*\*', '', text)  # Remove *action*
-        text = re.sub(r'\([^)]*\)', '', text)   # Remove (action)
-        text = re.sub(r'（[^）]*）', '', text)   # Remove （action）
-        text = re.sub(r'\[[^]]*\]', '', text)   # Remove [action]
+        text = _RE_ACTION_ASTERISK.sub('', text)    # Remove *action*
+        text = _RE_ACTION_PAREN.sub('', text)       # Remove (action)
+        text = _RE_ACTION_FULLWIDTH.sub('', text)   # Remove （action）
+        text = _RE_ACTION_SQUARE.sub('', text)      # Remove [action]
         
         # Remove dialogue structures completely
-        # Pattern 1: "他说："、"店主道："等
-        text = re.sub(r'[^。！？]*[说道讲]：[^。！？]*[。！？]?', '', text)
-        # Pattern 2: Incomplete dialogue at line end
-        text = re.sub(r'，[说道]：.*?$', '。', text, flags=re.MULTILINE)
-        # Pattern 3: Direct speech indicators
-        text = re.sub(r'[他她我店主老板][^。！？]*[说道]：[^。！？]*', '', text)
+        # 这些模式没有固定前缀，会在每个位置尝试匹配；先用必需字符做廉价预判
+        if '：' in text:
+            # Pattern 1: "他说："、"店主道："等
+            text = _RE_DIALOGUE_SENTENCE.sub('', text)
+            # Pattern 2: Incomplete dialogue at line end
+            text = _RE_DIALOGUE_LINE_END.sub('。', text)
+            # Pattern 3: Direct speech indicators
+            text = _RE_DIALOGUE_SPEAKER.sub('', text)
         # Pattern 4: Remove incomplete dialogue fragments
-        text = re.sub(r'我说。', '', text)
-        text = re.sub(r'他说。', '', text)
-        text = re.sub(r'她说。', '', text)
-        text = re.sub(r'[他她我][^。！？]*[说道讲]，', '，', text)
-        text = re.sub(r'，[^。！？]*[说道讲]，', '，', text)
+        text = text.replace('我说。', '')
+        text = text.replace('他说。', '')
+        text = text.replace('她说。', '')
+        if '，' in text:
+            text = _RE_DIALOGUE_SUBJECT_COMMA.sub('，', text)
+            text = _RE_DIALOGUE_CLAUSE_COMMA.sub('，', text)
         
         # Replace explicit horror words with subtle alternatives
-        horror_replacements = {
-            '鬼使神差': '不知怎么', '惊魂': '不安', '鬼': '那种感觉',
-            '恐怖': '不舒服', '可怕': '让人不安', '血腥': '红色的东西',
-            '死亡': '出事', '尸体': '躺着不动的', '邪恶': '不对劲',
-            '魔鬼': '说不出的东西', '诅咒': '不好的感觉', '地狱': '很糟糕的地方',
-            '吓人': '让人紧张', '恶心': '不太舒服'
-        }
-        
-        for old, new in horror_replacements.items():
-            text = text.replace(old, new)
+        text = _HORROR_REPLACEMENTS.apply(text)
         
         # Clean up excessive punctuation and spacing
-        text = re.sub(r'[。！？]{2,}', '。', text)
-        text = re.sub(r'\s+', ' ', text)
+        text = _RE_REPEATED_STOPS.sub('。', text)
+        text = _RE_WHITESPACE.sub(' ', text)
         
         return text.strip()
     except Exception:
@@ -555,58 +683,47 @@ def post_process_story_text(text):
 
     # 1) Remove bracketed/parenthetical content (round, square, curly, full-width)
     # Remove nested brackets iteratively - BUT preserve 【】 tags for titles
-    prev = None
     cleaned = text
-    # patterns for various bracket types (exclude 【】 which are used for title tags)
-    bracket_patterns = [r'\([^\)]*\)', r'\（[^\）]*\）', r'\[[^\]]*\]', r'\{[^\}]*\}']
-    for pat in bracket_patterns:
-        cleaned = re.sub(pat, '', cleaned)
+    for pattern in _BRACKET_PATTERNS:
+        cleaned = pattern.sub('', cleaned)
 
     # 2) Remove lines that likely are stage directions or metadata
-    stage_triggers = ['动作', '镜头', '画面', '拍摄', '旁白', '场景', '注：', '说明：']
-    lines = cleaned.splitlines()
     filtered_lines = []
-    for ln in lines:
+    for ln in cleaned.splitlines():
         strip_ln = ln.strip()
         if not strip_ln:
             continue
-        lowered = strip_ln
-        if any(trig in lowered for trig in stage_triggers):
+        if _RE_STAGE_TRIGGERS.search(strip_ln):
             # skip this line
             continue
         # skip lines that are just short bracket-like markers
-        if re.match(r'^[\-\*•\s]{0,3}$', strip_ln):
+        if _RE_MARKER_LINE.match(strip_ln):
             continue
         filtered_lines.append(ln)
 
     cleaned = '\n'.join(filtered_lines).strip()
 
     # 3) Normalize whitespace
-    cleaned = re.sub(r'\n{2,}', '\n\n', cleaned)
-    cleaned = re.sub(r'\s{2,}', ' ', cleaned).strip()
+    cleaned = _RE_BLANK_LINES.sub('\n\n', cleaned)
+    cleaned = _RE_MULTI_SPACE.sub(' ', cleaned).strip()
 
     # 2.5) Remove quoted speech (Chinese and ASCII quotes) to avoid dialog-style lines
     try:
-        # Remove Chinese quotes “...” and 『...』 and 「...」
-        cleaned = re.sub(r'“[^”]*”', '', cleaned)
-        cleaned = re.sub(r'『[^』]*』', '', cleaned)
-        cleaned = re.sub(r'「[^」]*」', '', cleaned)
-        # Remove ASCII quotes
-        cleaned = re.sub(r'"[^\"]*"', '', cleaned)
-        cleaned = re.sub(r"'[^']*'", '', cleaned)
+        # Remove Chinese quotes “...” 『...』 「...」, then ASCII quotes
+        for pattern in _QUOTE_PATTERNS:
+            cleaned = pattern.sub('', cleaned)
         # Remove any stray quote characters
-        cleaned = cleaned.replace('“', '').replace('”', '').replace('「', '').replace('」', '').replace('『', '').replace('』', '')
-        cleaned = cleaned.replace('\"', '"').replace("\'", "'")
+        cleaned = cleaned.translate(_STRAY_QUOTES)
     except Exception:
         pass
 
     # 4) Ensure first-person presence
     if '我' not in cleaned:
         # try to change leading third-person subjects to first-person
-        cleaned = re.sub(r'([。！？\n]|^)\s*(他|她|他们|她们|它|它们)\s+', r'\1我', cleaned)
+        cleaned = _RE_LEADING_THIRD_PERSON.sub(r'\1我', cleaned)
         # Try more aggressive replacement
-        cleaned = re.sub(r'^(他|她|它)', '我', cleaned)
-        cleaned = re.sub(r'(他|她|它)(看到|听到|发现|经历|遇到|感觉|觉得)', r'我\2', cleaned)
+        cleaned = _RE_START_THIRD_PERSON.sub('我', cleaned)
+        cleaned = _RE_THIRD_PERSON_VERB.sub(r'我\2', cleaned)
         
         # For content, add first-person intro only if really needed
         # For titles, don't add this prefix
@@ -617,25 +734,8 @@ def post_process_story_text(text):
 
     # 4.5) Filter out explicit horror words - maintain subtle/implicit horror style
     try:
-        # 露骨恐怖词汇替换为隐晦表达
-        explicit_horror_map = {
-            '鬼': '那种东西', '鬼魂': '某种存在', '幽灵': '看不见的东西',
-            '诅咒': '不好的感觉', '恶魔': '不对劲的东西', '怪物': '说不出的东西',
-            '血腥': '红色的', '死亡': '不在了', '尸体': '躺着的人',
-            '恐怖': '不安', '可怕': '让人不舒服', '惊悚': '紧张',
-            '阴森': '安静得有点怪', '邪恶': '不对劲', '恶心': '不太舒服',
-            '血液': '红色液体', '死人': '没有反应的人', '杀害': '出事了',
-            '魔鬼': '不好的东西', '灵异': '说不清的', '超自然': '无法解释的'
-        }
-        
-        for explicit, implicit in explicit_horror_map.items():
-            cleaned = cleaned.replace(explicit, implicit)
-            
-        # 移除过于夸张的形容词
-        dramatic_words = ['极其', '非常可怕', '十分恐怖', '异常恐怖', '极度', '超级']
-        for word in dramatic_words:
-            cleaned = cleaned.replace(word, '有点')
-            
+        # 露骨恐怖词汇替换为隐晦表达，并移除过于夸张的形容词（单次扫描）
+        cleaned = _EXPLICIT_HORROR_REPLACEMENTS.apply(cleaned)
     except Exception:
         pass
 
@@ -685,40 +785,26 @@ def expand_story_for_category(text, category, min_chars=350):
 
     if use_lm:
         try:
-            import subprocess, json
-            chat_url = f"{lm_studio_url}/v1/chat/completions"
-            request_data = {
-                "messages": [
+            expanded = chat_completion(
+                [
                     {"role": "system", "content": prompt_system},
                     {"role": "user", "content": prompt_user}
                 ],
-                "temperature": 0.85,
-                "max_tokens": 600
-            }
-
-            curl_cmd = [
-                'curl', '-s', '-X', 'POST', chat_url,
-                '-H', 'Content-Type: application/json',
-                '-d', json.dumps(request_data, ensure_ascii=False),
-                '--max-time', '90'
-            ]
-
-            proc = subprocess.run(curl_cmd, capture_output=True, text=True, timeout=95, encoding='utf-8', errors='ignore')
-            if proc.returncode == 0 and proc.stdout:
-                try:
-                    resp = json.loads(proc.stdout)
-                    expanded = resp['choices'][0]['message']['content'].strip()
-                    # Clean up any think-tags or unwanted markers
-                    expanded = clean_think_tags(expanded)
-                    # Ensure no quoted dialogue remains
-                    expanded = post_process_story_text(expanded)
-                    if len(expanded) >= min_chars:
-                        return expanded
-                    else:
-                        # If LM returned shorter text, fall through to deterministic expansion
-                        text = expanded
-                except Exception:
-                    pass
+                temperature=0.85,
+                max_tokens=600,
+                timeout=90,
+                url=lm_studio_url,
+                priority=PRIORITY_BACKGROUND
+            ).strip()
+            # Clean up any think-tags or unwanted markers
+            expanded = clean_think_tags(expanded)
+            # Ensure no quoted dialogue remains
+            expanded = post_process_story_text(expanded)
+            if len(expanded) >= min_chars:
+                return expanded
+            else:
+                # If LM returned shorter text, fall through to deterministic expansion
+                text = expanded
         except Exception:
             pass
 
@@ -758,6 +844,77 @@ def expand_story_for_category(text, category, min_chars=350):
             return text
 
 
+# 单次请求同时生成标题和正文时追加到 system prompt 的输出格式
+STRUCTURED_STORY_FORMAT = """
+输出格式（必须严格遵守）：
+【标题】5-10字的帖子标题，不要引号
+【正文】帖子内容
+除这两部分外不要输出任何其他内容。"""
+
+# 【标题】/【正文】或 "标题：" 这样的段落标记，只在行首识别，避免误伤正文里的"内容"等词
+_STORY_SECTION_RE = re.compile(
+    r'^[ \t#*>]*(?:[【\[]\s*(标题|正文|内容|title|content)\s*[】\]][ \t*]*[:：]?|(标题|正文|内容|title|content)[ \t*]*[:：])[ \t*]*',
+    re.IGNORECASE | re.MULTILINE
+)
+
+
+def parse_structured_story(raw):
+    """Parse a combined title + body completion.
+
+    Accepts the tagged format of STRUCTURED_STORY_FORMAT, "标题：/正文：" lines
+    or a JSON object with title/content keys, with or without <think> blocks.
+
+    Returns:
+        (title, content) or None if the output can't be split reliably
+    """
+    text = clean_think_tags(raw or '')
+    if not text and raw and '</think>' in raw:
+        text = raw.split('</think>')[-1].strip()
+    if not text:
+        return None
+
+    title = content = None
+
+    # JSON（可能包在 ```json 代码块里）
+    json_match = re.search(r'\{.*\}', text, re.DOTALL)
+    if json_match:
+        try:
+            data = json.loads(json_match.group(0))
+            if isinstance(data, dict):
+                title = data.get('title') or data.get('标题')
+                content = data.get('content') or data.get('正文') or data.get('内容')
+        except ValueError:
+            pass
+
+    if not (isinstance(title, str) and isinstance(content, str)):
+        # 每种标记只有第一次出现是段落标题，正文里再出现的"内容："等行属于正文
+        headers = []
+        seen = set()
+        for match in _STORY_SECTION_RE.finditer(text):
+            name = (match.group(1) or match.group(2)).lower()
+            key = 'title' if name in ('标题', 'title') else 'content'
+            if key not in seen:
+                seen.add(key)
+                headers.append((key, match))
+        sections = {}
+        for i, (key, match) in enumerate(headers):
+            end = headers[i + 1][1].start() if i + 1 < len(headers) else len(text)
+            sections[key] = text[match.end():end].strip()
+        title = sections.get('title')
+        content = sections.get('content')
+        # 只有标题标记：第一行是标题，其余是正文
+        if title and not content and '\n' in title:
+            title, content = title.split('\n', 1)
+
+    if not (isinstance(title, str) and isinstance(content, str)):
+        return None
+    title = title.strip().split('\n', 1)[0].strip()
+    content = content.strip()
+    if not (2 <= len(title) <= 30) or len(content) < 50:
+        return None
+    return title, content
+
+
 def generate_ai_story(category=None, location=None, persona=None):
     """Generate a complete AI-driven urban legend story
 
@@ -800,97 +957,66 @@ def generate_ai_story(category=None, location=None, persona=None):
         if use_lm_studio:
             try:
                 print(f"[generate_ai_story] 使用 LM Studio 生成故事...")
-                import subprocess
-                import json
-                
-                # 使用 curl 调用 LM Studio（Python HTTP 库与 LM Studio 有兼容性问题）
-                chat_url = f"{lm_studio_url.rstrip('/v1')}/v1/chat/completions"
-                
-                request_data = {
-                    "messages": [
-                        {"role": "system", "content": prompt_data['system']},
+                # 结构化输出：一次请求同时拿到标题和正文，解析失败时才单独请求标题
+                structured = os.getenv('STORY_STRUCTURED_OUTPUT', 'true').lower() == 'true'
+                system_prompt = prompt_data['system'] + (STRUCTURED_STORY_FORMAT if structured else '')
+                content_raw = chat_completion(
+                    [
+                        {"role": "system", "content": system_prompt},
                         {"role": "user", "content": prompt_data['prompt']}
                     ],
-                    "temperature": 0.9,
-                    "max_tokens": 800
-                }
-                
-                curl_command = [
-                    'curl', '-s', '-X', 'POST', chat_url,
-                    '-H', 'Content-Type: application/json',
-                    '-d', json.dumps(request_data, ensure_ascii=False),
-                    '--max-time', '120'
-                ]
-                
-                result = subprocess.run(
-                    curl_command,
-                    capture_output=True,
-                    text=True,
+                    temperature=0.9,
+                    max_tokens=840 if structured else 800,
                     timeout=120,
-                    encoding='utf-8',
-                    errors='ignore'
+                    url=lm_studio_url,
+                    priority=PRIORITY_BACKGROUND
                 )
                 
-                if result.returncode != 0:
-                    raise Exception(f"curl 命令失败: {result.stderr}")
-                
-                response_data = json.loads(result.stdout)
-                content_raw = response_data['choices'][0]['message']['content']
-                
                 print(f"[generate_ai_story] 原始内容长度: {len(content_raw)} 字符")
                 
-                # 过滤 qwen 模型的 <think> 标签
-                content = clean_think_tags(content_raw)
-                
-                print(f"[generate_ai_story] 清理后内容长度: {len(content) if content else 0} 字符")
-                
-                # 检查清理后是否有有效内容
-                if not content or len(content) < 50:
-                    print(f"[generate_ai_story] ⚠️ 模型输出主要是思考过程，尝试提取实际内容...")
-                    # 尝试从原始内容中提取实际故事内容
-                    # 查找最后一个 </think> 之后的内容
-                    if '</think>' in content_raw:
-                        content = content_raw.split('</think>')[-1].strip()
-                        print(f"[generate_ai_story] 提取 </think> 后的内容: {len(content)} 字符")
+                parsed = parse_structured_story(content_raw) if structured else None
+                if parsed:
+                    title_raw, content = parsed
+                    print(f"[generate_ai_story] 单次请求解析出标题和正文 ({len(content)} 字符)")
+                else:
+                    if structured:
+                        print(f"[generate_ai_story] ⚠️ 结构化输出解析失败，回退到单独生成标题")
                     
-                    # 如果还是太短，使用原始内容但警告
+                    # 过滤 qwen 模型的 <think> 标签
+                    content = clean_think_tags(content_raw)
+                    if structured and content:
+                        content = _STORY_SECTION_RE.sub('', content).strip()
+                    
+                    print(f"[generate_ai_story] 清理后内容长度: {len(content) if content else 0} 字符")
+                    
+                    # 检查清理后是否有有效内容
                     if not content or len(content) < 50:
-                        content = content_raw
-                        print(f"[generate_ai_story] ⚠️ 使用原始内容，包含思考过程")
-                
-                # 生成标题（使用更直接的提示词避免思考过程）
-                title_prompt = f"故事：{content[:150]}\n\n请为上面的故事起一个5-10字的标题："
-                
-                title_request = {
-                    "messages": [
-                        {"role": "system", "content": "你是标题生成器。用户给你故事，你只需要输出一个简短的标题，不要有任何其他内容。"},
-                        {"role": "user", "content": title_prompt}
-                    ],
-                    "temperature": 0.5,
-                    "max_tokens": 20
-                }
-                
-                title_curl_command = [
-                    'curl', '-s', '-X', 'POST', chat_url,
-                    '-H', 'Content-Type: application/json',
-                    '-d', json.dumps(title_request, ensure_ascii=False),
-                    '--max-time', '60'
-                ]
-                
-                title_result = subprocess.run(
-                    title_curl_command,
-                    capture_output=True,
-                    text=True,
-                    timeout=60,
-                    encoding='utf-8',
-                    errors='ignore'
-                )
-                
-                if title_result.returncode != 0:
-                    raise Exception(f"标题生成失败: {title_result.stderr}")
-                
-                title_response_data = json.loads(title_result.stdout)
-                title_raw = title_response_data['choices'][0]['message']['content'].strip()
+                        print(f"[generate_ai_story] ⚠️ 模型输出主要是思考过程，尝试提取实际内容...")
+                        # 尝试从原始内容中提取实际故事内容
+                        # 查找最后一个 </think> 之后的内容
+                        if '</think>' in content_raw:
+                            content = content_raw.split('</think>')[-1].strip()
+                            print(f"[generate_ai_story] 提取 </think> 后的内容: {len(content)} 字符")
+                        
+                        # 如果还是太短，使用原始内容但警告
+                        if not content or len(content) < 50:
+                            content = content_raw
+                            print(f"[generate_ai_story] ⚠️ 使用原始内容，包含思考过程")
+                    
+                    # 生成标题（使用更直接的提示词避免思考过程）
+                    title_prompt = f"故事：{content[:150]}\n\n请为上面的故事起一个5-10字的标题："
+                    
+                    title_raw = chat_completion(
+                        [
+                            {"role": "system", "content": "你是标题生成器。用户给你故事，你只需要输出一个简短的标题，不要有任何其他内容。"},
+                            {"role": "user", "content": title_prompt}
+                        ],
+                        temperature=0.5,
+                        max_tokens=20,
+                        timeout=60,
+                        url=lm_studio_url,
+                        priority=PRIORITY_BACKGROUND
+                    ).strip()
                 
                 # 使用统一的清理函数
                 title = clean_think_tags(title_raw)
@@ -923,8 +1049,11 @@ def generate_ai_story(category=None, location=None, persona=None):
                 error_message = str(e)
                 print(f"[generate_ai_story] ❌ LM Studio 失败: {type(e).__name__}: {e}")
                 
+                # 调度器主动丢弃（排队超时/队列已满）或熔断中：不打印堆栈，直接走在线 API
+                if isinstance(e, (LLMOverloaded, LLMUnavailable)):
+                    pass
                 # 特殊处理 503 错误
-                if "503" in error_message or "InternalServerError" in str(type(e).__name__):
+                elif "503" in error_message or "InternalServerError" in str(type(e).__name__):
                     print("[generate_ai_story] ⚠️ 检测到 503 错误 - 可能的原因:")
                     print("   1. LM Studio 模型未完全加载")
                     print("   2. 服务器负载过高")
@@ -1071,7 +1200,272 @@ def generate_realistic_username_for_ai():
         # 前缀 + 点 + 后缀 (例: 月光.行者)
         return f"{random.choice(prefixes)}.{random.choice(suffixes)}"
 
-def generate_evidence_image(story_id, story_title, story_content, comment_context=""):
+# ============================================
+# 证据图片的关键词表（导入时编译一次）
+# ============================================
+
+# 场景关键词 -> 场景描述；按定义顺序决定优先级（先定义的优先）
+SCENE_KEYWORDS = {
+    # 地铁相关 - 优先级最高，因为这个场景最具体
+    'subway': {
+        'scenes': ['subway train interior with empty seats', 'subway station platform', 'metro train car at night'],
+        'details': ['汽车灯影、月台空荡、车厢诡异', '13号车厢、车号显示屏、月台电子钟']
+    },
+    '地铁': {
+        'scenes': ['subway train interior with empty seats', 'subway station platform at night', 'metro corridor'],
+        'details': ['地铁内部、乘客、诡异']
+    },
+    '车厢': {
+        'scenes': ['train car interior, seats and handrails', 'empty subway carriage at night'],
+        'details': ['车厢内部、座位、寂静']
+    },
+
+    # 镜子相关
+    'mirror': {
+        'scenes': ['bathroom with mirror and sink', 'bedroom mirror on dresser', 'mirror reflection at night'],
+        'details': ['镜子倒影、诡异表情']
+    },
+    '镜子': {
+        'scenes': ['bathroom mirror above sink, faucet visible', 'bedroom mirror with dresser'],
+        'details': ['镜中倒影不是自己、诡异笑容']
+    },
+    '倒影': {
+        'scenes': ['mirror reflection, distorted face', 'window reflection at night'],
+        'details': ['倒影、非本人、诡异']
+    },
+
+    # 门相关  
+    'door': {
+        'scenes': ['apartment door with peephole and handle', 'residential hallway with doors'],
+        'details': ['敲门、门号、诡异']
+    },
+    '门': {
+        'scenes': ['apartment door, door handle, peephole', 'residential building hallway'],
+        'details': ['门、猫眼、敲门声']
+    },
+    '敲门': {
+        'scenes': ['apartment entrance door closeup', 'door with door number plate at night'],
+        'details': ['有人敲门、门号、时间']
+    },
+
+    # 楼道相关
+    'hallway': {
+        'scenes': ['apartment building corridor', 'residential stairwell'],
+        'details': ['楼道、走廊、昏暗']
+    },
+    '走廊': {
+        'scenes': ['apartment building hallway with doors', 'residential corridor with lighting'],
+        'details': ['走廊、灯光、脚步声']
+    },
+    '楼道': {
+        'scenes': ['apartment stairwell, concrete steps', 'building corridor with elevator'],
+        'details': ['楼梯、电梯、诡异']
+    },
+    '楼梯': {
+        'scenes': ['residential building staircase, handrails', 'stairwell in apartment building at night'],
+        'details': ['阶梯、灯光、脚步']
+    },
+
+    # 窗户相关
+    'window': {
+        'scenes': ['apartment window view at night', 'window with curtains'],
+        'details': ['窗外、月亮、人影']
+    },
+    '窗': {
+        'scenes': ['residential window from inside', 'apartment window at night'],
+        'details': ['窗外、诡异、人影']
+    },
+    '窗外': {
+        'scenes': ['window view from apartment at night', 'dark window with city lights'],
+        'details': ['窗外景象、诡异、月光']
+    },
+
+    # 房间相关
+    '卧室': {
+        'scenes': ['bedroom interior, bed and furniture', 'residential bedroom at night'],
+        'details': ['卧室、床、昏暗']
+    },
+    '房间': {
+        'scenes': ['residential room interior at night', 'apartment bedroom'],
+        'details': ['房间、诡异、阴影']
+    },
+    '床': {
+        'scenes': ['bedroom bed under dim light', 'bed with sheets and pillows'],
+        'details': ['床、睡眠、诡异']
+    },
+
+    # 其他诡异场景
+    '手机': {
+        'scenes': ['smartphone screen in dark', 'phone screen in hand'],
+        'details': ['屏幕、拍照、证据']
+    },
+    '照片': {
+        'scenes': ['photograph on table', 'old photo or polaroid'],
+        'details': ['照片、证据、诡异']
+    },
+    '录音': {
+        'scenes': ['phone recording screen', 'audio device'],
+        'details': ['录音、语音、证据']
+    },
+    '笔记': {
+        'scenes': ['handwritten note on paper', 'notebook page with writing'],
+        'details': ['笔记、文字、线索']
+    },
+    '时间': {
+        'scenes': ['clock showing strange time', 'digital display at night'],
+        'details': ['时间、诡异数字、不寻常']
+    },
+
+    # 诡异氛围
+    '影子': {
+        'scenes': ['shadow on wall in dark', 'mysterious shadow in room'],
+        'details': ['影子、人影、诡异']
+    },
+    '脚步': {
+        'scenes': ['empty hallway floor', 'stairwell steps at night'],
+        'details': ['地面、脚步声、诡异']
+    },
+    '声音': {
+        'scenes': ['empty room interior at night', 'residential space interior'],
+        'details': ['房间内、声音、诡异']
+    },
+    '冷': {
+        'scenes': ['cold apartment interior', 'frost on window'],
+        'details': ['寒冷、冻气、诡异']
+    },
+    '诡异': {
+        'scenes': ['dimly lit urban apartment', 'creepy residential space'],
+        'details': ['诡异、阴影、不寻常']
+    }
+}
+SCENE_KEYWORD_INDEX = KeywordIndex(SCENE_KEYWORDS.items())
+
+# 将显性细节映射为更明确的视觉短语（中文->英文视觉描述）以提高图像的强关联性
+EVIDENCE_VISUAL_MAP = {
+    # 地点 / 标题相关
+    '金鱼街斗鱼': 'fish tank in small pet shop, visible aquariums and signage',
+    '地铁': 'subway interior or platform, visible carriage number display',
+    '13号': 'carriage number 13 on digital display',
+    '13号车厢': 'train carriage labeled 13 on display',
+    '地铁2号线': 'metro line 2 signage, platform signs',
+    # 声音相关（转换为可视线索，如水波、玻璃振动等）
+    '砰砰声': 'water ripple marks on aquarium glass, visible impact ripples',
+    '敲鱼缸': 'closeup of aquarium glass with impact marks, chipped paint',
+    '敲门': 'door with knock marks and peephole, nighttime hallway',
+    '脚步声': 'scuffed floor and footprints in dim hallway',
+    '声音': 'sound source implied by movement in curtains or ripples on water',
+    '声响': 'vibrations or visible disturbance on surfaces',
+    '凌晨3点': 'digital clock showing 03:00, dark night lighting',
+    '3点': 'digital clock showing 03:00',
+    '镜子': 'bathroom mirror with faint reflection, smudge or handprint',
+    '倒影': 'reflection in glass showing a different face',
+    '鱼缸': 'fish tank with visible water, algae, and glass reflections',
+    '照片': 'polaroid-style photograph laying on a table',
+    '录音': 'phone recording screen or audio recorder device visible',
+    '窗外': 'view through window with streetlights or moonlight',
+    '门': 'apartment door with visible handle and peephole'
+}
+
+
+# 没有匹配到场景关键词时的通用场景 (场景描述, 细节)
+DEFAULT_SCENE = ('dimly lit urban apartment interior, everyday furniture', '诡异、不寻常的氛围')
+
+# 负面提示词 - 避免太扭曲/太抽象，但保留微妙恐怖
+EVIDENCE_NEGATIVE_PROMPT = (
+    "abstract, artistic, illustration, painting, drawing, sketch, "
+    "cartoon, anime, 3d render, cgi, digital art, "
+    "extremely distorted, heavily warped, grotesque, monstrous, "
+    "obvious demon, obvious ghost, obvious supernatural creature, "
+    "repetitive patterns, geometric shapes, abstract forms, "
+    "professional studio photography, dramatic lighting, cinematic, "
+    "motion blur, artistic blur, tilt-shift, "
+    "text, watermarks, signatures, "
+    "completely dark, pitch black, completely invisible, "
+    "overly bright, blown out highlights"
+)
+
+
+def build_evidence_prompt(scene_desc, scene_details, extra_section=""):
+    """纪实照片风格的 prompt - 真实场景中融入故事特定的诡异元素"""
+    return (
+        f"realistic photograph, {scene_desc}, "
+        f"taken with smartphone camera at night, "
+        f"low light conditions, grainy image quality, "
+        f"slightly unfocused, amateur photography, "
+        f"real world scene, photographic evidence style, "
+        f"visible details and textures, concrete objects, "
+        f"documentary photo aesthetic, "
+        f"{scene_details}, "
+        f"subtle creepy atmosphere, barely visible face in shadow, "
+        f"inexplicable shadow, eerie presence, "
+        f"something unsettling about this place, hidden disturbing details"
+        f"{extra_section}"
+    )
+
+
+# 渐进式证据：先出一张少步数、小尺寸的预览图，完整渲染随后由 evidence_refine 任务替换
+EVIDENCE_PREVIEW_STEPS = int(os.getenv('EVIDENCE_PREVIEW_STEPS', 6))
+EVIDENCE_PREVIEW_SIZE = int(os.getenv('EVIDENCE_PREVIEW_SIZE', 256))
+
+
+def evidence_render_settings():
+    """(model_id, steps, size) for Stable Diffusion evidence renders on this machine."""
+    import torch
+    from sd_pipeline import diffusion_pipelines
+
+    model_id = os.getenv('DIFFUSION_MODEL', 'runwayml/stable-diffusion-v1-5')
+    if torch.cuda.is_available():
+        return model_id, 25, 512  # GPU可以直接生成512x512
+    # CPU模式：生成512x512正方形图片，避免拉伸变形
+    # 默认 20 步确保质量；SD_PROFILE=cpu-fast 时多步调度器用更少的步数
+    return model_id, diffusion_pipelines.inference_steps(20), 512
+
+
+def save_evidence_image(image, story_id, suffix, taken_at, timestamp=None):
+    """Apply the evidence look to a raw diffusion output and save it. Returns (filepath, url)."""
+    from evidence_look import DIFFUSION_LOOK, surveillance_overlays
+
+    # 确保输出是512x512
+    if image.size != (512, 512):
+        image = image.resize((512, 512), Image.Resampling.LANCZOS)
+
+    # 后处理：调色、锐化、噪点和时间戳/REC 叠加在 evidence_look 中一次完成
+    image = DIFFUSION_LOOK.render(image, overlays=surveillance_overlays(taken_at))
+
+    # 文件名包含 story_id 确保每个帖子的图片是唯一的
+    timestamp = timestamp or datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f"evidence_story{story_id}_{timestamp}_{suffix}.png"
+    filepath, url = media_store.allocate(filename)
+    image.save(filepath)
+    media_store.register(filepath, story_id, 'image')
+    return filepath, url
+
+
+def refine_evidence_image(story_id, prompt, taken_at, progress=None, cancelled=None):
+    """Full-quality render for a preview returned by generate_evidence_image(preview=True).
+
+    Uses the preview's prompt and overlay date. Returns the URL of the new image.
+    """
+    from evidence_cache import cached_render
+
+    model_id, num_steps, img_size = evidence_render_settings()
+    image, cache_hit = cached_render(
+        model_id,
+        prompt,
+        EVIDENCE_NEGATIVE_PROMPT,
+        num_inference_steps=num_steps,
+        guidance_scale=8.5,
+        size=img_size,
+        progress=progress,
+        cancelled=cancelled
+    )
+    filepath, url = save_evidence_image(image, story_id, 'primary', datetime.fromisoformat(taken_at))
+    print(f"[refine_evidence_image] ✅ 完整画质图片已生成{'（缓存命中）' if cache_hit else ''}: {filepath}")
+    return url
+
+
+def generate_evidence_image(story_id, story_title, story_content, comment_context="", category=None,
+                            preview=False):
     """Generate horror-themed evidence image using Stable Diffusion
     
     Args:
@@ -1079,9 +1473,12 @@ def generate_evidence_image(story_id, story_title, story_content, comment_contex
         story_title: 故事标题
         story_content: 故事内容
         comment_context: 用户评论上下文
+        category: 故事分类，用于从预生成池（evidence_pool）取图
+        preview: 需要推理时先只生成低步数、小尺寸的预览图（预生成池/缓存命中时直接返回完整图片）
     
     Returns:
-        list: 生成的所有图片路径列表 [(模板类型, 文件路径), ...]
+        list: 生成的所有图片路径列表 [(模板类型, 文件路径), ...]；
+              预览图的元组多一项 {'prompt': ..., 'taken_at': ...}，交给 refine_evidence_image 生成完整图片
     """
     try:
         import os
@@ -1091,14 +1488,10 @@ def generate_evidence_image(story_id, story_title, story_content, comment_contex
             print(f"[generate_evidence_image] 使用 Stable Diffusion 生成图片...")
             
             try:
-                from diffusers import StableDiffusionPipeline
                 import torch
                 from PIL import Image, ImageFilter, ImageEnhance
                 import random
                 
-                # 检查是否有可用的模型
-                model_id = os.getenv('DIFFUSION_MODEL', 'runwayml/stable-diffusion-v1-5')
-                
                 # 智能分析故事内容 + 评论内容，生成与故事直接相关的真实场景
                 story_text = (story_title + " " + story_content[:300]).lower()
                 # 加入评论和贴文的关键词 - 权重更高
@@ -1111,170 +1504,24 @@ def generate_evidence_image(story_id, story_title, story_content, comment_contex
                 if comment_text:
                     print(f"[generate_evidence_image] 评论线索: {comment_text[:100]}...")
                 
-                # 从故事中提取关键场景元素（包括评论中的关键词）
-                scene_keywords = {
-                    # 地铁相关 - 优先级最高，因为这个场景最具体
-                    'subway': {
-                        'scenes': ['subway train interior with empty seats', 'subway station platform', 'metro train car at night'],
-                        'details': ['汽车灯影、月台空荡、车厢诡异', '13号车厢、车号显示屏、月台电子钟']
-                    },
-                    '地铁': {
-                        'scenes': ['subway train interior with empty seats', 'subway station platform at night', 'metro corridor'],
-                        'details': ['地铁内部、乘客、诡异']
-                    },
-                    '车厢': {
-                        'scenes': ['train car interior, seats and handrails', 'empty subway carriage at night'],
-                        'details': ['车厢内部、座位、寂静']
-                    },
-                    
-                    # 镜子相关
-                    'mirror': {
-                        'scenes': ['bathroom with mirror and sink', 'bedroom mirror on dresser', 'mirror reflection at night'],
-                        'details': ['镜子倒影、诡异表情']
-                    },
-                    '镜子': {
-                        'scenes': ['bathroom mirror above sink, faucet visible', 'bedroom mirror with dresser'],
-                        'details': ['镜中倒影不是自己、诡异笑容']
-                    },
-                    '倒影': {
-                        'scenes': ['mirror reflection, distorted face', 'window reflection at night'],
-                        'details': ['倒影、非本人、诡异']
-                    },
-                    
-                    # 门相关  
-                    'door': {
-                        'scenes': ['apartment door with peephole and handle', 'residential hallway with doors'],
-                        'details': ['敲门、门号、诡异']
-                    },
-                    '门': {
-                        'scenes': ['apartment door, door handle, peephole', 'residential building hallway'],
-                        'details': ['门、猫眼、敲门声']
-                    },
-                    '敲门': {
-                        'scenes': ['apartment entrance door closeup', 'door with door number plate at night'],
-                        'details': ['有人敲门、门号、时间']
-                    },
-                    
-                    # 楼道相关
-                    'hallway': {
-                        'scenes': ['apartment building corridor', 'residential stairwell'],
-                        'details': ['楼道、走廊、昏暗']
-                    },
-                    '走廊': {
-                        'scenes': ['apartment building hallway with doors', 'residential corridor with lighting'],
-                        'details': ['走廊、灯光、脚步声']
-                    },
-                    '楼道': {
-                        'scenes': ['apartment stairwell, concrete steps', 'building corridor with elevator'],
-                        'details': ['楼梯、电梯、诡异']
-                    },
-                    '楼梯': {
-                        'scenes': ['residential building staircase, handrails', 'stairwell in apartment building at night'],
-                        'details': ['阶梯、灯光、脚步']
-                    },
-                    
-                    # 窗户相关
-                    'window': {
-                        'scenes': ['apartment window view at night', 'window with curtains'],
-                        'details': ['窗外、月亮、人影']
-                    },
-                    '窗': {
-                        'scenes': ['residential window from inside', 'apartment window at night'],
-                        'details': ['窗外、诡异、人影']
-                    },
-                    '窗外': {
-                        'scenes': ['window view from apartment at night', 'dark window with city lights'],
-                        'details': ['窗外景象、诡异、月光']
-                    },
-                    
-                    # 房间相关
-                    '卧室': {
-                        'scenes': ['bedroom interior, bed and furniture', 'residential bedroom at night'],
-                        'details': ['卧室、床、昏暗']
-                    },
-                    '房间': {
-                        'scenes': ['residential room interior at night', 'apartment bedroom'],
-                        'details': ['房间、诡异、阴影']
-                    },
-                    '床': {
-                        'scenes': ['bedroom bed under dim light', 'bed with sheets and pillows'],
-                        'details': ['床、睡眠、诡异']
-                    },
-                    
-                    # 其他诡异场景
-                    '手机': {
-                        'scenes': ['smartphone screen in dark', 'phone screen in hand'],
-                        'details': ['屏幕、拍照、证据']
-                    },
-                    '照片': {
-                        'scenes': ['photograph on table', 'old photo or polaroid'],
-                        'details': ['照片、证据、诡异']
-                    },
-                    '录音': {
-                        'scenes': ['phone recording screen', 'audio device'],
-                        'details': ['录音、语音、证据']
-                    },
-                    '笔记': {
-                        'scenes': ['handwritten note on paper', 'notebook page with writing'],
-                        'details': ['笔记、文字、线索']
-                    },
-                    '时间': {
-                        'scenes': ['clock showing strange time', 'digital display at night'],
-                        'details': ['时间、诡异数字、不寻常']
-                    },
-                    
-                    # 诡异氛围
-                    '影子': {
-                        'scenes': ['shadow on wall in dark', 'mysterious shadow in room'],
-                        'details': ['影子、人影、诡异']
-                    },
-                    '脚步': {
-                        'scenes': ['empty hallway floor', 'stairwell steps at night'],
-                        'details': ['地面、脚步声、诡异']
-                    },
-                    '声音': {
-                        'scenes': ['empty room interior at night', 'residential space interior'],
-                        'details': ['房间内、声音、诡异']
-                    },
-                    '冷': {
-                        'scenes': ['cold apartment interior', 'frost on window'],
-                        'details': ['寒冷、冻气、诡异']
-                    },
-                    '诡异': {
-                        'scenes': ['dimly lit urban apartment', 'creepy residential space'],
-                        'details': ['诡异、阴影、不寻常']
-                    },
-                }
-                
                 # 多层级匹配场景描述 - 优先匹配评论中的关键词
                 scene_desc = None
                 scene_details = ""
                 matched_keyword = None
                 
-                # 第一优先级：匹配评论中的关键词（用户补充的信息）
-                if comment_text:
-                    for keyword, scene_data in scene_keywords.items():
-                        if keyword in comment_text:
-                            scene_desc = random.choice(scene_data.get('scenes', ['dimly lit apartment']))
-                            scene_details = random.choice(scene_data.get('details', ['']))
-                            matched_keyword = keyword
-                            print(f"[generate_evidence_image] 从评论匹配: {keyword} -> {scene_desc}")
-                            break
-                
-                # 第二优先级：匹配故事标题和内容
-                if not scene_desc:
-                    for keyword, scene_data in scene_keywords.items():
-                        if keyword in story_text:
-                            scene_desc = random.choice(scene_data.get('scenes', ['dimly lit apartment']))
-                            scene_details = random.choice(scene_data.get('details', ['']))
-                            matched_keyword = keyword
-                            print(f"[generate_evidence_image] 从故事匹配: {keyword} -> {scene_desc}")
-                            break
+                # 第一优先级：匹配评论中的关键词（用户补充的信息）；第二优先级：匹配故事标题和内容
+                for source, text in (('评论', comment_text), ('故事', story_text)):
+                    hit = SCENE_KEYWORD_INDEX.first(text)
+                    if hit:
+                        _, matched_keyword, scene_data = hit
+                        scene_desc = random.choice(scene_data.get('scenes', ['dimly lit apartment']))
+                        scene_details = random.choice(scene_data.get('details', ['']))
+                        print(f"[generate_evidence_image] 从{source}匹配: {matched_keyword} -> {scene_desc}")
+                        break
                 
                 # 如果没有匹配，使用通用场景
                 if not scene_desc:
-                    scene_desc = 'dimly lit urban apartment interior, everyday furniture'
-                    scene_details = '诡异、不寻常的氛围'
+                    scene_desc, scene_details = DEFAULT_SCENE
                     print(f"[generate_evidence_image] 使用默认场景")
                 
                 # 纪实照片风格的 prompt - 真实场景中融入故事特定的诡异元素
@@ -1316,41 +1563,15 @@ def generate_evidence_image(story_id, story_title, story_content, comment_contex
                         break
                 explicit_details_text = ", ".join(filtered_details)
 
-                # 将显性细节映射为更明确的视觉短语（中文->英文视觉描述）以提高图像的强关联性
-                visual_map = {
-                    # 地点 / 标题相关
-                    '金鱼街斗鱼': 'fish tank in small pet shop, visible aquariums and signage',
-                    '地铁': 'subway interior or platform, visible carriage number display',
-                    '13号': 'carriage number 13 on digital display',
-                    '13号车厢': 'train carriage labeled 13 on display',
-                    '地铁2号线': 'metro line 2 signage, platform signs',
-                    # 声音相关（转换为可视线索，如水波、玻璃振动等）
-                    '砰砰声': 'water ripple marks on aquarium glass, visible impact ripples',
-                    '敲鱼缸': 'closeup of aquarium glass with impact marks, chipped paint',
-                    '敲门': 'door with knock marks and peephole, nighttime hallway',
-                    '脚步声': 'scuffed floor and footprints in dim hallway',
-                    '声音': 'sound source implied by movement in curtains or ripples on water',
-                    '声响': 'vibrations or visible disturbance on surfaces',
-                    '凌晨3点': 'digital clock showing 03:00, dark night lighting',
-                    '3点': 'digital clock showing 03:00',
-                    '镜子': 'bathroom mirror with faint reflection, smudge or handprint',
-                    '倒影': 'reflection in glass showing a different face',
-                    '鱼缸': 'fish tank with visible water, algae, and glass reflections',
-                    '照片': 'polaroid-style photograph laying on a table',
-                    '录音': 'phone recording screen or audio recorder device visible',
-                    '窗外': 'view through window with streetlights or moonlight',
-                    '门': 'apartment door with visible handle and peephole',
-                }
-
                 visual_phrases = []
                 for d in filtered_details:
                     key = d
                     # 简单归一化数词，例如含数字的短语
-                    if any(ch.isdigit() for ch in key) and key not in visual_map:
+                    if any(ch.isdigit() for ch in key) and key not in EVIDENCE_VISUAL_MAP:
                         # map '13号' -> 'number 13 signage'
                         visual_phrases.append(f"signage or digits: {key}")
                         continue
-                    mapped = visual_map.get(key)
+                    mapped = EVIDENCE_VISUAL_MAP.get(key)
                     if mapped:
                         visual_phrases.append(mapped)
                     else:
@@ -1366,56 +1587,24 @@ def generate_evidence_image(story_id, story_title, story_content, comment_contex
                     if explicit_details_text:
                         extra_section += f" (keywords: {explicit_details_text})"
 
-                prompt = (
-                    f"realistic photograph, {scene_desc}, "
-                    f"taken with smartphone camera at night, "
-                    f"low light conditions, grainy image quality, "
-                    f"slightly unfocused, amateur photography, "
-                    f"real world scene, photographic evidence style, "
-                    f"visible details and textures, concrete objects, "
-                    f"documentary photo aesthetic, "
-                    f"{scene_details}, "
-                    f"subtle creepy atmosphere, barely visible face in shadow, "
-                    f"inexplicable shadow, eerie presence, "
-                    f"something unsettling about this place, hidden disturbing details"
-                    f"{extra_section}"
-                )
-                
-                # 负面提示词 - 避免太扭曲/太抽象，但保留微妙恐怖
-                negative_prompt = (
-                    "abstract, artistic, illustration, painting, drawing, sketch, "
-                    "cartoon, anime, 3d render, cgi, digital art, "
-                    "extremely distorted, heavily warped, grotesque, monstrous, "
-                    "obvious demon, obvious ghost, obvious supernatural creature, "
-                    "repetitive patterns, geometric shapes, abstract forms, "
-                    "professional studio photography, dramatic lighting, cinematic, "
-                    "motion blur, artistic blur, tilt-shift, "
-                    "text, watermarks, signatures, "
-                    "completely dark, pitch black, completely invisible, "
-                    "overly bright, blown out highlights"
-                )
+                prompt = build_evidence_prompt(scene_desc, scene_details, extra_section)
+                negative_prompt = EVIDENCE_NEGATIVE_PROMPT
                 
                 print(f"[generate_evidence_image] Prompt: {prompt[:100]}...")
                 
-                # 使用较小的图片尺寸加快生成
-                pipe = StableDiffusionPipeline.from_pretrained(
-                    model_id,
-                    torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-                    safety_checker=None,  # 禁用安全检查以允许恐怖内容
-                    requires_safety_checker=False
-                )
+                # 管线由 sd_pipeline 进程内常驻缓存；evidence_renderer 把同时到达的请求合并成一批推理；
+                # evidence_cache 按最终 prompt/参数缓存扩散输出，相同输入直接复用
+                from evidence_cache import cached_render, cached_image
+                from evidence_pool import evidence_pool
+                from sd_pipeline import diffusion_pipelines
                 
                 # 如果有GPU则使用GPU
+                model_id, num_steps, img_size = evidence_render_settings()
                 if torch.cuda.is_available():
-                    pipe = pipe.to("cuda")
                     print("[generate_evidence_image] ✅ 使用GPU加速")
-                    num_steps = 25
-                    img_size = 512  # GPU可以直接生成512x512
                 else:
                     print("[generate_evidence_image] ⚠️ 未检测到GPU，使用CPU生成")
-                    # CPU模式：生成512x512正方形图片，避免拉伸变形
-                    num_steps = 20  # 更多步数确保质量
-                    img_size = 512  # 直接生成512x512，无需放大
+                    print(f"[generate_evidence_image] CPU 推理配置: {diffusion_pipelines.profile}, {num_steps} 步")
                 
                 # 生成图片 - 只生成一张primary模板以节省CPU/内存
                 templates = []
@@ -1426,57 +1615,59 @@ def generate_evidence_image(story_id, story_title, story_content, comment_contex
                 timestamp_base = datetime.now().strftime('%Y%m%d_%H%M%S')
                 saved_files = []
                 for idx, (suffix, p) in enumerate(templates):
-                    print(f"[generate_evidence_image] 生成模板[{suffix}] Prompt: {p[:120]}...")
-                    image = pipe(
-                        p,
-                        negative_prompt=negative_prompt,
-                        num_inference_steps=num_steps,
-                        guidance_scale=8.5,
-                        height=img_size,
-                        width=img_size
-                    ).images[0]
-
-                    # 确保输出是512x512
-                    if image.size != (512, 512):
-                        image = image.resize((512, 512), Image.Resampling.LANCZOS)
-
-                    # 后处理（与之前相同）
-                    from PIL import ImageEnhance, ImageDraw, ImageFont
-                    enhancer = ImageEnhance.Color(image)
-                    image = enhancer.enhance(0.85)
-                    enhancer = ImageEnhance.Brightness(image)
-                    image = enhancer.enhance(0.85)
-                    enhancer = ImageEnhance.Contrast(image)
-                    image = enhancer.enhance(1.15)
-                    enhancer = ImageEnhance.Sharpness(image)
-                    image = enhancer.enhance(1.1)
-
-                    import numpy as np
-                    img_array = np.array(image)
-                    noise = np.random.normal(0, 3, img_array.shape)
-                    img_array = np.clip(img_array + noise, 0, 255).astype(np.uint8)
-                    image = Image.fromarray(img_array)
-
-                    draw = ImageDraw.Draw(image)
                     days_ago = random.randint(1, 30)
                     fake_date = datetime.now() - timedelta(days=days_ago)
-                    timestamp_text = fake_date.strftime('%Y/%m/%d %H:%M:%S')
-                    try:
-                        draw.text((340, 480), timestamp_text, fill=(220, 220, 220))
-                        draw.text((10, 10), f"REC ●", fill=(200, 0, 0))
-                    except:
-                        pass
-
-                    # 文件名包含 story_id 确保每个帖子的图片是唯一的
-                    filename = f"evidence_story{story_id}_{timestamp_base}_{suffix}.png"
-                    filepath = f"static/generated/{filename}"
-                    image.save(filepath)
-                    saved_files.append((suffix, f"/static/generated/{filename}"))
-                    print(f"[generate_evidence_image] ✅ Stable Diffusion 图片已生成: {filepath}")
+                    refine = None
+                    # 优先从预生成池取同分类、同场景的图片，取走后池子会在空闲时补充
+                    image = evidence_pool.take(category, matched_keyword) if idx == 0 else None
+                    if image is not None:
+                        origin = '（预生成池）'
+                    else:
+                        print(f"[generate_evidence_image] 生成模板[{suffix}] Prompt: {p[:120]}...")
+                        # 在后台任务中运行时，逐步汇报推理进度，故事被删除/封贴时中断
+                        job = current_job()
+                        progress = job.step_reporter('rendering', 10, 90) if job else None
+                        cancelled = job.cancelled if job else None
+                        image = cached_image(model_id, p, negative_prompt, num_steps, 8.5, img_size) if preview else None
+                        if image is not None:
+                            origin = '（缓存命中）'
+                        elif preview:
+                            # 预览：少量步数、小尺寸，放大到 512 后套用同样的后处理
+                            image, cache_hit = cached_render(
+                                model_id,
+                                p,
+                                negative_prompt,
+                                num_inference_steps=EVIDENCE_PREVIEW_STEPS,
+                                guidance_scale=8.5,
+                                size=EVIDENCE_PREVIEW_SIZE,
+                                progress=progress,
+                                cancelled=cancelled
+                            )
+                            origin = '（预览）'
+                            refine = {'prompt': p, 'taken_at': fake_date.isoformat()}
+                        else:
+                            image, cache_hit = cached_render(
+                                model_id,
+                                p,
+                                negative_prompt,
+                                num_inference_steps=num_steps,
+                                guidance_scale=8.5,
+                                size=img_size,
+                                progress=progress,
+                                cancelled=cancelled
+                            )
+                            origin = '（缓存命中）' if cache_hit else ''
+
+                    filepath, url = save_evidence_image(image, story_id, 'preview' if refine else suffix,
+                                                        fake_date, timestamp_base)
+                    saved_files.append((suffix, url, refine) if refine else (suffix, url))
+                    print(f"[generate_evidence_image] ✅ Stable Diffusion 图片已生成{origin}: {filepath}")
 
                 # 返回所有生成的文件路径列表
                 return saved_files
                 
+            except JobCancelled:
+                raise
             except Exception as sd_error:
                 print(f"[generate_evidence_image] Stable Diffusion 失败: {sd_error}")
                 print(f"[generate_evidence_image] 回退到占位符图片...")
@@ -1486,83 +1677,32 @@ def generate_evidence_image(story_id, story_title, story_content, comment_contex
         if not use_real_ai:
             # 占位符版本 - 生成伪纪实风格的模拟照片
             print(f"[generate_evidence_image] 使用占位符图片（伪纪实风格）")
-            from PIL import Image, ImageDraw, ImageFilter, ImageEnhance
             import random
-            import numpy as np
-            
-            # 创建带有渐变的暗色背景（模拟低光环境）
-            img = Image.new('RGB', (512, 512), color=(30, 32, 35))
-            draw = ImageDraw.Draw(img)
             
-            # 根据故事类型添加具象的简单几何图形（模拟具体场景）
-            if '地铁' in story_title or '车厢' in story_title:
-                # 模拟地铁车厢内部：座椅、扶手
-                draw.rectangle([50, 300, 150, 450], fill=(40, 42, 45))  # 座椅
-                draw.rectangle([350, 300, 450, 450], fill=(38, 40, 43))  # 座椅
-                draw.line([(256, 0), (256, 200)], fill=(60, 60, 60), width=5)  # 扶手杆
-            elif '镜子' in story_title:
-                # 模拟镜子和洗手台
-                draw.rectangle([100, 100, 400, 400], fill=(45, 48, 52))  # 镜子框
-                draw.rectangle([150, 350, 350, 450], fill=(55, 55, 58))  # 洗手台
-            elif '门' in story_title or '楼道' in story_title:
-                # 模拟门和走廊
-                draw.rectangle([180, 50, 330, 480], fill=(50, 45, 40))  # 门
-                draw.ellipse([235, 240, 275, 280], fill=(70, 70, 70))  # 门把手
-                draw.rectangle([10, 100, 100, 150], fill=(60, 55, 50))  # 墙上的东西
-            else:
-                # 默认：房间内部物品
-                draw.rectangle([80, 250, 200, 450], fill=(45, 43, 40))  # 家具
-                draw.rectangle([320, 200, 450, 400], fill=(42, 40, 38))  # 家具
-                draw.line([(0, 380), (512, 380)], fill=(35, 33, 30), width=3)  # 地板线
+            # 场景、颗粒、模糊、降饱和、扫描线都在 placeholder_evidence 里一次性向量化完成
+            from placeholder_evidence import render_placeholder
+            from evidence_look import surveillance_overlays
             
-            # 添加细微噪点（模拟胶片颗粒）
-            pixels = img.load()
-            for i in range(0, 512, 2):  # 跳格处理以加快速度
-                for j in range(0, 512, 2):
-                    noise = random.randint(-8, 8)
-                    r, g, b = pixels[i, j]
-                    pixels[i, j] = (
-                        max(0, min(255, r + noise)),
-                        max(0, min(255, g + noise)),
-                        max(0, min(255, b + noise + 2))  # 轻微的蓝色偏移
-                    )
-            
-            # 应用模糊（模拟对焦不准/手抖）
-            img = img.filter(ImageFilter.GaussianBlur(radius=1.5))
-            
-            # 降低饱和度
-            enhancer = ImageEnhance.Color(img)
-            img = enhancer.enhance(0.5)
-            
-            # 添加监控录像风格的时间戳
-            draw = ImageDraw.Draw(img)
+            # 监控录像风格的时间戳（右下角）和 REC 标记（左上角）
             days_ago = random.randint(1, 30)
             fake_date = datetime.now() - timedelta(days=days_ago)
-            timestamp_text = fake_date.strftime('%Y/%m/%d %H:%M:%S')
-            
-            try:
-                # 右下角时间戳（白色半透明）
-                draw.text((340, 480), timestamp_text, fill=(200, 200, 200))
-                # 左上角REC标记
-                draw.text((10, 10), f"REC ●", fill=(180, 0, 0))
-                # 添加一些模拟的扫描线
-                for y in range(0, 512, 8):
-                    draw.line([(0, y), (512, y)], fill=(255, 255, 255), width=1)
-                    img_array = np.array(img)
-                    img_array[y, :] = np.clip(img_array[y, :] * 0.95, 0, 255)
-                    img = Image.fromarray(img_array.astype(np.uint8))
-            except:
-                pass
+            img = render_placeholder(
+                story_title,
+                overlays=surveillance_overlays(fake_date, timestamp_color=(200, 200, 200), rec_color=(180, 0, 0))
+            )
             
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             # 占位符文件名也包含 story_id
             filename = f"evidence_story{story_id}_{timestamp}_placeholder.png"
-            filepath = f"static/generated/{filename}"
+            filepath, url = media_store.allocate(filename)
             img.save(filepath)
+            media_store.register(filepath, story_id, 'image')
             
             # 返回列表格式以保持一致性
-            return [('placeholder', f"/static/generated/{filename}")]
+            return [('placeholder', url)]
         
+    except JobCancelled:
+        raise
     except Exception as e:
         print(f"[generate_evidence_image] 错误: {e}")
         import traceback
@@ -1572,9 +1712,6 @@ def generate_evidence_image(story_id, story_title, story_content, comment_contex
 def generate_audio_description_with_lm_studio(title, content, comment_context=""):
     """使用 LM Studio 生成丰富的音频场景描述，增加多样性"""
     try:
-        import subprocess
-        import json
-        
         lm_studio_url = os.getenv('LM_STUDIO_URL', 'http://localhost:1234/v1')
         
         # 构造 prompt，让 AI 根据故事生成音频场景描述
@@ -1600,69 +1737,59 @@ def generate_audio_description_with_lm_studio(title, content, comment_context=""
 
 请生成这个故事对应的音频场景描述。"""
 
-        # 使用 curl 调用 LM Studio
-        curl_command = [
-            'curl', '-s', f'{lm_studio_url}/chat/completions',
-            '-H', 'Content-Type: application/json',
-            '-d', json.dumps({
-                'model': 'qwen2.5-7b-instruct-1m',
-                'messages': [
+        try:
+            audio_description = chat_completion(
+                [
                     {'role': 'system', 'content': system_prompt},
                     {'role': 'user', 'content': user_prompt}
                 ],
-                'temperature': 0.7,
-                'max_tokens': 150,
-                'top_p': 0.9
-            })
-        ]
-        
-        result = subprocess.run(curl_command, capture_output=True, text=True, timeout=10, encoding='utf-8', errors='ignore')
-        
-        if result.returncode == 0:
-            try:
-                response_data = json.loads(result.stdout)
-                audio_description = response_data['choices'][0]['message']['content'].strip()
-                print(f"[generate_audio_description] ✅ AI 生成音频描述: {audio_description[:60]}...")
-                return audio_description
-            except (json.JSONDecodeError, KeyError, IndexError) as e:
-                print(f"[generate_audio_description] JSON 解析失败: {e}")
-                return None
-        else:
-            print(f"[generate_audio_description] curl 调用失败: {result.stderr}")
+                temperature=0.7,
+                max_tokens=150,
+                timeout=10,
+                url=lm_studio_url,
+                priority=PRIORITY_BACKGROUND,
+                model='qwen2.5-7b-instruct-1m',
+                top_p=0.9
+            ).strip()
+            print(f"[generate_audio_description] ✅ AI 生成音频描述: {audio_description[:60]}...")
+            return audio_description
+        except LLMError as e:
+            print(f"[generate_audio_description] LM Studio 调用失败: {e}")
             return None
             
     except Exception as e:
         print(f"[generate_audio_description] 错误: {e}")
         return None
 
+# 音频关键词映射表 (关键词 -> (音频类型, 频率参数, 强度))
+AUDIO_KEYWORDS = {
+    # 敲击/脚步相关 - 优先级高，要先检查
+    '敲门|敲击|脚步|踩踏|走动|跺脚': ('knocking', 'rhythmic_pulse', 0.5),
+    
+    # 机械/电子 - 优先级高
+    '灯闪烁|电流|闪烁|嗡鸣|警报|断断续续|电器': ('electronic', 'flicker_buzz', 0.5),
+    
+    # 地铁/隧道/空间
+    '地铁|隧道|地下|回声': ('subway', 'hollow_echo', 0.5),
+    
+    # 声音/人声相关 - 低吟、呻吟、尖叫等
+    '呻吟|尖叫|哭声|喘气|呼吸|低吟|呢喃|嗓音|人声': ('voice', 'strange_voice', 0.6),
+    
+    # 自然/环境声
+    '风|树|雨|水|流动': ('nature', 'wind_whisper', 0.4),
+    '沙沙|窸窣|簌簌': ('ambient', 'static_whisper', 0.3),
+    
+    # 时间关键词（影响整体气氛但不直接决定音频类型）
+    '夜晚|凌晨|午夜|深夜|晚上': ('nocturnal', 'ambient_eerie', 0.6),
+    
+    # 诡异/恐怖总体印象（最低优先级）
+    '诡异|怪异|恐怖|害怕|不安|诡|鬼|灵异|灵': ('eerie', 'ambient_eerie', 0.7),
+}
+AUDIO_KEYWORD_INDEX = KeywordIndex(AUDIO_KEYWORDS.items())
+
 def extract_audio_keywords(title, content, comment_context=""):
     """提取音频相关关键词 - 返回音频类型和参数"""
     
-    # 音频关键词映射表 (关键词 -> (音频类型, 频率参数, 强度))
-    audio_keywords = {
-        # 敲击/脚步相关 - 优先级高，要先检查
-        '敲门|敲击|脚步|踩踏|走动|跺脚': ('knocking', 'rhythmic_pulse', 0.5),
-        
-        # 机械/电子 - 优先级高
-        '灯闪烁|电流|闪烁|嗡鸣|警报|断断续续|电器': ('electronic', 'flicker_buzz', 0.5),
-        
-        # 地铁/隧道/空间
-        '地铁|隧道|地下|回声': ('subway', 'hollow_echo', 0.5),
-        
-        # 声音/人声相关 - 低吟、呻吟、尖叫等
-        '呻吟|尖叫|哭声|喘气|呼吸|低吟|呢喃|嗓音|人声': ('voice', 'strange_voice', 0.6),
-        
-        # 自然/环境声
-        '风|树|雨|水|流动': ('nature', 'wind_whisper', 0.4),
-        '沙沙|窸窣|簌簌': ('ambient', 'static_whisper', 0.3),
-        
-        # 时间关键词（影响整体气氛但不直接决定音频类型）
-        '夜晚|凌晨|午夜|深夜|晚上': ('nocturnal', 'ambient_eerie', 0.6),
-        
-        # 诡异/恐怖总体印象（最低优先级）
-        '诡异|怪异|恐怖|害怕|不安|诡|鬼|灵异|灵': ('eerie', 'ambient_eerie', 0.7),
-    }
-    
     # 合并所有文本用于匹配
     combined_text = f"{title} {content} {comment_context}".lower()
     
@@ -1671,23 +1798,10 @@ def extract_audio_keywords(title, content, comment_context=""):
     intensity = 0.5
     
     # 按优先级查找匹配的关键词（先定义的优先级最高）
-    for keywords, (category, audio_type_matched, intensity_matched) in audio_keywords.items():
-        # 检查是否有任何关键词匹配
-        has_match = False
-        matched_keyword = ""
-        
-        for kw in keywords.split('|'):
-            kw = kw.strip()
-            if kw and kw in combined_text:
-                has_match = True
-                matched_keyword = kw
-                break
-        
-        if has_match:
-            audio_type = audio_type_matched
-            intensity = intensity_matched
-            print(f"[extract_audio_keywords] 匹配到关键词: '{matched_keyword}' -> {audio_type}")
-            break  # 优先级最高的匹配就跳出
+    hit = AUDIO_KEYWORD_INDEX.first(combined_text)
+    if hit:
+        _, matched_keyword, (category, audio_type, intensity) = hit
+        print(f"[extract_audio_keywords] 匹配到关键词: '{matched_keyword}' -> {audio_type}")
     
     return audio_type, intensity
 
@@ -1697,7 +1811,6 @@ def generate_evidence_audio(text_content, story_context=""):
         print(f"[generate_evidence_audio] 生成诡异现场环境音频...")
         
         # 首先尝试使用 LM Studio 生成音频描述
-        full_context = f"{text_content}\n{story_context}"
         ai_audio_description = generate_audio_description_with_lm_studio(
             text_content, 
             story_context.split('\n')[0] if story_context else "",  # 取故事内容前几行
@@ -1720,172 +1833,26 @@ def generate_evidence_audio(text_content, story_context=""):
         print(f"[generate_evidence_audio] 音频类型: {audio_type}, 强度: {intensity}")
         
         try:
-            import numpy as np
-            from scipy.io import wavfile
-            from scipy import signal
+            from audio_bank import SAMPLE_RATE, render_pcm16
+            from audio_output import save_clip
             
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             
-            # 生成诡异环境音频的多个层次
-            sample_rate = 22050  # 22kHz采样率
-            duration = 2.0  # 2秒音频
-            
-            # 创建基础音频数据
-            t = np.linspace(0, duration, int(sample_rate * duration))
-            
-            # 根据audio_type生成不同类型的声音
-            if audio_type == 'voice' or audio_type == 'strange_voice':
-                # 人声嗡鸣 - 微妙的人类声音幻听
-                # 每次生成不同的基础频率和特征，增加多样性
-                base_freq = np.random.choice([70, 80, 90, 100, 110, 120])  # 更多频率选择
-                layer1 = 0.12 * intensity * np.sin(2 * np.pi * base_freq * t)
-                
-                # 变调的低吟 - 随机的变调范围和速度
-                modulation_depth = np.random.randint(15, 35)  # 变调深度变化
-                modulation_speed = np.random.uniform(0.3, 0.8)  # 变调速度变化
-                freq_modulation = base_freq + modulation_depth * np.sin(2 * np.pi * modulation_speed * t)
-                layer2 = 0.08 * intensity * np.sin(2 * np.pi * freq_modulation * t)
-                
-                # 微弱的呼吸声 - 不同的呼吸节奏
-                breath_freq = np.random.uniform(0.8, 1.5)  # 呼吸频率变化
-                breath_env = signal.square(2 * np.pi * breath_freq * t) * 0.5 + 0.5
-                breath_tone_freq = np.random.randint(120, 200)  # 呼吸音的基频变化
-                layer3 = 0.06 * intensity * breath_env * np.sin(2 * np.pi * breath_tone_freq * t)
-                
-                audio_data = layer1 + layer2 + layer3
-                
-            elif audio_type == 'knocking' or audio_type == 'rhythmic_pulse':
-                # 敲击/脚步声 - 不同的节奏和音色
-                pulse_freq = np.random.uniform(1.0, 2.5)  # 更宽的脉冲频率范围
-                pulse_envelope = signal.square(2 * np.pi * pulse_freq * t) * 0.5 + 0.5
-                
-                # 低频敲击声 - 不同的敲击音色
-                low_freq = np.random.choice([60, 70, 80, 90, 100])  # 多种敲击频率
-                layer1 = 0.15 * intensity * pulse_envelope * np.sin(2 * np.pi * low_freq * t)
-                
-                # 高频响应 - 不同的响应频率
-                high_freq = np.random.choice([150, 180, 200, 250, 300])  # 多种响应频率
-                layer2 = 0.08 * intensity * pulse_envelope * np.sin(2 * np.pi * high_freq * t)
-                
-                # 环境反响 - 增加变化
-                white_noise = 0.06 * intensity * np.random.normal(0, 1, len(t))
-                white_noise = signal.lfilter([1, 1], [1], white_noise) / 2
-                
-                audio_data = layer1 + layer2 + white_noise
-                
-            elif audio_type == 'wind_whisper' or audio_type == 'static_whisper':
-                # 风声/沙沙声 - 微妙而诡异，多种风格
-                wind_noise = 0.08 * intensity * np.random.normal(0, 1, len(t))
-                wind_noise = signal.lfilter([1, 2, 1], [1, 0, 0], wind_noise) / 4
-                
-                # 添加变调的高频 - 随机高频范围
-                base_whisper_freq = np.random.choice([600, 700, 800, 900, 1000, 1100])
-                modulation_range = np.random.randint(150, 300)
-                freq_modulation = base_whisper_freq + modulation_range * np.sin(2 * np.pi * np.random.uniform(0.2, 0.5) * t)
-                whisper = 0.04 * intensity * np.sin(2 * np.pi * freq_modulation * t)
-                
-                audio_data = wind_noise + whisper
-                
-            elif audio_type == 'hollow_echo':
-                # 地铁/隧道 - 空洞的回声，多种空间感
-                # 随机的基础频率营造不同的空间大小感觉
-                base_freq = np.random.choice([180, 200, 220, 240])
-                modulation = 20 + np.random.randint(20, 40)
-                base_freq_mod = base_freq + modulation * np.sin(2 * np.pi * np.random.uniform(0.3, 0.5) * t)
-                layer1 = 0.12 * intensity * np.sin(2 * np.pi * base_freq_mod * t)
-                
-                # 延迟的回声 - 不同的延迟时间营造不同的空间感
-                delay_time = np.random.uniform(0.08, 0.15)  # 延迟时间变化
-                delay_samples = int(delay_time * sample_rate)
-                layer2 = np.zeros_like(t)
-                if delay_samples < len(layer1):
-                    layer2[delay_samples:] = 0.06 * intensity * layer1[:-delay_samples]
-                
-                # 深沉的嗡鸣 - 不同的低频
-                low_freq = np.random.choice([50, 55, 60, 65])
-                layer3 = 0.08 * intensity * np.sin(2 * np.pi * low_freq * t)
-                
-                audio_data = layer1 + layer2 + layer3
-                
-            elif audio_type == 'electrical_hum' or audio_type == 'flicker_buzz':
-                # 电流/闪烁 - 断断续续的嗡鸣，多种风格
-                buzz_freq = np.random.choice([110, 120, 130, 140])  # 不同的电流频率
-                buzz = 0.12 * intensity * np.sin(2 * np.pi * buzz_freq * t)
-                
-                # 闪烁效果 - 不同的闪烁速度
-                flicker_speed = np.random.uniform(2.5, 5.0)
-                flicker_env = signal.square(2 * np.pi * flicker_speed * t) * 0.5 + 0.5
-                layer2 = 0.08 * intensity * flicker_env * buzz
-                
-                # 高频失真 - 不同的失真频率
-                distortion_freq = np.random.choice([1500, 1800, 2000, 2500, 3000])
-                layer3 = 0.04 * intensity * np.sin(2 * np.pi * distortion_freq * t) * flicker_env
-                
-                audio_data = layer2 + layer3
-                
-            else:  # 默认: ambient_eerie
-                # 环境诡异感 - 多层次的微妙不安，更多随机变化
-                # 层1: 低频嗡鸣声（诡异氛围），多种频率选择
-                low_freq = np.random.choice([35, 40, 45, 50, 55])
-                low_freq_buzz = 0.12 * intensity * np.sin(2 * np.pi * low_freq * t)
-                
-                # 层2: 间歇性的高频尖叫声，多种频率组合
-                scream_freqs = [
-                    [700, 1000, 1400],
-                    [600, 950, 1350],
-                    [750, 1100, 1500],
-                    [650, 1050, 1450]
-                ]
-                selected_freqs = np.random.choice([i for i in range(len(scream_freqs))])
-                scream_freqs = scream_freqs[selected_freqs]
-                
-                screams = np.zeros_like(t)
-                scream_speed = np.random.uniform(1.5, 3.0)  # 尖叫速度变化
-                for freq in scream_freqs:
-                    envelope = signal.square(2 * np.pi * scream_speed * t) * 0.5 + 0.5
-                    screams += 0.05 * intensity * envelope * np.sin(2 * np.pi * freq * t)
-                
-                # 层3: 白噪声（环境背景音） - 基于故事内容的不同种子
-                np.random.seed(hash(full_context) % 2**32)
-                white_noise = 0.08 * intensity * np.random.normal(0, 1, len(t))
-                white_noise = signal.lfilter([1, 2, 1], [1, 0, 0], white_noise) / 4
-                
-                # 层4: 诡异的脉冲音 - 不同脉冲频率
-                pulse_freq = np.random.uniform(1.2, 2.5)
-                pulse_envelope = signal.square(2 * np.pi * pulse_freq * t) * 0.5 + 0.5
-                pulse_base_freq = np.random.choice([100, 120, 150, 180])
-                pulse = 0.08 * intensity * pulse_envelope * np.sin(2 * np.pi * pulse_base_freq * t)
-                
-                audio_data = low_freq_buzz + screams + white_noise + pulse
-            
-            # 添加动态变化（恐怖感渐进）
-            envelope = np.ones_like(t)
-            mid_point = len(envelope) // 2
-            envelope[:mid_point] = np.linspace(0.2, 0.95, mid_point)
-            second_half_len = len(envelope) - mid_point
-            envelope[mid_point:] = np.linspace(0.95, 0.5, second_half_len)
-            envelope[mid_point:] += 0.08 * np.random.normal(0, 1, second_half_len)
-            
-            audio_data *= envelope
-            
-            # 规范化音量（防止失真）- 保持微妙
-            max_val = np.max(np.abs(audio_data))
-            if max_val > 0:
-                audio_data = (audio_data / max_val) * 0.85  # 降低整体音量使其更微妙
-            
-            # 转换为16位PCM格式
-            audio_int16 = np.int16(audio_data * 32767)
+            # 诡异环境音频（2秒）：从 audio_bank 预先生成的分层音色中随机挑选变体，
+            # 以随机增益、起点和音高混合，再套用渐强渐弱包络并规范化音量
+            audio_int16 = render_pcm16(audio_type, intensity)
             
-            # 保存为WAV文件
-            wav_filename = f"eerie_sound_{audio_type}_{timestamp}.wav"
-            wav_filepath = f"static/generated/{wav_filename}"
-            wavfile.write(wav_filepath, sample_rate, audio_int16)
+            # 进程内压缩编码（默认 MP3，见 AUDIO_FORMAT），不再保存未压缩的 WAV
+            # 同一秒内可能有多个故事并行生成同类型音频（state_evidence），文件名加随机后缀
+            filepath, url = save_clip(audio_int16, SAMPLE_RATE,
+                                      f"eerie_sound_{audio_type}_{timestamp}_{uuid.uuid4().hex[:6]}")
+            media_store.register(filepath, media_type='audio')
             
-            print(f"[generate_evidence_audio] ✅ 诡异音频已生成: {wav_filepath}")
-            return f"/generated/{wav_filename}"
+            print(f"[generate_evidence_audio] ✅ 诡异音频已生成: {filepath}")
+            return url
             
         except ImportError as e:
-            print(f"[generate_evidence_audio] scipy/numpy 导入失败: {e}，使用备用方案...")
+            print(f"[generate_evidence_audio] numpy 导入失败: {e}，使用备用方案...")
             
             # 备用方案：使用 pydub 生成环境音效
             try:
@@ -1939,13 +1906,14 @@ def generate_evidence_audio(text_content, story_context=""):
                         noise = noise.overlay(tone - 28, position=pos)
                 
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f"eerie_audio_{audio_type}_{timestamp}.mp3"
-                filepath = f"static/generated/{filename}"
+                filename = f"eerie_audio_{audio_type}_{timestamp}_{uuid.uuid4().hex[:6]}.mp3"
+                filepath, url = media_store.allocate(filename)
                 
                 noise.export(filepath, format="mp3", bitrate="64k")
+                media_store.register(filepath, media_type='audio')
                 
                 print(f"[generate_evidence_audio] ✅ 诡异音效已生成（备用）: {filepath}")
-                return f"/generated/{filename}"
+                return url
                 
             except Exception as pydub_error:
                 print(f"[generate_evidence_audio] pydub也失败了: {pydub_error}，使用占位符")
@@ -1959,8 +1927,13 @@ def generate_evidence_audio(text_content, story_context=""):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         return f"/generated/audio_placeholder_{timestamp}.mp3"
 
-def generate_ai_response(story, user_comment, previous_ai_responses=None):
-    """Generate AI chatbot response to user comment"""
+def generate_ai_response(story, user_comment, previous_ai_responses=None, on_token=None):
+    """Generate AI chatbot response to user comment
+
+    If `on_token` is given, the LM Studio reply is streamed and `on_token(text)` is
+    called with each newly visible piece (think tags already stripped). The
+    returned string is still the fully cleaned final reply.
+    """
     
     # Check if LM Studio local server is configured
     lm_studio_url = os.getenv('LM_STUDIO_URL', 'http://localhost:1234/v1')
@@ -1969,10 +1942,6 @@ def generate_ai_response(story, user_comment, previous_ai_responses=None):
     if use_lm_studio:
         print(f"[generate_ai_response] 使用 LM Studio 本地服务器: {lm_studio_url}")
         try:
-            # 使用 subprocess 调用 curl（因为 Python HTTP 库与 LM Studio 有兼容性问题）
-            import subprocess
-            import json
-            
             # 构建历史对话上下文
             history_context = ""
             if previous_ai_responses:
@@ -2032,47 +2001,43 @@ def generate_ai_response(story, user_comment, previous_ai_responses=None):
 
 请以楼主身份回复这条评论。直接给出回复内容，不要包含任何思考过程或分析。"""
 
-            # 使用 curl 调用 LM Studio（Python HTTP 库与 LM Studio 有兼容性问题）
-            # 构建请求数据
-            request_data = {
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                "temperature": 0.6,  # 降低温度以提高一致性（原0.8）
-                "max_tokens": 200
-            }
-            
-            # 使用 curl 发送请求
-            chat_url = f"{lm_studio_url.rstrip('/v1')}/v1/chat/completions"
-            print(f"[generate_ai_response] 使用 curl 调用: {chat_url}")
-            
-            curl_command = [
-                'curl', '-s', '-X', 'POST', chat_url,
-                '-H', 'Content-Type: application/json',
-                '-d', json.dumps(request_data, ensure_ascii=False),
-                '--max-time', '120'
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
             ]
+            print(f"[generate_ai_response] 调用: {chat_url(lm_studio_url)} (stream={on_token is not None})")
+            if on_token is not None:
+                # 流式生成：边收边过滤 <think> 标签，把可见文本推给前端
+                think_filter = ThinkTagFilter()
+                raw_parts = []
+                for delta in stream_chat_completion(
+                    messages,
+                    temperature=0.6,
+                    max_tokens=200,
+                    timeout=120,
+                    url=lm_studio_url,
+                    priority=PRIORITY_INTERACTIVE
+                ):
+                    raw_parts.append(delta)
+                    visible = think_filter.feed(delta)
+                    if visible:
+                        on_token(visible)
+                tail = think_filter.flush()
+                if tail:
+                    on_token(tail)
+                ai_reply = ''.join(raw_parts).strip()
+            else:
+                ai_reply = chat_completion(
+                    messages,
+                    temperature=0.6,  # 降低温度以提高一致性（原0.8）
+                    max_tokens=200,
+                    timeout=120,
+                    url=lm_studio_url,
+                    priority=PRIORITY_INTERACTIVE
+                ).strip()
             
-            result = subprocess.run(
-                curl_command,
-                capture_output=True,
-                text=True,
-                timeout=120,
-                encoding='utf-8',
-                errors='ignore'
-            )
-            
-            if result.returncode != 0:
-                raise Exception(f"curl 命令失败: {result.stderr}")
-            
-            # 检查输出是否为空
-            if not result.stdout or result.stdout.strip() == '':
-                raise Exception("curl 返回空响应")
-            
-            # 解析响应
-            response_data = json.loads(result.stdout)
-            ai_reply = response_data['choices'][0]['message']['content'].strip()
+            if not ai_reply:
+                raise LLMError("LM Studio 返回空响应")
             
             print(f"[generate_ai_response] LM Studio 原始回复 (前100字): {ai_reply[:100]}...")
             
@@ -2167,8 +2132,11 @@ def generate_ai_response(story, user_comment, previous_ai_responses=None):
             error_message = str(e)
             print(f"[generate_ai_response] ❌ LM Studio 调用失败: {type(e).__name__}: {e}")
             
+            # 调度器主动丢弃（排队超时/队列已满）或熔断中：直接走模板，不打印堆栈
+            if isinstance(e, (LLMOverloaded, LLMUnavailable)):
+                pass
             # 特殊处理 503 错误
-            if "503" in error_message or "InternalServerError" in str(type(e).__name__):
+            elif "503" in error_message or "InternalServerError" in str(type(e).__name__):
                 print("[generate_ai_response] ⚠️ 检测到 503 错误 - 可能的原因:")
                 print("   1. LM Studio 模型未完全加载")
                 print("   2. 服务器负载过高")
@@ -1,4 +1,4 @@
-﻿from flask import Flask, jsonify, request, send_from_directory
+﻿from flask import Flask, Response, jsonify, request, send_from_directory
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timedelta
@@ -7,13 +7,22 @@ from apscheduler.schedulers.background import BackgroundScheduler
 import jwt
 import os
 import json
-import threading
 import time
 import random
 from dotenv import load_dotenv
 
+# 先加载 .env：下面的模块在导入时读取配置
 load_dotenv()
 
+from app_models import register_models
+from reply_stream import open_reply_stream, get_reply_stream
+from job_queue import enqueue, register_job, start_job_workers, current_job, JobCancelled
+from image_assets import start_static_derivatives
+from evidence_pool import start_evidence_pool
+from audio_bank import start_audio_bank
+from view_counter import view_counter, start_view_counter
+from keyword_index import KeywordIndex
+
 app = Flask(__name__, static_folder='static', static_url_path='')
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-horror')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///ai_urban_legends.db')
@@ -51,7 +60,7 @@ class Story(db.Model):
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
-    story_id = db.Column(db.Integer, db.ForeignKey('story.id'), nullable=False)
+    story_id = db.Column(db.Integer, db.ForeignKey('story.id'), nullable=False, index=True)
     author_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     parent_id = db.Column(db.Integer, db.ForeignKey('comment.id'), nullable=True)  # 回复的评论ID
     is_ai_response = db.Column(db.Boolean, default=False)
@@ -62,7 +71,7 @@ class Comment(db.Model):
     
 class Evidence(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    story_id = db.Column(db.Integer, db.ForeignKey('story.id'), nullable=False)
+    story_id = db.Column(db.Integer, db.ForeignKey('story.id'), nullable=False, index=True)
     evidence_type = db.Column(db.String(20))
     file_path = db.Column(db.String(500))
     description = db.Column(db.Text)
@@ -94,6 +103,57 @@ class CategoryClick(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     __table_args__ = (db.UniqueConstraint('user_id', 'category', name='_user_category_uc'),)
 
+class TranslationCache(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(64), unique=True, nullable=False)  # sha256(model, target, text)
+    target = db.Column(db.String(20), nullable=False)
+    model = db.Column(db.String(100), nullable=False)
+    translated = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class EvidenceRenderCache(db.Model):
+    """evidence_cache：渲染参数哈希 -> 原始扩散输出（按内容哈希存放的 PNG）"""
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(64), unique=True, nullable=False)   # sha256(模型, prompt, 负面 prompt, 步数, 尺寸, seed...)
+    content_hash = db.Column(db.String(64), nullable=False, index=True)
+    size_bytes = db.Column(db.Integer, nullable=False, default=0)
+    hits = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class MediaFile(db.Model):
+    """media_store：static/generated 下的生成媒体文件，供垃圾回收和磁盘预算使用"""
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(500), unique=True, nullable=False)   # static/ 下的相对路径，如 generated/ab/cd/x.png
+    story_id = db.Column(db.Integer, index=True)                    # 不设外键：故事会被批量删除
+    media_type = db.Column(db.String(20))                           # image / audio
+    size_bytes = db.Column(db.Integer, nullable=False, default=0)
+    downscaled = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class Job(db.Model):
+    """后台任务（job_queue），请求路径只负责入队，由固定大小的 worker 池执行"""
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)   # 'ai_reply', 'story_evidence', 'evidence_refine'
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON 参数
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)  # pending/running/done/failed/cancelled
+    story_id = db.Column(db.Integer, index=True)          # 任务所属故事（payload 中的 story_id），供进度查询
+    progress = db.Column(db.Integer, nullable=False, default=0)   # 0-100
+    stage = db.Column(db.String(50))                      # 当前阶段，如 'rendering'
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    idempotency_key = db.Column(db.String(120), unique=True, nullable=True)
+    last_error = db.Column(db.Text)
+    locked_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# 后台模块通过 app_models.lookup() 取得本 app 的 db 和模型，而不是 `from app import ...`
+# （`python app.py` 启动时本文件是 __main__，再 import app 会得到另一个 SQLAlchemy 实例）
+register_models(app, db, User, Story, Comment, Evidence, Follow, Notification, CategoryClick,
+                TranslationCache, EvidenceRenderCache, MediaFile, Job)
+
 # ============================================
 # 真实用户名生成函数
 # ============================================
@@ -158,106 +218,106 @@ def get_or_create_fake_user():
     # 随机返回一个已存在的虚假用户
     return random.choice(fake_users)
 
+# 关键词匹配的评论模板（更丰富、更具体）
+CONTEXTUAL_COMMENT_TEMPLATES = {
+    # 地铁相关
+    '地铁|车厢|月台|港铁': [
+        '我也经常坐这条线，有时候真的会有种怪怪的感觉',
+        '深夜地铁确实容易让人胡思乱想，但你说的太具体了...',
+        '地铁工作人员应该知道点什么吧？',
+        '末班车的时候人少，确实诡异',
+        '我记得那个站台好像以前出过事',
+    ],
+    # 镜子相关
+    '镜子|倒影|洗手间|浴室': [
+        '镜子这种东西，晚上还是少看为妙',
+        '我家也有面老镜子，总觉得反光不太对',
+        '会不会是灯光角度问题？但听起来不像...',
+        '建议把镜子换掉，别管值不值钱',
+        '镜子里的东西有时候确实和现实不一样',
+    ],
+    # 敲门/脚步声相关
+    '敲门|脚步|走廊|楼梯': [
+        '楼上楼下的邻居问过吗？',
+        '装个监控看看到底是什么情况',
+        '我以前住的地方也有类似的声音，后来搬走了',
+        '凌晨的声音最让人不安了',
+        '建议先排查一下管道和结构问题',
+    ],
+    # 金鱼/宠物相关
+    '金鱼|鱼缸|宠物|斗鱼': [
+        '养鱼的人都知道，鱼是有灵性的',
+        '那家店我知道，但我没见过你说的那个老板',
+        '鱼缸位置是不是不对？风水上有讲究',
+        '我也在金鱼街买过东西，那里有些店确实很奇怪',
+        '动物有时候能感知到人类感知不到的东西',
+    ],
+    # 窗户/窗外相关
+    '窗|窗外|人影|阴影': [
+        '窗帘拉上吧，别想太多',
+        '对面楼的住户你认识吗？',
+        '可能是光影效果，但小心点总没错',
+        '我也遇到过类似的，后来发现是树影',
+        '人影这种事，看到了就别再回头看',
+    ],
+    # 声音相关
+    '声音|听到|响|噪音': [
+        '录下来听听看，说不定能发现什么',
+        '会不会是幻听？压力大的时候容易这样',
+        '我朋友也说过类似的经历',
+        '声音从哪个方向来的？',
+        '建议找人陪你一起确认一下',
+    ],
+    # 时间相关
+    '凌晨|深夜|午夜|3点': [
+        '凌晨3点是最阴的时候，尽量别醒',
+        '你的作息是不是有问题？',
+        '深夜容易产生幻觉，注意休息',
+        '那个时间段确实容易遇到怪事',
+        '半夜还是少折腾，早点睡',
+    ],
+}
+CONTEXTUAL_COMMENT_INDEX = KeywordIndex(CONTEXTUAL_COMMENT_TEMPLATES.items())
+
+# 通用评论（作为后备）
+GENERIC_COMMENT_TEMPLATES = [
+    '这个我也遇到过类似的情况...',
+    '楼主说的地方我知道，确实有点诡异',
+    '听起来确实不太对劲',
+    '会不会是巧合？但你说得太详细了',
+    '我也住那附近，没遇到过，可能是个例',
+    '有点吓人，楼主小心点',
+    '可能是心理作用，但也说不准',
+    '这个地方晚上最好别去',
+    '我朋友说过类似的事',
+    '真的假的？有点不可思议',
+    '楼主多保重',
+    '不敢相信居然还有这种事',
+    '感觉背后有什么原因',
+    '建议远离那个地方',
+    '我之前听说过类似的传说',
+    '细思极恐啊',
+    '有没有可能是误会？',
+    '这种事情宁可信其有',
+    '感觉不太妙，注意安全',
+    '有机会我也想去看看',
+]
+
 def generate_contextual_comment(story_title, story_content, existing_comments):
     """根据故事内容生成相关的评论"""
     # 提取故事关键词
     combined_text = (story_title + " " + story_content).lower()
     
-    # 关键词匹配的评论模板（更丰富、更具体）
-    contextual_templates = {
-        # 地铁相关
-        '地铁|车厢|月台|港铁': [
-            '我也经常坐这条线，有时候真的会有种怪怪的感觉',
-            '深夜地铁确实容易让人胡思乱想，但你说的太具体了...',
-            '地铁工作人员应该知道点什么吧？',
-            '末班车的时候人少，确实诡异',
-            '我记得那个站台好像以前出过事',
-        ],
-        # 镜子相关
-        '镜子|倒影|洗手间|浴室': [
-            '镜子这种东西，晚上还是少看为妙',
-            '我家也有面老镜子，总觉得反光不太对',
-            '会不会是灯光角度问题？但听起来不像...',
-            '建议把镜子换掉，别管值不值钱',
-            '镜子里的东西有时候确实和现实不一样',
-        ],
-        # 敲门/脚步声相关
-        '敲门|脚步|走廊|楼梯': [
-            '楼上楼下的邻居问过吗？',
-            '装个监控看看到底是什么情况',
-            '我以前住的地方也有类似的声音，后来搬走了',
-            '凌晨的声音最让人不安了',
-            '建议先排查一下管道和结构问题',
-        ],
-        # 金鱼/宠物相关
-        '金鱼|鱼缸|宠物|斗鱼': [
-            '养鱼的人都知道，鱼是有灵性的',
-            '那家店我知道，但我没见过你说的那个老板',
-            '鱼缸位置是不是不对？风水上有讲究',
-            '我也在金鱼街买过东西，那里有些店确实很奇怪',
-            '动物有时候能感知到人类感知不到的东西',
-        ],
-        # 窗户/窗外相关
-        '窗|窗外|人影|阴影': [
-            '窗帘拉上吧，别想太多',
-            '对面楼的住户你认识吗？',
-            '可能是光影效果，但小心点总没错',
-            '我也遇到过类似的，后来发现是树影',
-            '人影这种事，看到了就别再回头看',
-        ],
-        # 声音相关
-        '声音|听到|响|噪音': [
-            '录下来听听看，说不定能发现什么',
-            '会不会是幻听？压力大的时候容易这样',
-            '我朋友也说过类似的经历',
-            '声音从哪个方向来的？',
-            '建议找人陪你一起确认一下',
-        ],
-        # 时间相关
-        '凌晨|深夜|午夜|3点': [
-            '凌晨3点是最阴的时候，尽量别醒',
-            '你的作息是不是有问题？',
-            '深夜容易产生幻觉，注意休息',
-            '那个时间段确实容易遇到怪事',
-            '半夜还是少折腾，早点睡',
-        ],
-    }
-    
-    # 通用评论（作为后备）
-    generic_templates = [
-        '这个我也遇到过类似的情况...',
-        '楼主说的地方我知道，确实有点诡异',
-        '听起来确实不太对劲',
-        '会不会是巧合？但你说得太详细了',
-        '我也住那附近，没遇到过，可能是个例',
-        '有点吓人，楼主小心点',
-        '可能是心理作用，但也说不准',
-        '这个地方晚上最好别去',
-        '我朋友说过类似的事',
-        '真的假的？有点不可思议',
-        '楼主多保重',
-        '不敢相信居然还有这种事',
-        '感觉背后有什么原因',
-        '建议远离那个地方',
-        '我之前听说过类似的传说',
-        '细思极恐啊',
-        '有没有可能是误会？',
-        '这种事情宁可信其有',
-        '感觉不太妙，注意安全',
-        '有机会我也想去看看',
-    ]
-    
     # 根据关键词匹配选择相关评论
     matched_templates = []
-    for keywords, templates in contextual_templates.items():
-        if any(kw in combined_text for kw in keywords.split('|')):
-            matched_templates.extend(templates)
+    for _, _, templates in CONTEXTUAL_COMMENT_INDEX.matches(combined_text):
+        matched_templates.extend(templates)
     
     # 如果有匹配的关键词，80%概率使用相关评论，20%使用通用评论
     if matched_templates and random.random() < 0.8:
         available_templates = matched_templates
     else:
-        available_templates = generic_templates
+        available_templates = GENERIC_COMMENT_TEMPLATES
     
     # 去重：确保不和已有评论重复
     existing_contents = {c.content for c in existing_comments}
@@ -266,7 +326,7 @@ def generate_contextual_comment(story_title, story_content, existing_comments):
     # 如果所有模板都用过了，生成变体
     if not available_templates:
         # 简单变体：加上"也"、"好像"等词
-        base_comment = random.choice(generic_templates)
+        base_comment = random.choice(GENERIC_COMMENT_TEMPLATES)
         variations = [
             f"我{base_comment}",
             f"好像{base_comment}",
@@ -487,13 +547,35 @@ def verify_token(token):
 def index():
     return send_from_directory('.', 'index.html')
 
+def _send_static(path):
+    # 图片按 Accept（以及可选的 ?w= 显示宽度）返回 WebP/AVIF 衍生图，没有衍生图时返回原图
+    # Range 请求（音频拖动/分段加载）由 send_file 的 conditional 处理，返回 206
+    from image_assets import negotiate, SOURCE_EXTENSIONS
+    from audio_output import mimetype_for
+    import media_store
+    derived = negotiate(path, request.headers.get('Accept', ''), request.args.get('w', type=int))
+    if derived:
+        rel, mimetype = derived
+        response = send_from_directory('static', rel, mimetype=mimetype)
+    else:
+        response = send_from_directory('static', path, mimetype=mimetype_for(path))
+    if path.lower().endswith(SOURCE_EXTENSIONS):
+        response.vary.add('Accept')
+    if media_store.relpath_for_url(path):
+        # 生成的媒体文件名唯一、写入后不再改动，浏览器可长期缓存
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = media_store.MEDIA_CACHE_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
 @app.route('/static/<path:path>')
 def serve_static(path):
-    return send_from_directory('static', path)
+    return _send_static(path)
 
 @app.route('/<path:path>')
 def serve_other(path):
-    return send_from_directory('static', path)
+    return _send_static(path)
 
 @app.route('/api/register', methods=['POST'])
 def register():
@@ -536,23 +618,34 @@ def login():
         'user': {'id': user.id, 'username': user.username, 'avatar': user.avatar}
     })
 
+def story_list_query():
+    """Stories newest first as (Story, comments_count, evidence_count) rows.
+
+    The counts are correlated COUNT subqueries on the indexed story_id columns,
+    so a page is a single query however many comments exist. Relationships are
+    not loaded.
+    """
+    comments_count = db.session.query(db.func.count(Comment.id)) \
+        .filter(Comment.story_id == Story.id).correlate(Story).scalar_subquery()
+    evidence_count = db.session.query(db.func.count(Evidence.id)) \
+        .filter(Evidence.story_id == Story.id).correlate(Story).scalar_subquery()
+    return db.session.query(Story, comments_count, evidence_count).order_by(Story.created_at.desc())
+
 @app.route('/api/stories', methods=['GET'])
 def get_stories():
     # 获取分页参数
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)  # 每页10个故事
     
-    # 查询总数
-    total = Story.query.count()
-    
-    # 分页查询
-    pagination = Story.query.order_by(Story.created_at.desc()).paginate(
+    # 分页查询：评论/证据数随故事一起查出，不加载关系。
+    # paginate 自带的总数统计会把计数子查询包进 COUNT(*)，这里改为直接统计故事表
+    pagination = story_list_query().paginate(
         page=page,
         per_page=per_page,
-        error_out=False
+        error_out=False,
+        count=False
     )
-    
-    stories = pagination.items
+    pagination.total = db.session.query(db.func.count(Story.id)).scalar()
     
     return jsonify({
         'stories': [{
@@ -565,14 +658,14 @@ def get_stories():
             'ai_persona': s.ai_persona,
             'current_state': s.current_state,
             'created_at': s.created_at.isoformat(),
-            'views': s.views,
-            'comments_count': len(s.comments),
-            'evidence_count': len(s.evidence)
-        } for s in stories],
+            'views': (s.views or 0) + view_counter.pending(s.id),
+            'comments_count': comments_count,
+            'evidence_count': evidence_count
+        } for s, comments_count, evidence_count in pagination.items],
         'pagination': {
             'page': page,
             'per_page': per_page,
-            'total': total,
+            'total': pagination.total,
             'pages': pagination.pages,
             'has_prev': pagination.has_prev,
             'has_next': pagination.has_next,
@@ -584,9 +677,10 @@ def get_stories():
 @app.route('/api/stories/<int:story_id>', methods=['GET'])
 def get_story(story_id):
     story = Story.query.get_or_404(story_id)
-    story.views += 1
-    db.session.commit()
+    # 浏览数先记在内存里，由 view_counter 批量写回，读请求不再占用数据库写锁
+    view_counter.record(story.id)
     
+    from image_assets import derivative_urls
     return jsonify({
         'id': story.id,
         'title': story.title,
@@ -597,11 +691,12 @@ def get_story(story_id):
         'ai_persona': story.ai_persona,
         'current_state': story.current_state,
         'created_at': story.created_at.isoformat(),
-        'views': story.views,
+        'views': (story.views or 0) + view_counter.pending(story.id),
         'evidence': [{
             'id': e.id,
             'type': e.evidence_type,
             'file_path': e.file_path,
+            'variants': derivative_urls(e.file_path) if e.evidence_type == 'image' else None,
             'description': e.description,
             'created_at': e.created_at.isoformat()
         } for e in story.evidence],
@@ -654,13 +749,16 @@ def add_comment(story_id):
     # Create notification for user's own comment (for AI response)
     create_notifications_for_followers(story, comment)
 
-    # 启动后台线程，5秒后生成AI回复（测试用）
-    print(f"[add_comment] 启动后台线程，5秒后生成AI回复...")
-    threading.Thread(
-        target=delayed_ai_response,
-        args=(story_id, comment.id, 5),  # 5秒延迟（测试）
-        daemon=True
-    ).start()
+    # AI回复入队，由后台 worker 生成，回复以流的形式推送给 /ai-stream 订阅者
+    reply_delay = float(os.getenv('AI_REPLY_DELAY_SECONDS', 0))
+    open_reply_stream(comment.id)
+    print(f"[add_comment] AI回复任务入队，{reply_delay}秒后生成...")
+    enqueue(
+        'ai_reply',
+        {'story_id': story_id, 'comment_id': comment.id},
+        delay_seconds=reply_delay,
+        idempotency_key=f'ai_reply:{comment.id}'
+    )
     
     # 如果是顶级评论，尝试添加虚拟用户评论（40%概率）
     if not parent_id:
@@ -672,6 +770,7 @@ def add_comment(story_id):
             maybe_add_fake_reply(story_id, parent_comment)
     
     # 检查是否达到证据生成阈值（只统计用户评论，不包括AI回复）
+    evidence_pending = False
     user_comment_count = Comment.query.filter_by(story_id=story_id, is_ai_response=False).count()
     evidence_threshold = int(os.getenv('EVIDENCE_COMMENT_THRESHOLD', 3))  # 改为3
     
@@ -679,12 +778,14 @@ def add_comment(story_id):
     
     # 每达到阈值的倍数就生成新证据（例如：3,6,9,12...条评论时）
     if user_comment_count >= evidence_threshold and user_comment_count % evidence_threshold == 0:
-        print(f"[add_comment] ✅ 用户评论数达到阈值倍数 ({user_comment_count})，启动证据生成...")
-        threading.Thread(
-            target=generate_evidence_for_story,
-            args=(story_id, comment.id),  # 传递触发评论的ID
-            daemon=True
-        ).start()
+        print(f"[add_comment] ✅ 用户评论数达到阈值倍数 ({user_comment_count})，证据生成任务入队...")
+        enqueue(
+            'story_evidence',
+            {'story_id': story_id, 'trigger_comment_id': comment.id},  # 传递触发评论的ID
+            idempotency_key=f'story_evidence:{story_id}:{user_comment_count}',
+            max_attempts=2
+        )
+        evidence_pending = True
     else:
         print(f"[add_comment] 未达到证据生成条件 (用户评论数: {user_comment_count}, 需要: {evidence_threshold}的倍数)")
     
@@ -700,9 +801,63 @@ def add_comment(story_id):
             'created_at': comment.created_at.isoformat()
         },
         'ai_response_pending': True,
+        'ai_response_stream': f'/api/stories/{story_id}/comments/{comment.id}/ai-stream',
+        'evidence_status': f'/api/stories/{story_id}/evidence/status' if evidence_pending else None,
         'message': 'AI楼主正在思考回复，请稍候...'
     }), 201
 
+@app.route('/api/stories/<int:story_id>/evidence/status', methods=['GET'])
+def evidence_status(story_id):
+    """最近一次证据生成/高清替换任务的状态和进度，供详情页显示进度条"""
+    job = Job.query.filter(Job.job_type.in_(('story_evidence', 'evidence_refine')), Job.story_id == story_id) \
+        .order_by(Job.id.desc()).first()
+    if job is None:
+        return jsonify({'status': 'none', 'active': False})
+    active = job.status in ('pending', 'running')
+    return jsonify({
+        'job_id': job.id,
+        'job_type': job.job_type,
+        'status': job.status,
+        'active': active,
+        'progress': job.progress or 0,
+        'stage': job.stage or ('queued' if job.status == 'pending' else None),
+        'error': job.last_error if job.status in ('failed', 'cancelled') else None,
+        'evidence_count': Evidence.query.filter_by(story_id=story_id).count(),
+        'updated_at': job.updated_at.isoformat() if job.updated_at else None,
+        # 建议的下次查询间隔：排队时慢一点，渲染中跟上进度写入频率
+        'poll_after_ms': (5000 if job.status == 'pending' else 2000) if active else None,
+    })
+
+@app.route('/api/stories/<int:story_id>/comments/<int:comment_id>/ai-stream', methods=['GET'])
+def stream_ai_response(story_id, comment_id):
+    """以 Server-Sent Events 推送楼主回复的生成过程（token 事件），完成后发送 done 事件"""
+    stream = get_reply_stream(comment_id)
+    if stream is None:
+        # 流已过期或不在本进程：若回复已入库，直接返回最终结果
+        ai_comment = Comment.query.filter_by(
+            story_id=story_id, parent_id=comment_id, is_ai_response=True
+        ).order_by(Comment.id.desc()).first()
+        if not ai_comment:
+            return jsonify({'error': 'No pending reply for this comment'}), 404
+        final = {'comment_id': ai_comment.id, 'content': ai_comment.content}
+
+        def replay():
+            yield f"event: done\ndata: {json.dumps(final, ensure_ascii=False)}\n\n"
+        events = replay()
+    else:
+        def relay():
+            for event, data in stream.events():
+                if event == 'ping':
+                    yield ": ping\n\n"
+                else:
+                    yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        events = relay()
+
+    return Response(events, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/api/stories/<int:story_id>/follow', methods=['POST', 'GET'])
 def follow_story(story_id):
     token = request.headers.get('Authorization')
@@ -757,8 +912,8 @@ def translate_api():
         return jsonify({'translated': ''})
 
     try:
-        from ai_engine import translate_text
-        translated = translate_text(text, target=target)
+        from translation_cache import cached_translate
+        translated = cached_translate(text, target=target)
         if translated is None:
             return jsonify({'translated': None, 'error': 'No translation service available'}), 200
         return jsonify({'translated': translated})
@@ -1041,6 +1196,52 @@ def admin_reset_ai_stories():
 
     return jsonify({'deleted': deleted, 'seeded': [st1.title, st2.title, st3.title]})
 
+@app.route('/api/admin/runtime_stats', methods=['GET'])
+def admin_runtime_stats():
+    """Admin endpoint: LLM scheduler / circuit breaker / diffusion pipeline, batching, render cache, evidence pool, media store, audio encoding, state transition and view counter statistics.
+
+    Protect using SECRET key sent in header 'X-ADMIN-KEY'."""
+    key = request.headers.get('X-ADMIN-KEY')
+    if not key or key != app.config.get('SECRET_KEY'):
+        return jsonify({'error': 'Forbidden'}), 403
+
+    from llm_scheduler import scheduler as llm_scheduler
+    from llm_breaker import breaker
+    from sd_pipeline import diffusion_pipelines
+    from evidence_renderer import evidence_renderer
+    from evidence_cache import evidence_image_cache
+    from evidence_pool import evidence_pool
+    import media_store
+    import audio_output
+    import state_evidence
+    return jsonify({
+        'llm_scheduler': llm_scheduler.stats(),
+        'llm_breaker': breaker.stats(),
+        'sd_pipeline': diffusion_pipelines.stats(),
+        'evidence_renderer': evidence_renderer.stats(),
+        'evidence_cache': evidence_image_cache.stats(),
+        'evidence_pool': evidence_pool.stats(),
+        'media_store': media_store.stats(),
+        'audio_output': audio_output.stats(),
+        'state_evidence': state_evidence.stats(),
+        'view_counter': view_counter.stats(),
+    })
+
+@app.route('/api/admin/media_gc', methods=['POST'])
+def admin_media_gc():
+    """Admin endpoint: run one generated-media garbage collection pass now.
+
+    Protect using SECRET key sent in header 'X-ADMIN-KEY'."""
+    key = request.headers.get('X-ADMIN-KEY')
+    if not key or key != app.config.get('SECRET_KEY'):
+        return jsonify({'error': 'Forbidden'}), 403
+
+    from media_store import collect_garbage
+    try:
+        return jsonify(collect_garbage())
+    except Exception as e:
+        return jsonify({'error': '媒体清理失败', 'detail': str(e)}), 500
+
 def create_notifications_for_followers(story, comment, ai_response=False):
     # Remove nested context manager - assume already in app context
     followers = Follow.query.filter_by(story_id=story.id).all()
@@ -1060,10 +1261,31 @@ def create_notifications_for_followers(story, comment, ai_response=False):
         db.session.add(notification)
     db.session.commit()
 
-def delayed_ai_response(story_id, comment_id, delay_seconds=60):
-    """延迟生成AI回复"""
+def delayed_ai_response(story_id, comment_id, delay_seconds=0):
+    """延迟生成AI回复，生成过程通过 reply_stream 推送给 SSE 订阅者
+
+    由 job_queue 的 'ai_reply' 任务调用（延迟由任务的 run_at 实现，这里不再 sleep）
+    """
+    stream = open_reply_stream(comment_id)
+    try:
+        final = _generate_ai_reply(story_id, comment_id, delay_seconds, stream.push) or {}
+    except JobCancelled:
+        stream.finish({})
+        raise
+    except Exception:
+        job = current_job()
+        if job is None or job.last_attempt():
+            stream.finish({})
+        else:
+            # 任务还会重试：订阅者继续等待，重试时清空本次已推送的文本
+            stream.fail()
+        raise
+    stream.finish(final)
+
+def _generate_ai_reply(story_id, comment_id, delay_seconds, on_token):
     print(f"[delayed_ai_response] 开始等待 {delay_seconds} 秒... story_id={story_id}, comment_id={comment_id}")
-    time.sleep(delay_seconds)
+    if delay_seconds > 0:
+        time.sleep(delay_seconds)
     
     print(f"[delayed_ai_response] 开始生成AI回复...")
     with app.app_context():
@@ -1074,6 +1296,12 @@ def delayed_ai_response(story_id, comment_id, delay_seconds=60):
             print(f"[delayed_ai_response] ERROR: Story or Comment not found!")
             return
         
+        # 任务重试时不重复回复
+        existing = Comment.query.filter_by(story_id=story_id, parent_id=comment_id, is_ai_response=True).first()
+        if existing:
+            print(f"[delayed_ai_response] 评论 {comment_id} 已有楼主回复，跳过")
+            return {'comment_id': existing.id, 'content': existing.content}
+        
         print(f"[delayed_ai_response] 调用 generate_ai_response...")
         from ai_engine import generate_ai_response
         
@@ -1083,7 +1311,7 @@ def delayed_ai_response(story_id, comment_id, delay_seconds=60):
             is_ai_response=True
         ).order_by(Comment.created_at.desc()).limit(3).all()
         
-        ai_response = generate_ai_response(story, comment, previous_ai_responses)
+        ai_response = generate_ai_response(story, comment, previous_ai_responses, on_token=on_token)
         print(f"[delayed_ai_response] AI回复生成完成: {ai_response[:50]}..." if ai_response else "[delayed_ai_response] AI回复为空!")
         
         if ai_response:
@@ -1117,6 +1345,7 @@ def delayed_ai_response(story_id, comment_id, delay_seconds=60):
             create_notifications_for_followers(story, ai_comment, ai_response=True)
             
             db.session.commit()
+            return {'comment_id': ai_comment.id, 'content': ai_response}
 
 def generate_evidence_for_story(story_id, trigger_comment_id=None):
     """为故事生成证据（图片）- 每当用户评论数达到2的倍数就生成1张图片
@@ -1134,6 +1363,11 @@ def generate_evidence_for_story(story_id, trigger_comment_id=None):
         
         from ai_engine import generate_evidence_image
         
+        # 在任务队列中运行时汇报进度（/api/stories/<id>/evidence/status），故事被删除/封贴时停止
+        job = current_job()
+        if job:
+            job.report(5, 'preparing')
+        
         # 获取当前证据统计
         total_evidence_count = Evidence.query.filter_by(story_id=story_id).count()
         image_evidence_count = Evidence.query.filter_by(story_id=story_id, evidence_type='image').count()
@@ -1157,17 +1391,37 @@ def generate_evidence_for_story(story_id, trigger_comment_id=None):
         
         # 生成图片证据（可能包含多个模板）
         print(f"[generate_evidence_for_story] 📷 生成图片证据（第{image_evidence_count + 1}批）...")
+        if job:
+            job.report(10, 'rendering')
         
+        # 渐进模式：需要推理时先生成预览图立即发布并通知，完整画质由 evidence_refine 任务随后替换
+        progressive = os.getenv('EVIDENCE_PROGRESSIVE', 'true').lower() == 'true'
         image_paths = generate_evidence_image(
             story_id,  # 传入 story_id
             story.title,
             story.content,
-            comment_context
+            comment_context,
+            category=story.category,  # 用于从预生成池取同分类的图片
+            preview=progressive
         )
         
         if image_paths:
             # 仅保存第一张图片作为证据：每次触发只需一张图片以降低生成与存储成本
-            template_type, image_path = image_paths[0]
+            template_type, image_path = image_paths[0][:2]
+            refine = image_paths[0][2] if len(image_paths[0]) > 2 else None
+            
+            if job:
+                # 渲染期间故事被删除或封贴：不再写入证据，文件留给 media_store GC 清理
+                job.raise_if_cancelled()
+                job.report(92, 'saving')
+            
+            # 写入 WebP 多尺寸衍生图和缩略图，详情页直接引用
+            try:
+                from image_assets import create_derivatives
+                create_derivatives(image_path)
+            except Exception as e:
+                print(f"[generate_evidence_for_story] ⚠️ 衍生图生成失败（使用原图）: {e}")
+            
             evidence = Evidence(
                 story_id=story_id,
                 evidence_type='image',
@@ -1178,6 +1432,15 @@ def generate_evidence_for_story(story_id, trigger_comment_id=None):
             db.session.commit()
             print(f"[generate_evidence_for_story] ✅ 图片证据已生成 [{template_type}]: {image_path}")
             
+            if refine:
+                enqueue(
+                    'evidence_refine',
+                    {'story_id': story_id, 'evidence_id': evidence.id, **refine},
+                    idempotency_key=f'evidence_refine:{evidence.id}',
+                    max_attempts=2
+                )
+                print(f"[generate_evidence_for_story] 📷 预览图已发布，完整画质渲染已入队")
+            
             # 更新故事内容（楼主补充证据的真实口吻）
             story.content += f"\n\n【证据更新】\n根据大家的反馈，我又去现场仔细看了看，拍了这张照片。你们看看有没有发现什么异常..."
             story.updated_at = datetime.utcnow()
@@ -1214,12 +1477,74 @@ def generate_evidence_for_story(story_id, trigger_comment_id=None):
             db.session.commit()
             print(f"[generate_evidence_for_story] ✅ 证据生成完成!已通知 {len(notified_users)} 个用户")
 
+def refine_story_evidence(story_id, evidence_id, prompt, taken_at):
+    """用完整画质图片替换渐进模式发布的预览图（同一条 Evidence，文件换成新的）"""
+    with app.app_context():
+        evidence = Evidence.query.get(evidence_id)
+        if not evidence:
+            print(f"[refine_story_evidence] 证据 #{evidence_id} 已不存在，跳过")
+            return
+        
+        from ai_engine import refine_evidence_image
+        from image_assets import create_derivatives
+        import media_store
+        
+        job = current_job()
+        if job:
+            job.report(5, 'refining')
+        image_path = refine_evidence_image(
+            story_id,
+            prompt,
+            taken_at,
+            progress=job.step_reporter('refining', 5, 95) if job else None,
+            cancelled=job.cancelled if job else None
+        )
+        if job:
+            job.raise_if_cancelled()
+        
+        try:
+            create_derivatives(image_path)
+        except Exception as e:
+            print(f"[refine_story_evidence] ⚠️ 衍生图生成失败（使用原图）: {e}")
+        
+        # 新文件名（而不是覆盖预览文件），已缓存预览图的浏览器也能拿到新图
+        preview_path = evidence.file_path
+        evidence.file_path = image_path
+        db.session.commit()
+        media_store.discard(preview_path)
+        print(f"[refine_story_evidence] ✅ 证据 #{evidence_id} 已替换为完整画质: {image_path}")
+
+def evidence_cancel_reason(story_id, **payload):
+    """cancel_check of evidence jobs: stop when the story is gone or locked."""
+    # 与任务处理函数一样使用本模块的 app：job_queue 中登记的可能是另一次导入 app.py 得到的函数
+    with app.app_context():
+        story = Story.query.get(story_id)
+        if story is None:
+            return '故事已删除'
+        if story.current_state == 'locked' or '【已封贴】' in (story.title or ''):
+            return '故事已封贴'
+        return None
+
+register_job('ai_reply', delayed_ai_response)
+register_job('story_evidence', generate_evidence_for_story, cancel_check=evidence_cancel_reason)
+register_job('evidence_refine', refine_story_evidence, cancel_check=evidence_cancel_reason)
+
 if __name__ == '__main__':
-    # Start background scheduler for AI story generation
-    from scheduler_tasks import start_scheduler
-    scheduler = start_scheduler(app)
+    scheduler = None
+    # debug 模式的 reloader 会先启动一个只负责监视文件的父进程，后台服务只在真正处理请求的子进程里启动，
+    # 否则父进程的 worker 会抢走任务，把楼主回复推到子进程的 SSE 订阅者收不到的地方
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        # Start background scheduler for AI story generation
+        from scheduler_tasks import start_scheduler
+        scheduler = start_scheduler(app)
+        start_job_workers(app)
+        start_static_derivatives()
+        start_evidence_pool()
+        start_audio_bank()
+        start_view_counter(app)
     
     try:
         app.run(debug=True, port=5001)
     except (KeyboardInterrupt, SystemExit):
-        scheduler.shutdown()
+        if scheduler is not None:
+            scheduler.shutdown()
@@ -0,0 +1,36 @@
+"""Per-app lookup of the SQLAlchemy instance and the models defined in app.py.
+
+Background modules (job_queue, media_store, ...) must not reach the database
+through `from app import db, Job`. The documented start command is
+`python app.py`, which runs app.py as __main__. Importing `app` afterwards
+loads app.py a second time, with its own Flask app and SQLAlchemy instance.
+Using that instance under the __main__ app fails with "The current Flask app
+is not registered with this 'SQLAlchemy' instance".
+
+app.py registers its db and models on its own Flask app. Modules resolve them
+for the app they are running under:
+
+    db, Job = lookup('db', 'Job')                # the current app
+    db, Story = lookup('db', 'Story', app=app)   # a given app
+"""
+from flask import current_app
+
+EXTENSION = 'app_models'
+
+
+def register_models(app, db, *models):
+    """Make `db` and `models` available to lookup() under `app`."""
+    registry = {'db': db}
+    registry.update((model.__name__, model) for model in models)
+    app.extensions[EXTENSION] = registry
+
+
+def lookup(*names, app=None):
+    """The objects registered under `names` for `app` (default: the current app).
+
+    Returns a single object for one name, otherwise a tuple.
+    """
+    registry = (current_app if app is None else app).extensions[EXTENSION]
+    if len(names) == 1:
+        return registry[names[0]]
+    return tuple(registry[name] for name in names)
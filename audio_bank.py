@@ -0,0 +1,260 @@
+"""Precomputed layer bank and vectorised mixer for eerie evidence audio.
+
+generate_evidence_audio used to synthesise every clip from scratch. It rebuilt
+the time base with np.linspace, computed each sine/square layer in float64,
+ran lfilter over fresh white noise, and normalised the result. The layers only
+depend on a handful of random parameters, so they are rendered once instead.
+For every audio type the bank holds AUDIO_BANK_VARIANTS pre-rendered float32
+variants of each base layer (hum, breath, knocking, echo, flicker, hiss...),
+with parameters drawn from the same ranges as before.
+
+A clip picks one variant per layer. Each layer is added with a random gain
+from a random start offset (plain slices), into per-thread preallocated
+buffers. The sum is then resampled once at a random playback rate: a pitch
+shift of up to ±8%, linearly interpolated. Finally the usual rise-and-fade
+envelope with jitter is applied. That is a few vector passes per clip instead
+of a full synthesis.
+"""
+import os
+import threading
+
+import numpy as np
+
+SAMPLE_RATE = 22050
+DURATION = 2.0
+CLIP_SAMPLES = int(SAMPLE_RATE * DURATION)
+AUDIO_BANK_VARIANTS = int(os.getenv('AUDIO_BANK_VARIANTS', 4))
+
+PITCH_RANGE = (0.92, 1.08)
+GAIN_RANGE = (0.75, 1.25)
+OFFSET_SECONDS = 0.25
+# 每个层要覆盖最快读取速率下的一整段，再加上随机起点的余量
+LAYER_SAMPLES = int(CLIP_SAMPLES * PITCH_RANGE[1]) + int(SAMPLE_RATE * OFFSET_SECONDS) + 2
+
+# 原实现中走同一分支的音频类型
+ALIASES = {
+    'voice': 'strange_voice',
+    'knocking': 'rhythmic_pulse',
+    'static_whisper': 'wind_whisper',
+    'electrical_hum': 'flicker_buzz',
+}
+DEFAULT_TYPE = 'ambient_eerie'
+
+_local = threading.local()
+_bank = None
+_bank_lock = threading.Lock()
+_warm_thread = None
+
+
+def _buffer(name, shape, dtype=np.float32):
+    """Per-thread reusable buffer."""
+    buffers = getattr(_local, 'buffers', None)
+    if buffers is None:
+        buffers = _local.buffers = {}
+    buf = buffers.get(name)
+    if buf is None or buf.shape != shape or buf.dtype != dtype:
+        buf = buffers[name] = np.empty(shape, dtype=dtype)
+    return buf
+
+
+# ============================================
+# 基础层（每个变体在建库时渲染一次）
+# ============================================
+
+def _sine(freq, t):
+    return np.sin(2 * np.pi * freq * t)
+
+
+def _wobble(t, base, depth, speed):
+    # 与原实现一致：频率曲线直接乘 t（不是积分相位），听起来更不稳定
+    return _sine(base + depth * np.sin(2 * np.pi * speed * t), t)
+
+
+def _gate(freq, t):
+    """scipy.signal.square(2πft) * 0.5 + 0.5：每个周期前半段为 1，后半段为 0。"""
+    return ((freq * t) % 1.0 < 0.5).astype(np.float64)
+
+
+def _filtered_noise(rng, n, taps):
+    """White noise through the FIR filter lfilter(taps, [1]) that the old code used."""
+    noise = rng.normal(0, 1, n + len(taps) - 1)
+    return np.convolve(noise, taps, mode='valid')[:n] / sum(taps)
+
+
+def _hum(rng, t):
+    return 0.12 * _sine(rng.choice([70, 80, 90, 100, 110, 120]), t)
+
+
+def _moan(rng, t):
+    return 0.08 * _wobble(t, rng.choice([70, 80, 90, 100, 110, 120]), rng.integers(15, 35), rng.uniform(0.3, 0.8))
+
+
+def _breath(rng, t):
+    return 0.06 * _gate(rng.uniform(0.8, 1.5), t) * _sine(rng.integers(120, 200), t)
+
+
+def _knocking(rng, t):
+    # 低频敲击和高频响应共用同一个节奏包络
+    envelope = _gate(rng.uniform(1.0, 2.5), t)
+    low = rng.choice([60, 70, 80, 90, 100])
+    high = rng.choice([150, 180, 200, 250, 300])
+    return envelope * (0.15 * _sine(low, t) + 0.08 * _sine(high, t))
+
+
+def _rumble(rng, t):
+    return 0.06 * _filtered_noise(rng, len(t), [1, 1])
+
+
+def _hiss(rng, t):
+    return 0.08 * _filtered_noise(rng, len(t), [1, 2, 1])
+
+
+def _whisper(rng, t):
+    return 0.04 * _wobble(t, rng.choice([600, 700, 800, 900, 1000, 1100]),
+                          rng.integers(150, 300), rng.uniform(0.2, 0.5))
+
+
+def _echo(rng, t):
+    tone = 0.12 * _wobble(t, rng.choice([180, 200, 220, 240]), 20 + rng.integers(20, 40), rng.uniform(0.3, 0.5))
+    delay = int(rng.uniform(0.08, 0.15) * SAMPLE_RATE)
+    tone[delay:] += 0.35 * tone[:-delay]
+    return tone
+
+
+def _drone(rng, t):
+    return 0.08 * _sine(rng.choice([50, 55, 60, 65]), t)
+
+
+def _flicker(rng, t):
+    envelope = _gate(rng.uniform(2.5, 5.0), t)
+    buzz = 0.01 * _sine(rng.choice([110, 120, 130, 140]), t)
+    distortion = 0.04 * _sine(rng.choice([1500, 1800, 2000, 2500, 3000]), t)
+    return envelope * (buzz + distortion)
+
+
+def _low_buzz(rng, t):
+    return 0.12 * _sine(rng.choice([35, 40, 45, 50, 55]), t)
+
+
+def _screams(rng, t):
+    freqs = [[700, 1000, 1400], [600, 950, 1350], [750, 1100, 1500], [650, 1050, 1450]][rng.integers(4)]
+    envelope = _gate(rng.uniform(1.5, 3.0), t)
+    return 0.05 * envelope * sum(_sine(f, t) for f in freqs)
+
+
+def _pulse(rng, t):
+    return 0.08 * _gate(rng.uniform(1.2, 2.5), t) * _sine(rng.choice([100, 120, 150, 180]), t)
+
+
+LAYERS = {
+    'strange_voice': (_hum, _moan, _breath),
+    'rhythmic_pulse': (_knocking, _rumble),
+    'wind_whisper': (_hiss, _whisper),
+    'hollow_echo': (_echo, _drone),
+    'flicker_buzz': (_flicker,),
+    'ambient_eerie': (_low_buzz, _screams, _hiss, _pulse),
+}
+
+
+class AudioBank:
+    def __init__(self, variants=4, seed=None):
+        rng = np.random.default_rng(seed)
+        t = np.arange(LAYER_SAMPLES) / SAMPLE_RATE
+        # {audio_type: [[变体0, 变体1, ...] 每个层一组]}
+        self.layers = {
+            audio_type: [
+                [builder(rng, t).astype(np.float32) for _ in range(max(1, variants))]
+                for builder in builders
+            ]
+            for audio_type, builders in LAYERS.items()
+        }
+        # 包络：前半段 0.2 -> 0.95 渐强，后半段 0.95 -> 0.5 渐弱（后半段另加随机抖动）
+        half = CLIP_SAMPLES // 2
+        self.ramp = np.concatenate([
+            np.linspace(0.2, 0.95, half),
+            np.linspace(0.95, 0.5, CLIP_SAMPLES - half),
+        ]).astype(np.float32)
+        self.jitter = (0.08 * rng.normal(0, 1, CLIP_SAMPLES * 4)).astype(np.float32)
+        self.positions = np.arange(CLIP_SAMPLES, dtype=np.float32)
+
+    def nbytes(self):
+        layers = sum(v.nbytes for groups in self.layers.values() for group in groups for v in group)
+        return layers + self.ramp.nbytes + self.jitter.nbytes + self.positions.nbytes
+
+    def mix(self, audio_type, intensity=0.5, rng=None):
+        """Mix one clip. Returns a float32 buffer of CLIP_SAMPLES peaking at 0.85.
+
+        The buffer is reused by the next call on the same thread.
+        """
+        rng = rng or np.random.default_rng()
+        groups = self.layers.get(ALIASES.get(audio_type, audio_type)) or self.layers[DEFAULT_TYPE]
+        rate = rng.uniform(*PITCH_RANGE)
+        # 以 rate 倍速读取 span 个采样即得到一段 CLIP_SAMPLES 长、音高偏移后的音频
+        span = int(rate * (CLIP_SAMPLES - 1)) + 2
+
+        # 1) 各层按随机起点、随机增益叠加（连续切片，无需索引）
+        acc = _buffer('acc', (LAYER_SAMPLES,))[:span]
+        scaled = _buffer('scaled', (LAYER_SAMPLES,))[:span]
+        acc.fill(0.0)
+        for group in groups:
+            layer = group[rng.integers(len(group))]
+            start = rng.integers(LAYER_SAMPLES - span + 1)
+            np.multiply(layer[start:start + span], intensity * rng.uniform(*GAIN_RANGE), out=scaled)
+            acc += scaled
+
+        # 2) 整段重采样一次：相邻采样线性插值
+        out = _buffer('mix', (CLIP_SAMPLES,))
+        pos = _buffer('pos', (CLIP_SAMPLES,))
+        base = _buffer('base', (CLIP_SAMPLES,))
+        high = _buffer('high', (CLIP_SAMPLES,))
+        index = _buffer('index', (CLIP_SAMPLES,), np.intp)
+        np.multiply(self.positions, rate, out=pos)
+        np.floor(pos, out=base)
+        np.copyto(index, base, casting='unsafe')
+        pos -= base                                   # 小数部分
+        np.take(acc, index, out=out, mode='clip')
+        index += 1
+        np.take(acc, index, out=high, mode='clip')
+        high -= out
+        high *= pos
+        out += high
+
+        envelope = _buffer('envelope', (CLIP_SAMPLES,))
+        np.copyto(envelope, self.ramp)
+        half = CLIP_SAMPLES // 2
+        start = rng.integers(len(self.jitter) - CLIP_SAMPLES)
+        envelope[half:] += self.jitter[start:start + CLIP_SAMPLES - half]
+        out *= envelope
+
+        # 规范化音量（防止失真）- 保持微妙
+        peak = float(np.abs(out).max())
+        if peak > 0:
+            out *= 0.85 / peak
+        return out
+
+
+def get_bank():
+    """The process-wide bank, built on first use."""
+    global _bank
+    if _bank is None:
+        with _bank_lock:
+            if _bank is None:
+                _bank = AudioBank(AUDIO_BANK_VARIANTS)
+                print(f"[audio_bank] ✅ 音频层库已生成: {_bank.nbytes() / 1024 / 1024:.1f}MB")
+    return _bank
+
+
+def render_pcm16(audio_type, intensity=0.5, rng=None):
+    """One clip of `audio_type` as 16-bit PCM samples at SAMPLE_RATE."""
+    clip = get_bank().mix(audio_type, intensity, rng)
+    return (clip * 32767).astype(np.int16)
+
+
+def start_audio_bank():
+    """Build the bank once per process in a background thread."""
+    global _warm_thread
+    with _bank_lock:
+        if _warm_thread is not None or _bank is not None:
+            return
+        _warm_thread = threading.Thread(target=get_bank, daemon=True, name='audio-bank')
+        _warm_thread.start()
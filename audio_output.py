@@ -0,0 +1,120 @@
+"""Compact in-process encoding for generated evidence audio.
+
+generate_evidence_audio used to write every clip as uncompressed 16-bit WAV,
+about 88KB for 2 s. Its fallback piped through pydub to an ffmpeg process to
+produce MP3. Clips are now encoded in-process through libsndfile (the
+soundfile package), which bundles the LAME, Vorbis and Opus encoders, so no
+external process is spawned per clip:
+
+    mp3   MPEG layer III, VBR                 ~9KB per clip, plays everywhere (default)
+    ogg   Ogg Vorbis                          ~13KB
+    opus  Ogg Opus, resampled to 24kHz        ~6KB, not supported by older Safari
+    wav   uncompressed 16-bit PCM             ~88KB
+
+AUDIO_COMPRESSION is libsndfile's compression level from 0 to 1 (higher means
+a lower bitrate). When it is unset, each codec uses its own default. Without
+soundfile, or when the installed libsndfile lacks the codec, clips are
+written as WAV with the standard library instead.
+"""
+import os
+import threading
+import wave
+
+import numpy as np
+
+import media_store
+
+AUDIO_FORMAT = os.getenv('AUDIO_FORMAT', 'mp3').lower()
+AUDIO_COMPRESSION = os.getenv('AUDIO_COMPRESSION', '')
+
+# 格式 -> (扩展名, libsndfile 容器, 编码, 默认压缩等级, 编码采样率（None 表示保持原采样率）)
+FORMATS = {
+    'mp3': ('.mp3', 'MP3', 'MPEG_LAYER_III', 0.8, None),
+    'ogg': ('.ogg', 'OGG', 'VORBIS', 0.8, None),
+    # Opus 只支持 8/12/16/24/48kHz
+    'opus': ('.opus', 'OGG', 'OPUS', 0.95, 24000),
+}
+MIMETYPES = {
+    '.mp3': 'audio/mpeg',
+    '.ogg': 'audio/ogg',
+    '.opus': 'audio/ogg; codecs=opus',
+    '.wav': 'audio/wav',
+}
+
+_lock = threading.Lock()
+_stats = {'clips': 0, 'bytes': 0, 'fallbacks': 0}
+_warned = set()
+
+
+def _resample(samples, rate, target):
+    """Linear-interpolation resample of int16 samples from `rate` to `target`."""
+    if rate == target:
+        return samples
+    positions = np.arange(int(len(samples) * target / rate)) * (rate / target)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.int16)
+
+
+def _write_wav(filepath, samples, sample_rate):
+    with wave.open(filepath, 'wb') as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes(np.ascontiguousarray(samples, dtype='<i2').tobytes())
+
+
+def _codec(fmt):
+    """(soundfile module, FORMATS entry) for `fmt`, or None when it cannot be encoded here."""
+    spec = FORMATS.get(fmt)
+    if spec is None:
+        return None
+    try:
+        import soundfile
+    except ImportError:
+        return None
+    if not soundfile.check_format(spec[1], spec[2]):
+        return None
+    return soundfile, spec
+
+
+def save_clip(samples, sample_rate, stem):
+    """Encode int16 mono `samples` into a new sharded media file named `stem` + extension.
+
+    Returns (filepath, url). The caller registers the file with media_store.
+    """
+    codec = _codec(AUDIO_FORMAT) if AUDIO_FORMAT != 'wav' else None
+    if codec is None:
+        if AUDIO_FORMAT != 'wav' and AUDIO_FORMAT not in _warned:
+            _warned.add(AUDIO_FORMAT)
+            print(f"[audio_output] ⚠️ 无法编码 {AUDIO_FORMAT}（未安装 soundfile 或 libsndfile 不支持），改为保存 WAV")
+        filepath, url = media_store.allocate(stem + '.wav')
+        _write_wav(filepath, samples, sample_rate)
+        fallback = AUDIO_FORMAT != 'wav'
+    else:
+        soundfile, (extension, container, subtype, default_level, encode_rate) = codec
+        level = float(AUDIO_COMPRESSION) if AUDIO_COMPRESSION else default_level
+        if encode_rate:
+            samples = _resample(samples, sample_rate, encode_rate)
+            sample_rate = encode_rate
+        filepath, url = media_store.allocate(stem + extension)
+        options = {'bitrate_mode': 'VARIABLE'} if container == 'MP3' else {}
+        soundfile.write(filepath, samples, sample_rate, format=container, subtype=subtype,
+                        compression_level=level, **options)
+        fallback = False
+    with _lock:
+        _stats['clips'] += 1
+        _stats['bytes'] += os.path.getsize(filepath)
+        _stats['fallbacks'] += fallback
+    return filepath, url
+
+
+def mimetype_for(path):
+    """Explicit Content-Type for audio files, or None to let Flask guess."""
+    return MIMETYPES.get(os.path.splitext(path)[1].lower())
+
+
+def stats():
+    with _lock:
+        stats = dict(_stats)
+    stats['format'] = AUDIO_FORMAT
+    stats['avg_kb'] = round(stats['bytes'] / stats['clips'] / 1024, 1) if stats['clips'] else None
+    return stats
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Microbenchmark: audio_bank mixing vs. the previous per-clip synthesis.
+
+Synthesises 2 s evidence clips for every audio type, once the way
+generate_evidence_audio used to (linspace time base, float64 layers, lfilter
+over fresh noise) and once through audio_bank's precomputed layers. Reports
+the time per clip, the one-off bank build time and its size.
+
+    python bench_audio_bank.py [--clips 200]
+"""
+import argparse
+import time
+
+import numpy as np
+from scipy import signal
+
+from audio_bank import AudioBank, AUDIO_BANK_VARIANTS, SAMPLE_RATE, DURATION
+
+AUDIO_TYPES = ['strange_voice', 'rhythmic_pulse', 'wind_whisper', 'hollow_echo', 'flicker_buzz', 'ambient_eerie']
+
+
+# ============================================
+# 旧实现（每段音频从头合成），仅用于对照
+# ============================================
+
+def legacy_clip(audio_type, intensity=0.5):
+    t = np.linspace(0, DURATION, int(SAMPLE_RATE * DURATION))
+    if audio_type == 'strange_voice':
+        base_freq = np.random.choice([70, 80, 90, 100, 110, 120])
+        layer1 = 0.12 * intensity * np.sin(2 * np.pi * base_freq * t)
+        freq_modulation = base_freq + np.random.randint(15, 35) * np.sin(2 * np.pi * np.random.uniform(0.3, 0.8) * t)
+        layer2 = 0.08 * intensity * np.sin(2 * np.pi * freq_modulation * t)
+        breath_env = signal.square(2 * np.pi * np.random.uniform(0.8, 1.5) * t) * 0.5 + 0.5
+        layer3 = 0.06 * intensity * breath_env * np.sin(2 * np.pi * np.random.randint(120, 200) * t)
+        audio_data = layer1 + layer2 + layer3
+    elif audio_type == 'rhythmic_pulse':
+        pulse_envelope = signal.square(2 * np.pi * np.random.uniform(1.0, 2.5) * t) * 0.5 + 0.5
+        layer1 = 0.15 * intensity * pulse_envelope * np.sin(2 * np.pi * np.random.choice([60, 70, 80, 90, 100]) * t)
+        layer2 = 0.08 * intensity * pulse_envelope * np.sin(2 * np.pi * np.random.choice([150, 180, 200, 250, 300]) * t)
+        white_noise = signal.lfilter([1, 1], [1], 0.06 * intensity * np.random.normal(0, 1, len(t))) / 2
+        audio_data = layer1 + layer2 + white_noise
+    elif audio_type == 'wind_whisper':
+        wind_noise = signal.lfilter([1, 2, 1], [1, 0, 0], 0.08 * intensity * np.random.normal(0, 1, len(t))) / 4
+        freq_modulation = np.random.choice([600, 700, 800, 900, 1000, 1100]) + \
+            np.random.randint(150, 300) * np.sin(2 * np.pi * np.random.uniform(0.2, 0.5) * t)
+        audio_data = wind_noise + 0.04 * intensity * np.sin(2 * np.pi * freq_modulation * t)
+    elif audio_type == 'hollow_echo':
+        base_freq_mod = np.random.choice([180, 200, 220, 240]) + \
+            (20 + np.random.randint(20, 40)) * np.sin(2 * np.pi * np.random.uniform(0.3, 0.5) * t)
+        layer1 = 0.12 * intensity * np.sin(2 * np.pi * base_freq_mod * t)
+        delay_samples = int(np.random.uniform(0.08, 0.15) * SAMPLE_RATE)
+        layer2 = np.zeros_like(t)
+        layer2[delay_samples:] = 0.06 * intensity * layer1[:-delay_samples]
+        layer3 = 0.08 * intensity * np.sin(2 * np.pi * np.random.choice([50, 55, 60, 65]) * t)
+        audio_data = layer1 + layer2 + layer3
+    elif audio_type == 'flicker_buzz':
+        buzz = 0.12 * intensity * np.sin(2 * np.pi * np.random.choice([110, 120, 130, 140]) * t)
+        flicker_env = signal.square(2 * np.pi * np.random.uniform(2.5, 5.0) * t) * 0.5 + 0.5
+        layer3 = 0.04 * intensity * np.sin(2 * np.pi * np.random.choice([1500, 1800, 2000, 2500, 3000]) * t) * flicker_env
+        audio_data = 0.08 * intensity * flicker_env * buzz + layer3
+    else:
+        low_freq_buzz = 0.12 * intensity * np.sin(2 * np.pi * np.random.choice([35, 40, 45, 50, 55]) * t)
+        screams = np.zeros_like(t)
+        scream_speed = np.random.uniform(1.5, 3.0)
+        for freq in [700, 1000, 1400]:
+            envelope = signal.square(2 * np.pi * scream_speed * t) * 0.5 + 0.5
+            screams += 0.05 * intensity * envelope * np.sin(2 * np.pi * freq * t)
+        white_noise = signal.lfilter([1, 2, 1], [1, 0, 0], 0.08 * intensity * np.random.normal(0, 1, len(t))) / 4
+        pulse_envelope = signal.square(2 * np.pi * np.random.uniform(1.2, 2.5) * t) * 0.5 + 0.5
+        pulse = 0.08 * intensity * pulse_envelope * np.sin(2 * np.pi * np.random.choice([100, 120, 150, 180]) * t)
+        audio_data = low_freq_buzz + screams + white_noise + pulse
+
+    envelope = np.ones_like(t)
+    mid_point = len(envelope) // 2
+    envelope[:mid_point] = np.linspace(0.2, 0.95, mid_point)
+    envelope[mid_point:] = np.linspace(0.95, 0.5, len(envelope) - mid_point)
+    envelope[mid_point:] += 0.08 * np.random.normal(0, 1, len(envelope) - mid_point)
+    audio_data *= envelope
+    audio_data = (audio_data / np.max(np.abs(audio_data))) * 0.85
+    return np.int16(audio_data * 32767)
+
+
+def time_per_clip(make, clips):
+    for audio_type in AUDIO_TYPES:  # 预热
+        make(audio_type)
+    started = time.perf_counter()
+    for i in range(clips):
+        make(AUDIO_TYPES[i % len(AUDIO_TYPES)])
+    return (time.perf_counter() - started) / clips
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clips', type=int, default=200)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    bank = AudioBank(AUDIO_BANK_VARIANTS)
+    build = time.perf_counter() - started
+    rng = np.random.default_rng()
+
+    legacy = time_per_clip(legacy_clip, args.clips)
+    mixed = time_per_clip(lambda audio_type: (bank.mix(audio_type, 0.5, rng) * 32767).astype(np.int16), args.clips)
+
+    print(f"bank build: {build * 1000:.0f} ms, {bank.nbytes() / 1024 / 1024:.1f} MB "
+          f"({AUDIO_BANK_VARIANTS} variants per layer)")
+    print(f"legacy synthesis: {legacy * 1e6:8.0f} us/clip")
+    print(f"audio_bank mix:   {mixed * 1e6:8.0f} us/clip  ({legacy / mixed:.1f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
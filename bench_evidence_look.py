@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Microbenchmark: fused evidence look vs. the previous ImageEnhance chain.
+
+Post-processes a 512x512 test image the way generate_evidence_image does for
+Stable Diffusion output (colour, brightness, contrast, sharpness, noise,
+timestamp/REC text), once with the legacy PIL chain below and once with
+evidence_look.DIFFUSION_LOOK. Each variant runs in its own subprocess and
+reports its tracemalloc peak next to the per-image time: the largest amount of
+memory allocated at once through Python and NumPy over its first three images,
+including buffers it keeps between images. Pillow's own image buffers are not
+traced. Also reports the largest pixel difference between the two outputs
+(without noise).
+
+    python bench_evidence_look.py [--images 50]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageEnhance
+
+from evidence_look import DIFFUSION_LOOK, EvidenceLook, surveillance_overlays
+
+WHEN = datetime(2024, 10, 31, 23, 59, 59)
+
+
+def sample_image(seed=0):
+    """Smooth gradient plus texture, roughly like a dark diffusion output."""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:512, 0:512].astype(np.float32)
+    base = np.stack([40 + xx / 6, 35 + yy / 7, 50 + (xx + yy) / 12], axis=-1)
+    base += rng.normal(0, 12, base.shape)
+    return Image.fromarray(np.clip(base, 0, 255).astype(np.uint8), 'RGB')
+
+
+# ============================================
+# 旧实现（四次 ImageEnhance + float64 噪点 + ImageDraw），仅用于对照
+# ============================================
+
+def legacy_look(image, noise=True):
+    image = ImageEnhance.Color(image).enhance(0.85)
+    image = ImageEnhance.Brightness(image).enhance(0.85)
+    image = ImageEnhance.Contrast(image).enhance(1.15)
+    image = ImageEnhance.Sharpness(image).enhance(1.1)
+    if noise:
+        img_array = np.array(image)
+        img_array = np.clip(img_array + np.random.normal(0, 3, img_array.shape), 0, 255).astype(np.uint8)
+        image = Image.fromarray(img_array)
+    draw = ImageDraw.Draw(image)
+    draw.text((340, 480), WHEN.strftime('%Y/%m/%d %H:%M:%S'), fill=(220, 220, 220))
+    draw.text((10, 10), "REC ●", fill=(200, 0, 0))
+    return image
+
+
+def fused_look(image):
+    return DIFFUSION_LOOK.render(image, overlays=surveillance_overlays(WHEN))
+
+
+def run_case(name, images):
+    """Runs inside the child process; prints one JSON line."""
+    fn = {'legacy': legacy_look, 'fused': fused_look}[name]
+    source = sample_image()
+    source.load()
+    # 样图在开始追踪前构造，峰值只包含被测代码的分配（含首次调用分配的缓冲区）
+    tracemalloc.start()
+    for _ in range(3):
+        fn(source)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    # 计时单独进行，不受 tracemalloc 的开销影响
+    start = time.perf_counter()
+    for _ in range(images):
+        fn(source)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'ms_per_image': elapsed * 1000 / images, 'peak_traced_kb': peak / 1024}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=50)
+    parser.add_argument('--case', choices=['legacy', 'fused'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        run_case(args.case, args.images)
+        return
+
+    source = sample_image()
+    noiseless = EvidenceLook(color=0.85, brightness=0.85, contrast=1.15, sharpness=1.1)
+    diff = np.abs(
+        np.asarray(legacy_look(source, noise=False), dtype=np.int16)
+        - np.asarray(noiseless.render(source, overlays=surveillance_overlays(WHEN)), dtype=np.int16)
+    )
+    print(f"512x512, {args.images} 张/组；无噪点时与旧实现的像素差: 最大 {diff.max()}, 平均 {diff.mean():.2f}")
+
+    results = {}
+    for name in ('legacy', 'fused'):
+        output = subprocess.run(
+            [sys.executable, __file__, '--case', name, '--images', str(args.images)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results[name] = json.loads(output.strip().splitlines()[-1])
+        print(f"{name:8s} {results[name]['ms_per_image']:7.2f} ms/张  "
+              f"峰值内存分配 {results[name]['peak_traced_kb'] / 1024:6.1f} MB")
+
+    old, new = results['legacy']['ms_per_image'], results['fused']['ms_per_image']
+    print(f"加速 x{old / new if new else float('inf'):.2f}")
+
+
+if __name__ == '__main__':
+    main()
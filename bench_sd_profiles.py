@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Benchmark: Stable Diffusion CPU profiles (SD_PROFILE) side by side.
+
+Loads DIFFUSION_MODEL once per profile in a fresh subprocess, renders one
+warm-up image and then --images evidence-sized (512x512) images with the
+profile's step count. Prints load time, seconds per image and peak RSS per
+profile. The rendered images are written to static/generated/bench_<profile>_N.png
+so the quality can be compared by eye.
+
+    python bench_sd_profiles.py [--images 3] [--profiles default cpu-fast]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+PROMPT = ("old surveillance camera footage, empty subway train interior at night, "
+          "flickering fluorescent lights, grainy, found footage")
+NEGATIVE_PROMPT = "cartoon, anime, painting, illustration, text, watermark"
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def run_profile(profile, images):
+    """Runs inside the child process; prints one JSON line."""
+    from sd_pipeline import DiffusionPipelineManager, PROFILES
+
+    model_id = os.getenv('DIFFUSION_MODEL', 'runwayml/stable-diffusion-v1-5')
+    manager = DiffusionPipelineManager(idle_ttl=0, profile=profile)
+    steps = manager.inference_steps(20)
+
+    def render(seed):
+        import torch
+        with manager.pipeline(model_id) as pipe:
+            return pipe(PROMPT, negative_prompt=NEGATIVE_PROMPT, num_inference_steps=steps,
+                        guidance_scale=8.5, height=512, width=512,
+                        generator=torch.Generator().manual_seed(seed)).images[0]
+
+    render(0)  # 预热：加载模型 + 第一次推理
+    load_seconds = manager.stats()['last_load_seconds']
+    os.makedirs('static/generated', exist_ok=True)
+    start = time.perf_counter()
+    for i in range(images):
+        render(i + 1).save(f'static/generated/bench_{profile}_{i}.png')
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        'steps': steps,
+        'applied': manager.stats()['applied'],
+        'load_seconds': load_seconds,
+        'seconds_per_image': elapsed / images,
+        'peak_rss_mb': peak_rss_mb(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=3)
+    parser.add_argument('--profiles', nargs='+', default=['default', 'cpu-fast'])
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_profile(args.child, args.images)
+        return
+
+    try:
+        import diffusers  # noqa: F401
+        import torch
+    except ImportError as e:
+        print(f"需要安装 torch 和 diffusers: {e}")
+        return
+    if torch.cuda.is_available():
+        print("⚠️ 检测到 GPU：SD_PROFILE 只影响 CPU 推理，GPU 上各配置结果相同")
+
+    results = {}
+    for profile in args.profiles:
+        print(f"运行 {profile} ...", flush=True)
+        proc = subprocess.run(
+            [sys.executable, __file__, '--child', profile, '--images', str(args.images)],
+            capture_output=True, text=True, env=dict(os.environ, SD_PROFILE=profile)
+        )
+        if proc.returncode != 0:
+            print(f"  {profile} 失败:\n{proc.stderr[-2000:]}")
+            continue
+        results[profile] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    print(f"\n{'profile':10s} {'步数':>4s} {'加载(s)':>8s} {'s/张':>8s} {'峰值RSS(MB)':>12s}  设置")
+    for profile, r in results.items():
+        print(f"{profile:10s} {r['steps']:>4d} {r['load_seconds']:>8.1f} {r['seconds_per_image']:>8.1f} "
+              f"{r['peak_rss_mb']:>12.0f}  {', '.join(r['applied']) or 'stock'}")
+    if 'default' in results and 'cpu-fast' in results:
+        speedup = results['default']['seconds_per_image'] / results['cpu-fast']['seconds_per_image']
+        print(f"\ncpu-fast 相对 default: x{speedup:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Benchmark: /api/stories page queries, aggregate counts vs. relationship loading.
+
+Fills a throwaway SQLite database with --stories stories and 10, 10k and 1M
+comments (plus one evidence row per ten comments) spread evenly over them.
+It then builds the first page twice:
+- the way get_stories used to: Story.query.count(), paginate() and
+  len(s.comments) / len(s.evidence), which lazy-loads both relationships;
+- through story_list_query(), with its correlated COUNT subqueries.
+For each, it reports the SQL statements per page and the latency.
+
+    python bench_story_list.py [--comments 10,10000,1000000] [--stories 200] [--repeat 10]
+"""
+import argparse
+import atexit
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_db_dir = tempfile.mkdtemp(prefix='bench_story_list_')
+atexit.register(shutil.rmtree, _db_dir, True)
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_db_dir, 'bench.db')
+
+from sqlalchemy import event
+
+from app import app, db, Story, Comment, Evidence, story_list_query
+
+PER_PAGE = 10
+
+
+def _summary(s, comments_count, evidence_count):
+    return {
+        'id': s.id,
+        'title': s.title,
+        'content': s.content[:200] + '...' if len(s.content) > 200 else s.content,
+        'current_state': s.current_state,
+        'created_at': s.created_at.isoformat(),
+        'views': s.views,
+        'comments_count': comments_count,
+        'evidence_count': evidence_count,
+    }
+
+
+def legacy_page(page=1):
+    """The previous get_stories body."""
+    total = Story.query.count()
+    pagination = Story.query.order_by(Story.created_at.desc()).paginate(page=page, per_page=PER_PAGE, error_out=False)
+    return total, [_summary(s, len(s.comments), len(s.evidence)) for s in pagination.items]
+
+
+def aggregate_page(page=1):
+    """The current get_stories body."""
+    pagination = story_list_query().paginate(page=page, per_page=PER_PAGE, error_out=False, count=False)
+    pagination.total = db.session.query(db.func.count(Story.id)).scalar()
+    return pagination.total, [_summary(*row) for row in pagination.items]
+
+
+def fill(stories, comments):
+    db.drop_all()
+    db.create_all()
+    now = datetime.utcnow()
+    connection = db.session.connection()
+    connection.execute(Story.__table__.insert(), [
+        {'title': f'怪谈 {i}', 'content': '深夜的地铁车厢里只剩下我一个人。' * 20, 'category': 'subway_ghost',
+         'location': '地铁站', 'current_state': 'unfolding', 'views': 0,
+         'created_at': now - timedelta(minutes=i), 'updated_at': now}
+        for i in range(stories)
+    ])
+    rng = random.Random(47)
+    batch = 50000
+    for start in range(0, comments, batch):
+        connection.execute(Comment.__table__.insert(), [
+            {'content': '我也在这一站见过', 'story_id': 1 + (start + i) % stories,
+             'is_ai_response': rng.random() < 0.3, 'created_at': now}
+            for i in range(min(batch, comments - start))
+        ])
+    connection.execute(Evidence.__table__.insert(), [
+        {'story_id': 1 + i % stories, 'evidence_type': 'image',
+         'file_path': f'/static/generated/00/00/evidence_{i}.png', 'description': '可疑照片', 'created_at': now}
+        for i in range(max(1, comments // 10))
+    ])
+    db.session.commit()
+
+
+def measure(build, repeat):
+    statements = []
+    listener = lambda *args: statements.append(1)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        db.session.remove()
+        build()
+        per_page = len(statements)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            db.session.remove()  # 每次都从空会话开始，和请求一致
+            result = build()
+        elapsed = (time.perf_counter() - started) / repeat
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    return per_page, elapsed, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--comments', default='10,10000,1000000')
+    parser.add_argument('--stories', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    with app.app_context():
+        print(f"{'comments':>10} {'':12} {'queries':>8} {'ms/page':>10}")
+        for comments in [int(n) for n in args.comments.split(',')]:
+            fill(args.stories, comments)
+            legacy_queries, legacy, expected = measure(legacy_page, args.repeat)
+            queries, elapsed, result = measure(aggregate_page, args.repeat)
+            assert result == expected, '计数结果与旧实现不一致'
+            print(f"{comments:>10} {'legacy':12} {legacy_queries:>8} {legacy * 1000:>10.2f}")
+            print(f"{'':>10} {'aggregate':12} {queries:>8} {elapsed * 1000:>10.2f}  ({legacy / elapsed:.1f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Microbenchmark: compiled text filters vs. the previous per-pattern implementation.
+
+Runs post_process_story_text / filter_dialogue_and_horror over every stored
+story title, story body and comment, checks that the output is identical to
+the legacy implementation below, and prints the timings.
+
+    python bench_text_filters.py [--repeat 20]
+"""
+import argparse
+import os
+import re
+import time
+
+# 基准测试不应调用 LM Studio（convert_to_simplified 的回退路径）
+os.environ['LM_STUDIO_URL'] = ''
+
+import ai_engine
+from ai_engine import convert_to_simplified, filter_dialogue_and_horror, post_process_story_text
+
+
+# ============================================
+# 旧实现（逐个 re.sub / str.replace），仅用于对照
+# ============================================
+
+def legacy_filter_dialogue_and_horror(text):
+    if not text:
+        return text
+    try:
+        text = re.sub(r'\*[^*]*\*', '', text)
+        text = re.sub(r'\([^)]*\)', '', text)
+        text = re.sub(r'（[^）]*）', '', text)
+        text = re.sub(r'\[[^]]*\]', '', text)
+        text = re.sub(r'[^。！？]*[说道讲]：[^。！？]*[。！？]?', '', text)
+        text = re.sub(r'，[说道]：.*?$', '。', text, flags=re.MULTILINE)
+        text = re.sub(r'[他她我店主老板][^。！？]*[说道]：[^。！？]*', '', text)
+        text = re.sub(r'我说。', '', text)
+        text = re.sub(r'他说。', '', text)
+        text = re.sub(r'她说。', '', text)
+        text = re.sub(r'[他她我][^。！？]*[说道讲]，', '，', text)
+        text = re.sub(r'，[^。！？]*[说道讲]，', '，', text)
+        horror_replacements = {
+            '鬼使神差': '不知怎么', '惊魂': '不安', '鬼': '那种感觉',
+            '恐怖': '不舒服', '可怕': '让人不安', '血腥': '红色的东西',
+            '死亡': '出事', '尸体': '躺着不动的', '邪恶': '不对劲',
+            '魔鬼': '说不出的东西', '诅咒': '不好的感觉', '地狱': '很糟糕的地方',
+            '吓人': '让人紧张', '恶心': '不太舒服'
+        }
+        for old, new in horror_replacements.items():
+            text = text.replace(old, new)
+        text = re.sub(r'[。！？]{2,}', '。', text)
+        text = re.sub(r'\s+', ' ', text)
+        return text.strip()
+    except Exception:
+        return text
+
+
+def legacy_post_process_story_text(text):
+    if not text:
+        return text
+    cleaned = text
+    for pat in [r'\([^\)]*\)', r'\（[^\）]*\）', r'\[[^\]]*\]', r'\{[^\}]*\}']:
+        cleaned = re.sub(pat, '', cleaned)
+    stage_triggers = ['动作', '镜头', '画面', '拍摄', '旁白', '场景', '注：', '说明：']
+    filtered_lines = []
+    for ln in cleaned.splitlines():
+        strip_ln = ln.strip()
+        if not strip_ln:
+            continue
+        if any(trig in strip_ln for trig in stage_triggers):
+            continue
+        if re.match(r'^[\-\*•\s]{0,3}$', strip_ln):
+            continue
+        filtered_lines.append(ln)
+    cleaned = '\n'.join(filtered_lines).strip()
+    cleaned = re.sub(r'\n{2,}', '\n\n', cleaned)
+    cleaned = re.sub(r'\s{2,}', ' ', cleaned).strip()
+    cleaned = re.sub(r'“[^”]*”', '', cleaned)
+    cleaned = re.sub(r'『[^』]*』', '', cleaned)
+    cleaned = re.sub(r'「[^」]*」', '', cleaned)
+    cleaned = re.sub(r'"[^\"]*"', '', cleaned)
+    cleaned = re.sub(r"'[^']*'", '', cleaned)
+    cleaned = cleaned.replace('“', '').replace('”', '').replace('「', '').replace('」', '').replace('『', '').replace('』', '')
+    cleaned = cleaned.replace('\"', '"').replace("\'", "'")
+    if '我' not in cleaned:
+        cleaned = re.sub(r'([。！？\n]|^)\s*(他|她|他们|她们|它|它们)\s+', r'\1我', cleaned)
+        cleaned = re.sub(r'^(他|她|它)', '我', cleaned)
+        cleaned = re.sub(r'(他|她|它)(看到|听到|发现|经历|遇到|感觉|觉得)', r'我\2', cleaned)
+        if '我' not in cleaned and len(cleaned) > 30:
+            cleaned = '我发帖求助，最近遇到一件怪事：' + cleaned
+    explicit_horror_map = {
+        '鬼': '那种东西', '鬼魂': '某种存在', '幽灵': '看不见的东西',
+        '诅咒': '不好的感觉', '恶魔': '不对劲的东西', '怪物': '说不出的东西',
+        '血腥': '红色的', '死亡': '不在了', '尸体': '躺着的人',
+        '恐怖': '不安', '可怕': '让人不舒服', '惊悚': '紧张',
+        '阴森': '安静得有点怪', '邪恶': '不对劲', '恶心': '不太舒服',
+        '血液': '红色液体', '死人': '没有反应的人', '杀害': '出事了',
+        '魔鬼': '不好的东西', '灵异': '说不清的', '超自然': '无法解释的'
+    }
+    for explicit, implicit in explicit_horror_map.items():
+        cleaned = cleaned.replace(explicit, implicit)
+    for word in ['极其', '非常可怕', '十分恐怖', '异常恐怖', '极度', '超级']:
+        cleaned = cleaned.replace(word, '有点')
+    cleaned = convert_to_simplified(cleaned)
+    return legacy_filter_dialogue_and_horror(cleaned)
+
+
+def load_corpus():
+    from app import app, Story, Comment
+    with app.app_context():
+        texts = []
+        for story in Story.query.all():
+            texts.extend([story.title or '', story.content or ''])
+        texts.extend(c.content or '' for c in Comment.query.all())
+    return [t for t in texts if t]
+
+
+def bench(fn, corpus, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in corpus:
+            fn(text)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    if not corpus:
+        print("数据库里没有故事或评论，先启动一次 app.py 生成默认数据")
+        return
+    print(f"语料: {len(corpus)} 段文本, {sum(map(len, corpus))} 字符, 重复 {args.repeat} 次")
+    if not ai_engine._opencc:
+        print("  (未安装 OpenCC，convert_to_simplified 原样返回)")
+
+    cases = [
+        ('post_process_story_text', legacy_post_process_story_text, post_process_story_text),
+        ('filter_dialogue_and_horror', legacy_filter_dialogue_and_horror, filter_dialogue_and_horror),
+    ]
+    for name, legacy, current in cases:
+        mismatches = sum(1 for t in corpus if legacy(t) != current(t))
+        old = bench(legacy, corpus, args.repeat)
+        new = bench(current, corpus, args.repeat)
+        print(f"{name:28s} 旧 {old * 1000:8.1f} ms  新 {new * 1000:8.1f} ms  "
+              f"x{old / new if new else float('inf'):.2f}  输出不一致: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
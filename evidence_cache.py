@@ -0,0 +1,208 @@
+"""Prompt-keyed cache for raw Stable Diffusion evidence images.
+
+Evidence for a story is often regenerated from practically the same inputs,
+e.g. when daily_story_refresh reseeds the starter stories. The model, the
+final prompt, the negative prompt, steps, guidance scale, size and seed are
+hashed into a render key. The seed is derived from the prompts, so the same
+inputs always produce the same key. The raw diffusion output is stored
+content-addressed under EVIDENCE_CACHE_DIR/<sha[:2]>/<sha>.png, and the
+EvidenceRenderCache table maps render keys to content hashes. A repeated key
+returns the stored image instead of running diffusion. Optionally a cheap
+variation (mirror, slight crop) is applied; the evidence look with fresh noise
+and timestamp is applied afterwards as usual.
+
+The store is bounded by EVIDENCE_CACHE_MAX_MB. Least recently used keys are
+evicted first, and a file is deleted once no key points at it.
+"""
+import hashlib
+import io
+import os
+import random
+import threading
+from datetime import datetime
+
+from PIL import Image, ImageOps
+
+from app_models import lookup
+
+EVIDENCE_CACHE_ENABLED = os.getenv('EVIDENCE_CACHE_ENABLED', 'true').lower() == 'true'
+EVIDENCE_CACHE_DIR = os.getenv('EVIDENCE_CACHE_DIR', 'evidence_cache')
+EVIDENCE_CACHE_MAX_MB = float(os.getenv('EVIDENCE_CACHE_MAX_MB', 512))
+# 命中缓存时随机镜像/轻微裁切，避免同一张图原样出现在多个帖子里
+EVIDENCE_CACHE_VARIATION = os.getenv('EVIDENCE_CACHE_VARIATION', 'true').lower() == 'true'
+
+
+def prompt_seed(prompt, negative_prompt):
+    """Deterministic 31-bit seed for a prompt pair."""
+    digest = hashlib.sha256(f"{prompt}\0{negative_prompt}".encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big') & 0x7FFFFFFF
+
+
+def render_key(model_id, prompt, negative_prompt, steps, guidance_scale, size, seed):
+    digest = hashlib.sha256()
+    for part in (model_id, prompt, negative_prompt, steps, guidance_scale, size, seed):
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def vary(image, rng=None):
+    """Cheap variation of a cached image: random mirror and a 0-6% crop-zoom."""
+    rng = rng or random
+    if rng.random() < 0.5:
+        image = ImageOps.mirror(image)
+    crop = rng.uniform(0.0, 0.06)
+    if crop > 0.005:
+        width, height = image.size
+        dx, dy = int(width * crop), int(height * crop)
+        left, top = rng.randint(0, dx), rng.randint(0, dy)
+        image = image.crop((left, top, left + width - dx, top + height - dy)).resize(
+            (width, height), Image.Resampling.LANCZOS)
+    return image
+
+
+class EvidenceImageCache:
+    def __init__(self, root='evidence_cache', max_bytes=512 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'errors': 0}
+
+    def _path(self, content_hash):
+        return os.path.join(self.root, content_hash[:2], content_hash + '.png')
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key):
+        """Stored image for `key`, or None. Must run inside an app context."""
+        db, EvidenceRenderCache = lookup('db', 'EvidenceRenderCache')
+        try:
+            row = EvidenceRenderCache.query.filter_by(cache_key=key).first()
+            if row is None:
+                self._count('misses')
+                return None
+            path = self._path(row.content_hash)
+            if not os.path.exists(path):
+                # 文件被手动删除：丢弃这条记录，按未命中处理
+                db.session.delete(row)
+                db.session.commit()
+                self._count('misses')
+                return None
+            with Image.open(path) as stored:
+                image = stored.convert('RGB')
+            row.hits = (row.hits or 0) + 1
+            row.last_used_at = datetime.utcnow()
+            db.session.commit()
+            self._count('hits')
+            return image
+        except Exception as e:
+            db.session.rollback()
+            self._count('errors')
+            print(f"[evidence_cache] 读取缓存失败: {type(e).__name__}: {e}")
+            return None
+
+    def put(self, key, image):
+        """Store `image` under `key` (content-addressed) and evict down to max_bytes."""
+        db, EvidenceRenderCache = lookup('db', 'EvidenceRenderCache')
+        try:
+            buffer = io.BytesIO()
+            image.save(buffer, 'PNG')
+            data = buffer.getvalue()
+            content_hash = hashlib.sha256(data).hexdigest()
+            path = self._path(content_hash)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            db.session.add(EvidenceRenderCache(cache_key=key, content_hash=content_hash, size_bytes=len(data)))
+            db.session.commit()
+            self._count('stores')
+        except Exception as e:
+            # 另一个 worker 可能刚写入同一个 key（唯一约束），忽略即可
+            db.session.rollback()
+            print(f"[evidence_cache] 写入缓存跳过: {type(e).__name__}")
+            return
+        self._evict()
+
+    def _evict(self):
+        db, EvidenceRenderCache = lookup('db', 'EvidenceRenderCache')
+        from sqlalchemy import func
+        try:
+            total = db.session.query(func.coalesce(func.sum(EvidenceRenderCache.size_bytes), 0)).scalar()
+            if total <= self.max_bytes:
+                return
+            orphan_candidates = set()
+            evicted = 0
+            for row in EvidenceRenderCache.query.order_by(EvidenceRenderCache.last_used_at).all():
+                if total <= self.max_bytes:
+                    break
+                total -= row.size_bytes or 0
+                orphan_candidates.add(row.content_hash)
+                db.session.delete(row)
+                evicted += 1
+                self._count('evictions')
+            db.session.commit()
+            for content_hash in orphan_candidates:
+                if EvidenceRenderCache.query.filter_by(content_hash=content_hash).first() is None:
+                    try:
+                        os.remove(self._path(content_hash))
+                    except OSError:
+                        pass
+            print(f"[evidence_cache] 淘汰 {evicted} 条缓存，剩余 {total / 1024 / 1024:.1f}MB")
+        except Exception as e:
+            db.session.rollback()
+            print(f"[evidence_cache] 淘汰失败: {type(e).__name__}: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else None
+        stats['max_mb'] = round(self.max_bytes / 1024 / 1024, 1)
+        stats['enabled'] = EVIDENCE_CACHE_ENABLED
+        return stats
+
+
+evidence_image_cache = EvidenceImageCache(EVIDENCE_CACHE_DIR, int(EVIDENCE_CACHE_MAX_MB * 1024 * 1024))
+
+
+def cached_image(model_id, prompt, negative_prompt, num_inference_steps, guidance_scale, size):
+    """The cached image cached_render() would return for these inputs, or None (never renders)."""
+    if not EVIDENCE_CACHE_ENABLED:
+        return None
+    seed = prompt_seed(prompt, negative_prompt)
+    key = render_key(model_id, prompt, negative_prompt, num_inference_steps, guidance_scale, size, seed)
+    image = evidence_image_cache.get(key)
+    if image is None:
+        return None
+    print(f"[evidence_cache] ✅ 命中缓存 {key[:12]}，跳过扩散推理")
+    return vary(image) if EVIDENCE_CACHE_VARIATION else image
+
+
+def cached_render(model_id, prompt, negative_prompt, num_inference_steps, guidance_scale, size,
+                  progress=None, cancelled=None):
+    """evidence_renderer.render() behind the prompt-keyed cache. Returns (image, cache_hit).
+
+    `progress` and `cancelled` are passed to the renderer on a cache miss.
+    """
+    from evidence_renderer import evidence_renderer
+
+    if not EVIDENCE_CACHE_ENABLED:
+        return evidence_renderer.render(model_id, prompt, negative_prompt, num_inference_steps,
+                                        guidance_scale, size, progress=progress, cancelled=cancelled), False
+
+    seed = prompt_seed(prompt, negative_prompt)
+    key = render_key(model_id, prompt, negative_prompt, num_inference_steps, guidance_scale, size, seed)
+    image = evidence_image_cache.get(key)
+    if image is not None:
+        print(f"[evidence_cache] ✅ 命中缓存 {key[:12]}，跳过扩散推理")
+        return (vary(image) if EVIDENCE_CACHE_VARIATION else image), True
+
+    image = evidence_renderer.render(model_id, prompt, negative_prompt, num_inference_steps,
+                                     guidance_scale, size, seed=seed, progress=progress, cancelled=cancelled)
+    evidence_image_cache.put(key, image)
+    return image, False
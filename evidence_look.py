@@ -0,0 +1,176 @@
+"""Fused "evidence look" stage shared by the diffusion and placeholder renderers.
+
+The SD path used to run four ImageEnhance passes (each a full uint8 image
+copy), add float64 noise through a second NumPy round trip and then draw the
+timestamp with ImageDraw. EvidenceLook does colour, brightness, contrast and
+noise in one float32 pass over a preallocated per-thread buffer:
+
+    colour:     c = g + a * (x - g)        (g = ITU-R 601 luma, unchanged by colour)
+    brightness: b * c
+    contrast:   m + k * (b * c - m)        (m = b * mean(g))
+    =>          out = k*b*a * x + k*b*(1-a) * g + (1-k) * b * mean(g) + noise
+
+Sharpness needs a neighbourhood and stays a separate 3x3 pass. The timestamp and
+REC marks are alpha masks built from a cached per-character glyph atlas and
+blended into the buffer, so there is a single conversion back to uint8.
+"""
+import threading
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+_local = threading.local()
+
+
+def _buffer(name, shape):
+    """Per-thread reusable float32 buffer."""
+    buffers = getattr(_local, 'buffers', None)
+    if buffers is None:
+        buffers = _local.buffers = {}
+    buf = buffers.get(name)
+    if buf is None or buf.shape != shape:
+        buf = buffers[name] = np.empty(shape, dtype=np.float32)
+    return buf
+
+
+# ============================================
+# 叠加层：时间戳 / REC 标记
+# ============================================
+
+@lru_cache(maxsize=1)
+def _font():
+    return ImageFont.load_default()
+
+
+@lru_cache(maxsize=256)
+def _glyph(char):
+    """(alpha mask float32 HxW, advance) for one character of the default font."""
+    font = _font()
+    advance = int(round(font.getlength(char)))
+    _, _, right, bottom = font.getbbox(char)
+    canvas = Image.new('L', (max(1, advance, right), max(1, bottom)), 0)
+    ImageDraw.Draw(canvas).text((0, 0), char, fill=255, font=font)
+    mask = np.asarray(canvas, dtype=np.float32) / 255.0
+    mask.setflags(write=False)
+    return mask, advance
+
+
+@lru_cache(maxsize=64)
+def text_mask(text):
+    """Alpha mask for a whole string, composed from cached glyphs."""
+    glyphs = [_glyph(ch) for ch in text] or [_glyph(' ')]
+    width = x = 0
+    for glyph, advance in glyphs:
+        width = max(width, x + glyph.shape[1])
+        x += advance
+    height = max(glyph.shape[0] for glyph, _ in glyphs)
+    mask = np.zeros((height, width), dtype=np.float32)
+    x = 0
+    for glyph, advance in glyphs:
+        h, w = glyph.shape
+        np.maximum(mask[:h, x:x + w], glyph, out=mask[:h, x:x + w])
+        x += advance
+    mask.setflags(write=False)
+    return mask
+
+
+class Overlay:
+    __slots__ = ('mask', 'color', 'position')
+
+    def __init__(self, mask, color, position):
+        self.mask = mask
+        self.color = np.asarray(color, dtype=np.float32)
+        self.position = position
+
+    def blend_into(self, buf):
+        x, y = self.position
+        height, width = buf.shape[:2]
+        h = min(self.mask.shape[0], height - y)
+        w = min(self.mask.shape[1], width - x)
+        if h <= 0 or w <= 0:
+            return
+        region = buf[y:y + h, x:x + w]
+        alpha = self.mask[:h, :w, None]
+        region += (self.color - region) * alpha
+
+
+def surveillance_overlays(when, timestamp_color=(220, 220, 220), rec_color=(200, 0, 0)):
+    """Bottom-right timestamp and top-left "REC ●" mark, as in the original ImageDraw calls."""
+    return [
+        Overlay(text_mask(when.strftime('%Y/%m/%d %H:%M:%S')), timestamp_color, (340, 480)),
+        Overlay(text_mask("REC ●"), rec_color, (10, 10)),
+    ]
+
+
+# ============================================
+# 融合后处理
+# ============================================
+
+class EvidenceLook:
+    def __init__(self, color=1.0, brightness=1.0, contrast=1.0, sharpness=1.0, noise_sigma=0.0):
+        self.color = color
+        self.brightness = brightness
+        self.contrast = contrast
+        self.sharpness = sharpness
+        self.noise_sigma = noise_sigma
+
+    def _sharpen(self, buf):
+        # ImageEnhance.Sharpness: x + (s-1) * (x - smooth)，smooth 为 PIL SMOOTH 核 [[1,1,1],[1,5,1],[1,1,1]]/13
+        height, width = buf.shape[:2]
+        padded = _buffer('sharpen_pad', (height + 2, width + 2, 3))
+        padded[1:-1, 1:-1] = buf
+        padded[0, 1:-1], padded[-1, 1:-1] = buf[0], buf[-1]
+        padded[:, 0], padded[:, -1] = padded[:, 1], padded[:, -2]
+        smooth = _buffer('sharpen_smooth', buf.shape)
+        np.multiply(buf, 4.0, out=smooth)
+        for dy in range(3):
+            for dx in range(3):
+                smooth += padded[dy:dy + height, dx:dx + width]
+        smooth *= 1.0 / 13.0
+        amount = self.sharpness - 1.0
+        buf *= 1.0 + amount
+        smooth *= amount
+        buf -= smooth
+
+    def apply(self, buf, rng=None, overlays=()):
+        """Apply the look in place to a float32 (H, W, 3) buffer in 0..255 and return it (unclipped)."""
+        gray = np.matmul(buf, _LUMA, out=_buffer('gray', buf.shape[:2]))
+        a, b, k = self.color, self.brightness, self.contrast
+        scale = k * b * a
+        gray_weight = k * b * (1.0 - a)
+        offset = (1.0 - k) * b * float(gray.mean())
+
+        buf *= scale
+        if gray_weight:
+            gray *= gray_weight
+            buf += gray[..., None]
+        buf += offset
+
+        if self.sharpness != 1.0:
+            self._sharpen(buf)
+        if self.noise_sigma:
+            rng = rng if rng is not None else np.random.default_rng()
+            noise = _buffer('noise', buf.shape)
+            rng.standard_normal(out=noise, dtype=np.float32)
+            noise *= self.noise_sigma
+            buf += noise
+        for overlay in overlays:
+            overlay.blend_into(buf)
+        return buf
+
+    def render(self, image, rng=None, overlays=()):
+        """Apply the look to a PIL RGB image and return a new PIL image."""
+        pixels = np.asarray(image.convert('RGB'))
+        buf = _buffer('image', pixels.shape)
+        np.copyto(buf, pixels, casting='unsafe')
+        self.apply(buf, rng=rng, overlays=overlays)
+        np.clip(buf, 0, 255, out=buf)
+        return Image.fromarray(buf.astype(np.uint8), 'RGB')
+
+
+# Stable Diffusion 输出：降饱和、压暗、提对比、轻微锐化、胶片噪点
+DIFFUSION_LOOK = EvidenceLook(color=0.85, brightness=0.85, contrast=1.15, sharpness=1.1, noise_sigma=3.0)
+# 占位符：只降饱和（颗粒与模糊由 placeholder_evidence 处理）
+PLACEHOLDER_LOOK = EvidenceLook(color=0.5)
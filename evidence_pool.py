@@ -0,0 +1,235 @@
+"""Speculative pool of pre-rendered evidence images per story category and scene.
+
+Evidence generation used to start only when a comment crossed the threshold in
+add_comment, so the "现场照片" arrived a minute or more later. A background
+filler uses idle time (no foreground render for EVIDENCE_POOL_IDLE_SECONDS) to
+keep a few raw diffusion outputs ready for every LEGEND_CATEGORIES entry and
+its typical scene keywords (CATEGORY_SCENES). Slots that were asked for and
+found empty are filled too.
+
+generate_evidence_image takes a pooled image for the story's category and
+matched scene keyword when one is available. It applies the usual evidence
+look with the story's own timestamp, and the filler refills the slot later.
+
+Files live under EVIDENCE_POOL_DIR/<category>/<scene>/ and survive restarts.
+The pool is bounded per slot (EVIDENCE_POOL_DEPTH), per category
+(EVIDENCE_POOL_CATEGORY_MAX) and on disk (EVIDENCE_POOL_MAX_MB).
+"""
+import importlib.util
+import os
+import random
+import threading
+import time
+import uuid
+
+from PIL import Image
+
+EVIDENCE_POOL_ENABLED = os.getenv('EVIDENCE_POOL_ENABLED', 'true').lower() == 'true'
+EVIDENCE_POOL_DIR = os.getenv('EVIDENCE_POOL_DIR', 'evidence_pool')
+EVIDENCE_POOL_DEPTH = int(os.getenv('EVIDENCE_POOL_DEPTH', 2))
+EVIDENCE_POOL_CATEGORY_MAX = int(os.getenv('EVIDENCE_POOL_CATEGORY_MAX', 6))
+EVIDENCE_POOL_MAX_MB = float(os.getenv('EVIDENCE_POOL_MAX_MB', 256))
+EVIDENCE_POOL_IDLE_SECONDS = float(os.getenv('EVIDENCE_POOL_IDLE_SECONDS', 120))
+EVIDENCE_POOL_CHECK_SECONDS = float(os.getenv('EVIDENCE_POOL_CHECK_SECONDS', 60))
+
+DEFAULT_SCENE_KEY = 'default'
+
+# 每个分类预先准备的场景（ai_engine.SCENE_KEYWORDS 的键；'default' 为通用场景）
+CATEGORY_SCENES = {
+    'subway_ghost': ['地铁', '车厢'],
+    'abandoned_building': ['楼道', '走廊'],
+    'cursed_object': ['照片', '镜子'],
+    'missing_person': ['房间', '门'],
+    'shadow_figure': ['影子', '窗外'],
+    'haunted_electronics': ['手机', '录音'],
+    'fish_tank_horror': [DEFAULT_SCENE_KEY],
+    'real_crime_mystery': ['楼梯', DEFAULT_SCENE_KEY],
+}
+
+
+class EvidencePool:
+    def __init__(self, root='evidence_pool', depth=2, category_max=6, max_bytes=256 * 1024 * 1024,
+                 idle_seconds=120.0, check_seconds=60.0):
+        self.root = root
+        self.depth = max(0, depth)
+        self.category_max = max(0, category_max)
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.check_seconds = check_seconds
+        self._slots = {}      # (category, scene) -> [文件路径, ...]，先进先出
+        self._demand = {}     # 取图时为空的槽位 -> 次数，补充时优先
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._disabled = None   # 无法生成时的原因，填充线程随之退出
+        self._stats = {'taken': 0, 'misses': 0, 'filled': 0, 'failures': 0}
+
+    def _slot_dir(self, slot):
+        return os.path.join(self.root, *slot)
+
+    def _scan(self):
+        """Index images left on disk by a previous run."""
+        with self._lock:
+            self._slots.clear()
+            self._bytes = 0
+            for category in CATEGORY_SCENES:
+                category_dir = os.path.join(self.root, category)
+                if not os.path.isdir(category_dir):
+                    continue
+                for scene in os.listdir(category_dir):
+                    slot = (category, scene)
+                    if not os.path.isdir(self._slot_dir(slot)):
+                        continue
+                    files = sorted(f for f in os.listdir(self._slot_dir(slot)) if f.endswith('.png'))
+                    paths = [os.path.join(self._slot_dir(slot), f) for f in files]
+                    if paths:
+                        self._slots[slot] = paths
+                        self._bytes += sum(os.path.getsize(p) for p in paths)
+
+    def take(self, category, scene):
+        """Remove and return a pooled PIL image for (category, scene), or None."""
+        if not EVIDENCE_POOL_ENABLED or category not in CATEGORY_SCENES:
+            return None
+        slot = (category, scene or DEFAULT_SCENE_KEY)
+        with self._lock:
+            paths = self._slots.get(slot)
+            path = paths.pop(0) if paths else None
+            if path is None:
+                self._demand[slot] = self._demand.get(slot, 0) + 1
+                self._stats['misses'] += 1
+            else:
+                self._stats['taken'] += 1
+        self._wakeup.set()
+        if path is None:
+            return None
+        try:
+            size = os.path.getsize(path)
+            with Image.open(path) as pooled:
+                image = pooled.convert('RGB')
+            os.remove(path)
+        except OSError as e:
+            print(f"[evidence_pool] 读取预生成图片失败: {e}")
+            return None
+        with self._lock:
+            self._bytes -= size
+        print(f"[evidence_pool] ✅ 使用预生成图片 {category}/{slot[1]}")
+        return image
+
+    def _next_slot(self):
+        """Slot that most needs an image, or None when the pool is full."""
+        with self._lock:
+            if self._bytes >= self.max_bytes:
+                return None
+            candidates = []
+            for category, scenes in CATEGORY_SCENES.items():
+                slots = {(category, scene) for scene in scenes}
+                slots.update(slot for slot in self._demand if slot[0] == category)
+                in_category = sum(len(paths) for (c, _), paths in self._slots.items() if c == category)
+                if in_category >= self.category_max:
+                    continue
+                for slot in slots:
+                    have = len(self._slots.get(slot, ()))
+                    if have < self.depth:
+                        candidates.append((-self._demand.get(slot, 0), have, random.random(), slot))
+            return min(candidates)[-1] if candidates else None
+
+    def _render(self, slot):
+        from ai_engine import (SCENE_KEYWORDS, DEFAULT_SCENE, EVIDENCE_NEGATIVE_PROMPT,
+                               build_evidence_prompt, evidence_render_settings)
+        from evidence_renderer import evidence_renderer
+
+        category, scene = slot
+        scene_data = SCENE_KEYWORDS.get(scene)
+        if scene_data:
+            scene_desc = random.choice(scene_data.get('scenes', [DEFAULT_SCENE[0]]))
+            scene_details = random.choice(scene_data.get('details', [DEFAULT_SCENE[1]]))
+        else:
+            scene_desc, scene_details = DEFAULT_SCENE
+        model_id, steps, size = evidence_render_settings()
+        started = time.monotonic()
+        image = evidence_renderer.render(model_id, build_evidence_prompt(scene_desc, scene_details),
+                                         EVIDENCE_NEGATIVE_PROMPT, steps, 8.5, size, background=True)
+
+        directory = self._slot_dir(slot)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{int(time.time())}_{uuid.uuid4().hex[:8]}.png")
+        image.save(path + '.tmp', 'PNG')
+        os.replace(path + '.tmp', path)
+        with self._lock:
+            self._slots.setdefault(slot, []).append(path)
+            self._bytes += os.path.getsize(path)
+            self._demand.pop(slot, None)
+            self._stats['filled'] += 1
+        print(f"[evidence_pool] 预生成 {category}/{scene} 完成，用时 {time.monotonic() - started:.1f}s")
+
+    def _run(self):
+        from evidence_renderer import evidence_renderer
+
+        self._scan()
+        print(f"[evidence_pool] ✅ 预生成池已启动，现有 {sum(map(len, self._slots.values()))} 张")
+        while True:
+            slot = self._next_slot()
+            idle = evidence_renderer.idle_seconds()
+            if slot is None or idle < self.idle_seconds:
+                # 池子已满，或者前台刚有渲染：等下一次检查或有图片被取走
+                self._wakeup.wait(self.check_seconds if slot is None else
+                                  min(self.check_seconds, self.idle_seconds - idle))
+                self._wakeup.clear()
+                continue
+            try:
+                self._render(slot)
+            except ImportError as e:
+                # 缺少 torch/diffusers 时每次都会失败，不再重试
+                with self._lock:
+                    self._disabled = f"{type(e).__name__}: {e}"
+                print(f"[evidence_pool] ⚠️ 无法加载 Stable Diffusion，预生成池停止: {self._disabled}")
+                return
+            except Exception as e:
+                with self._lock:
+                    self._stats['failures'] += 1
+                print(f"[evidence_pool] 预生成 {slot[0]}/{slot[1]} 失败: {type(e).__name__}: {e}")
+                time.sleep(self.check_seconds)
+
+    def start(self):
+        """Start the filler thread once per process (only when Stable Diffusion is in use and installed)."""
+        if not EVIDENCE_POOL_ENABLED or os.getenv('USE_DIFFUSER_IMAGE', 'true').lower() != 'true':
+            return
+        missing = [name for name in ('torch', 'diffusers') if importlib.util.find_spec(name) is None]
+        with self._lock:
+            if self._thread is not None or self._disabled is not None:
+                return
+            if missing:
+                self._disabled = f"未安装 {', '.join(missing)}"
+                print(f"[evidence_pool] ⚠️ {self._disabled}，预生成池不启动")
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True, name='evidence-pool')
+            self._thread.start()
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._stats,
+                enabled=EVIDENCE_POOL_ENABLED,
+                running=self._thread is not None and self._disabled is None,
+                disabled=self._disabled,
+                images=sum(len(paths) for paths in self._slots.values()),
+                disk_mb=round(self._bytes / 1024 / 1024, 1),
+                max_mb=round(self.max_bytes / 1024 / 1024, 1),
+                slots={f"{c}/{s}": len(paths) for (c, s), paths in self._slots.items() if paths},
+                wanted=[f"{c}/{s}" for (c, s) in self._demand],
+            )
+
+
+evidence_pool = EvidencePool(
+    root=EVIDENCE_POOL_DIR,
+    depth=EVIDENCE_POOL_DEPTH,
+    category_max=EVIDENCE_POOL_CATEGORY_MAX,
+    max_bytes=int(EVIDENCE_POOL_MAX_MB * 1024 * 1024),
+    idle_seconds=EVIDENCE_POOL_IDLE_SECONDS,
+    check_seconds=EVIDENCE_POOL_CHECK_SECONDS,
+)
+
+
+def start_evidence_pool():
+    evidence_pool.start()
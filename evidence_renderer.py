@@ -0,0 +1,234 @@
+"""Micro-batched Stable Diffusion rendering for evidence images.
+
+When several stories reach their evidence threshold at about the same time,
+each job used to run its own diffusion pass. render() instead queues the
+prompt; a single dispatcher thread waits up to SD_BATCH_WAIT_MS for more
+prompts with the same generation settings and runs them through the warm
+pipeline from sd_pipeline as one batch (at most SD_BATCH_MAX_SIZE images).
+Each caller gets its own image back.
+
+Callers may pass progress(step, total) and cancelled() callbacks. They are
+driven from the pipeline's per-step callback. A request whose cancelled()
+returns a reason fails with JobCancelled. The diffusion run itself is
+interrupted once every request in the batch has been cancelled.
+"""
+import inspect
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+from job_queue import JobCancelled
+from sd_pipeline import diffusion_pipelines
+
+SD_BATCH_MAX_SIZE = int(os.getenv('SD_BATCH_MAX_SIZE', 4))
+SD_BATCH_WAIT_MS = int(os.getenv('SD_BATCH_WAIT_MS', 1500))
+
+
+class _RenderRequest:
+    __slots__ = ('settings', 'prompt', 'negative_prompt', 'seed', 'progress', 'cancelled', 'future')
+
+    def __init__(self, settings, prompt, negative_prompt, seed=None, progress=None, cancelled=None):
+        self.settings = settings
+        self.prompt = prompt
+        self.negative_prompt = negative_prompt
+        self.seed = seed
+        self.progress = progress
+        self.cancelled = cancelled
+        self.future = Future()
+
+    def cancel_reason(self):
+        """Reason from the caller's cancelled() callback; cancels the future when set."""
+        if self.cancelled is None or self.future.done():
+            return None
+        try:
+            reason = self.cancelled()
+        except Exception:
+            return None
+        if reason:
+            self.future.set_exception(JobCancelled(reason))
+        return reason
+
+
+class EvidenceRenderer:
+    def __init__(self, max_batch_size=4, max_wait_seconds=1.5, pipelines=diffusion_pipelines):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_seconds = max(0.0, max_wait_seconds)
+        self.pipelines = pipelines
+        self._queue = queue.Queue()
+        self._pending = []          # 已取出但和当前批次设置不同、留给下一批的请求
+        self._dispatcher = None
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'batches': 0, 'max_batch': 0, 'cancelled': 0, 'interrupted': 0}
+        self._foreground = 0                    # 正在等待结果的前台请求数
+        self._last_foreground = time.monotonic()
+
+    def _ensure_dispatcher(self):
+        with self._lock:
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                self._dispatcher = threading.Thread(target=self._run, daemon=True, name='evidence-renderer')
+                self._dispatcher.start()
+
+    def render(self, model_id, prompt, negative_prompt, num_inference_steps, guidance_scale, size,
+               seed=None, timeout=None, background=False, progress=None, cancelled=None):
+        """Queue one prompt and block until its image is rendered.
+
+        Prompts only share a batch when model, steps, guidance scale and size match.
+        With a `seed` the image is reproducible for the same settings and prompt.
+        `background` renders (the evidence pool) do not count as activity for idle_seconds().
+        `progress(step, total)` is called after every denoising step; `cancelled()`
+        returning a reason stops waiting with JobCancelled.
+        Raises whatever the pipeline raised for the batch.
+        """
+        settings = (model_id, num_inference_steps, guidance_scale, size)
+        request = _RenderRequest(settings, prompt, negative_prompt, seed, progress, cancelled)
+        with self._lock:
+            self._stats['requests'] += 1
+            if not background:
+                self._foreground += 1
+        self._ensure_dispatcher()
+        self._queue.put(request)
+        try:
+            return request.future.result(timeout=timeout)
+        finally:
+            if not background:
+                with self._lock:
+                    self._foreground -= 1
+                    self._last_foreground = time.monotonic()
+
+    def idle_seconds(self):
+        """Seconds since the last foreground render finished (0 while one is in progress)."""
+        with self._lock:
+            if self._foreground:
+                return 0.0
+            return time.monotonic() - self._last_foreground
+
+    def _next_request(self, timeout):
+        if self._pending:
+            return self._pending.pop(0)
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _collect_batch(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_seconds
+        deferred = []
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request.settings == first.settings:
+                batch.append(request)
+            else:
+                deferred.append(request)
+        self._pending.extend(deferred)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._next_request(timeout=60)
+            if first is None:
+                continue
+            batch = self._collect_batch(first)
+            # 排队期间已取消的请求不进入本批
+            live = [r for r in batch if not r.cancel_reason()]
+            if len(live) < len(batch):
+                with self._lock:
+                    self._stats['cancelled'] += len(batch) - len(live)
+            batch = live
+            if not batch:
+                continue
+            model_id, steps, guidance, size = first.settings
+            try:
+                with self.pipelines.pipeline(model_id) as pipe:
+                    started = time.monotonic()
+                    images = pipe(
+                        [r.prompt for r in batch],
+                        negative_prompt=[r.negative_prompt for r in batch],
+                        num_inference_steps=steps,
+                        guidance_scale=guidance,
+                        height=size,
+                        width=size,
+                        generator=self._generators(batch),
+                        **self._step_callback(pipe, batch, steps)
+                    ).images
+                print(f"[evidence_renderer] 批量生成 {len(batch)} 张图片，用时 {time.monotonic() - started:.1f}s")
+                with self._lock:
+                    self._stats['batches'] += 1
+                    self._stats['max_batch'] = max(self._stats['max_batch'], len(batch))
+                for request, image in zip(batch, images):
+                    if not request.future.done():
+                        request.future.set_result(image)
+                for request in batch[len(images):]:
+                    if not request.future.done():
+                        request.future.set_exception(RuntimeError("管线返回的图片数量少于请求数"))
+            except JobCancelled:
+                with self._lock:
+                    self._stats['interrupted'] += 1
+                print(f"[evidence_renderer] 本批 {len(batch)} 张图片均已取消，中断推理")
+            except Exception as e:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+    def _step_callback(self, pipe, batch, steps):
+        """Pipeline kwargs that report per-step progress and interrupt a fully cancelled batch."""
+        if all(r.progress is None and r.cancelled is None for r in batch):
+            return {}
+
+        def on_step(step):
+            for request in batch:
+                if request.future.done():
+                    continue
+                if request.cancel_reason():
+                    with self._lock:
+                        self._stats['cancelled'] += 1
+                    continue
+                if request.progress is not None:
+                    try:
+                        request.progress(step + 1, steps)
+                    except Exception as e:
+                        print(f"[evidence_renderer] 进度回调出错: {type(e).__name__}: {e}")
+            if all(r.future.done() for r in batch):
+                raise JobCancelled("批次中的所有请求均已取消")
+
+        parameters = inspect.signature(pipe.__call__).parameters
+        if 'callback_on_step_end' in parameters:
+            def callback_on_step_end(pipeline, step, timestep, callback_kwargs):
+                on_step(step)
+                return callback_kwargs
+            return {'callback_on_step_end': callback_on_step_end}
+        if 'callback' in parameters:
+            # 旧版 diffusers
+            return {'callback': lambda step, timestep, latents: on_step(step), 'callback_steps': 1}
+        return {}
+
+    def _generators(self, batch):
+        """Per-image torch generators when any request in the batch asked for a seed."""
+        if all(r.seed is None for r in batch):
+            return None
+        import torch
+        device = self.pipelines.device or 'cpu'
+        return [
+            torch.Generator(device=device).manual_seed(r.seed if r.seed is not None else random.randrange(2 ** 31))
+            for r in batch
+        ]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, queued=self._queue.qsize() + len(self._pending),
+                        max_batch_size=self.max_batch_size, max_wait_ms=int(self.max_wait_seconds * 1000))
+
+
+evidence_renderer = EvidenceRenderer(
+    max_batch_size=SD_BATCH_MAX_SIZE,
+    max_wait_seconds=SD_BATCH_WAIT_MS / 1000.0,
+)
@@ -0,0 +1,221 @@
+"""Compressed, resized derivatives of evidence images and static artwork.
+
+Evidence images are saved as 512x512 PNGs, and the logos and backgrounds in
+static/ are multi-megabyte PNG/JPG files that are displayed at a fraction of
+their size. For every source image this module writes WebP copies at a few
+widths plus a small thumbnail under static/derived/ (and AVIF copies if
+IMAGE_DERIVATIVE_FORMATS asks for them and Pillow supports it):
+
+    static/generated/evidence_story1_x.png
+      -> static/derived/generated/evidence_story1_x.256.webp
+         static/derived/generated/evidence_story1_x.512.webp
+         static/derived/generated/evidence_story1_x.thumb.webp
+
+Evidence derivatives are written when the image is created; static artwork is
+converted once in a background thread at startup (and again whenever the
+source file is newer than its derivatives). negotiate() lets serve_static
+answer a request for the original file with the best derivative the client
+accepts.
+"""
+import os
+import threading
+import time
+
+from PIL import Image, features
+
+STATIC_ROOT = 'static'
+DERIVED_DIR = 'derived'
+SOURCE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+IMAGE_DERIVATIVE_WIDTHS = tuple(sorted(
+    int(w) for w in os.getenv('IMAGE_DERIVATIVE_WIDTHS', '256,512,1024,1920').split(',') if w.strip()
+))
+IMAGE_THUMBNAIL_WIDTH = int(os.getenv('IMAGE_THUMBNAIL_WIDTH', 160))
+IMAGE_WEBP_QUALITY = int(os.getenv('IMAGE_WEBP_QUALITY', 80))
+IMAGE_AVIF_QUALITY = int(os.getenv('IMAGE_AVIF_QUALITY', 60))
+# 按优先级排列；Accept 同时支持多种格式时选靠前的
+IMAGE_DERIVATIVE_FORMATS = tuple(
+    f for f in (f.strip().lower() for f in os.getenv('IMAGE_DERIVATIVE_FORMATS', 'webp').split(','))
+    if f in ('webp', 'avif') and features.check(f)
+)
+
+_MIME = {'webp': 'image/webp', 'avif': 'image/avif'}
+_static_thread = None
+_static_lock = threading.Lock()
+
+
+def _split_static(path):
+    """'/static/generated/a.png' or 'generated/a.png' -> 'generated/a.png' (None if not a source image)."""
+    rel = path.lstrip('/')
+    if rel.startswith(STATIC_ROOT + '/'):
+        rel = rel[len(STATIC_ROOT) + 1:]
+    if not rel.lower().endswith(SOURCE_EXTENSIONS) or rel.startswith(DERIVED_DIR + '/') or '..' in rel.split('/'):
+        return None
+    return rel
+
+
+def derivative_relpath(rel, label, fmt='webp'):
+    """Path under static/ of one derivative; `label` is a width or 'thumb'."""
+    stem = os.path.splitext(rel)[0]
+    return f"{DERIVED_DIR}/{stem}.{label}.{fmt}"
+
+
+def _widths_for(source_width):
+    """Configured widths below the source width, plus the source width itself (capped at the largest)."""
+    widths = [w for w in IMAGE_DERIVATIVE_WIDTHS if w < source_width]
+    widths.append(min(source_width, IMAGE_DERIVATIVE_WIDTHS[-1]) if IMAGE_DERIVATIVE_WIDTHS else source_width)
+    return sorted(set(widths))
+
+
+def _save(image, rel, label, fmt):
+    target = os.path.join(STATIC_ROOT, derivative_relpath(rel, label, fmt))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp = target + '.tmp'
+    if fmt == 'avif':
+        image.save(tmp, 'AVIF', quality=IMAGE_AVIF_QUALITY)
+    else:
+        image.save(tmp, 'WEBP', quality=IMAGE_WEBP_QUALITY, method=4)
+    os.replace(tmp, target)
+
+
+def _resize(image, width):
+    if image.width <= width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.Resampling.LANCZOS)
+
+
+def create_derivatives(path, force=False):
+    """Write the derivatives of one source image. Returns the number of files written.
+
+    Skips the work when the derivatives are already newer than the source.
+    """
+    rel = _split_static(path)
+    if rel is None or not IMAGE_DERIVATIVE_FORMATS:
+        return 0
+    source = os.path.join(STATIC_ROOT, rel)
+    if not os.path.exists(source):
+        return 0
+    thumb = os.path.join(STATIC_ROOT, derivative_relpath(rel, 'thumb', IMAGE_DERIVATIVE_FORMATS[0]))
+    if not force and os.path.exists(thumb) and os.path.getmtime(thumb) >= os.path.getmtime(source):
+        return 0
+
+    with Image.open(source) as opened:
+        # 保留透明通道（logo），其余统一转 RGB
+        image = opened.convert('RGBA' if 'A' in opened.getbands() or 'transparency' in opened.info else 'RGB')
+
+    written = 0
+    # 从大到小逐级缩放，每一级都从上一级缩小，避免每次都从原图重采样
+    current = image
+    for width in reversed(_widths_for(image.width)):
+        current = _resize(current, width)
+        for fmt in IMAGE_DERIVATIVE_FORMATS:
+            _save(current, rel, width, fmt)
+            written += 1
+    small = _resize(current, IMAGE_THUMBNAIL_WIDTH)
+    # 缩略图最后写：它的修改时间代表整组衍生图已完成
+    for fmt in reversed(IMAGE_DERIVATIVE_FORMATS):
+        _save(small, rel, 'thumb', fmt)
+        written += 1
+    return written
+
+
+def _available(rel, fmt):
+    """{label: relpath} of the derivatives that exist on disk for `rel`."""
+    prefix = os.path.splitext(os.path.basename(rel))[0] + '.'
+    directory = os.path.join(STATIC_ROOT, DERIVED_DIR, os.path.dirname(rel))
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return {}
+    found = {}
+    for name in names:
+        if not (name.startswith(prefix) and name.endswith('.' + fmt)):
+            continue
+        label = name[len(prefix):-len(fmt) - 1]
+        if label == 'thumb' or label.isdigit():
+            found[label] = derivative_relpath(rel, label, fmt)
+    return found
+
+
+def derivative_urls(path):
+    """Derivative URLs for the evidence JSON, or None if none have been written.
+
+    {'thumbnail': url, 'srcset': 'url 256w, url 512w', 'webp': url of the largest}
+    """
+    rel = _split_static(path or '')
+    if rel is None or 'webp' not in IMAGE_DERIVATIVE_FORMATS:
+        return None
+    found = _available(rel, 'webp')
+    widths = sorted(int(label) for label in found if label.isdigit())
+    if not widths:
+        return None
+    return {
+        'thumbnail': '/static/' + found['thumb'] if 'thumb' in found else None,
+        'srcset': ', '.join(f"/static/{found[str(w)]} {w}w" for w in widths),
+        'webp': '/static/' + found[str(widths[-1])],
+    }
+
+
+def negotiate(path, accept, width=None):
+    """Pick the derivative to serve for a request of static/<path>.
+
+    Returns (relpath under static/, mimetype) of the best derivative the
+    Accept header allows, no wider than needed for `width` if given, or None to
+    serve the original file.
+    """
+    rel = _split_static(path)
+    if rel is None or not accept:
+        return None
+    accept = accept.lower()
+    source = os.path.join(STATIC_ROOT, rel)
+    for fmt in IMAGE_DERIVATIVE_FORMATS:
+        if _MIME[fmt] not in accept:
+            continue
+        found = _available(rel, fmt)
+        widths = sorted(int(label) for label in found if label.isdigit())
+        if not widths:
+            continue
+        chosen = widths[-1]
+        if width:
+            chosen = next((w for w in widths if w >= width), widths[-1])
+            if width <= IMAGE_THUMBNAIL_WIDTH and 'thumb' in found:
+                chosen = 'thumb'
+        derived = found[str(chosen)]
+        # 原图更新过而衍生图还没重建时，或者衍生图反而更大（已高度压缩的 JPG），返回原图
+        try:
+            derived_stat = os.stat(os.path.join(STATIC_ROOT, derived))
+            source_stat = os.stat(source)
+        except OSError:
+            return None
+        if derived_stat.st_mtime < source_stat.st_mtime or derived_stat.st_size >= source_stat.st_size:
+            return None
+        return derived, _MIME[fmt]
+    return None
+
+
+def build_static_derivatives():
+    """Create missing or stale derivatives for every image under static/ (except derived/)."""
+    started = time.monotonic()
+    written = 0
+    for root, dirs, files in os.walk(STATIC_ROOT):
+        if os.path.relpath(root, STATIC_ROOT) == '.' and DERIVED_DIR in dirs:
+            dirs.remove(DERIVED_DIR)
+        for name in files:
+            rel = os.path.relpath(os.path.join(root, name), STATIC_ROOT).replace(os.sep, '/')
+            try:
+                written += create_derivatives(rel)
+            except Exception as e:
+                print(f"[image_assets] ⚠️ {rel} 生成衍生图失败: {type(e).__name__}: {e}")
+    if written:
+        print(f"[image_assets] ✅ 已生成 {written} 个衍生图，用时 {time.monotonic() - started:.1f}s")
+
+
+def start_static_derivatives():
+    """Build static derivatives once per process in a background thread."""
+    global _static_thread
+    with _static_lock:
+        if _static_thread is not None or not IMAGE_DERIVATIVE_FORMATS:
+            return
+        _static_thread = threading.Thread(target=build_static_derivatives, daemon=True, name='image-derivatives')
+        _static_thread.start()
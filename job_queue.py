@@ -0,0 +1,315 @@
+"""Durable background jobs backed by the Job table.
+
+Request handlers only call enqueue(); a fixed pool of JOB_WORKERS threads
+claims due jobs, runs the registered handler and retries failures with
+exponential backoff. Pending jobs live in the database, so replies and evidence
+that were queued before a restart are picked up again when the pool starts.
+
+Claiming is a conditional UPDATE (status='pending' -> 'running'), so several
+processes can share one database without running a job twice.
+
+A running handler can get its JobContext from current_job(). It reports
+progress into the job row (Job.progress / Job.stage) and asks whether it
+should stop. A job type may register a cancel_check(**payload). It is polled
+at most every JOB_CANCEL_CHECK_SECONDS and returns a reason when the job's
+subject is gone. The handler then raises JobCancelled, and the job ends as
+'cancelled' without retries.
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app_models import lookup
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', 5))
+JOB_RETRY_BASE_SECONDS = float(os.getenv('JOB_RETRY_BASE_SECONDS', 10))
+JOB_RETRY_MAX_SECONDS = float(os.getenv('JOB_RETRY_MAX_SECONDS', 600))
+# running 状态超过这个时间的任务视为进程崩溃遗留，重新放回队列
+JOB_STALE_SECONDS = int(os.getenv('JOB_STALE_SECONDS', 900))
+# 进度最多每隔这么久写一次数据库（阶段变化时立即写）
+JOB_PROGRESS_FLUSH_SECONDS = float(os.getenv('JOB_PROGRESS_FLUSH_SECONDS', 2))
+JOB_CANCEL_CHECK_SECONDS = float(os.getenv('JOB_CANCEL_CHECK_SECONDS', 5))
+
+_handlers = {}
+_cancel_checks = {}
+_local = threading.local()
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    """Raised inside a job that should stop; the job ends as 'cancelled' and is not retried."""
+
+
+class JobContext:
+    """Progress and cancellation handle of one running job.
+
+    Usable from other threads too (e.g. the evidence_renderer dispatcher).
+    """
+
+    def __init__(self, app, job_id, job_type, payload, attempts=1, max_attempts=1):
+        self.app = app
+        self.job_id = job_id
+        self.job_type = job_type
+        self.payload = payload
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.progress = 0
+        self.stage = None
+        self._cancel_reason = None
+        self._flushed_at = 0.0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def report(self, progress, stage=None):
+        """Record progress (0-100) and optionally the current stage name."""
+        progress = max(0, min(100, int(progress)))
+        with self._lock:
+            stage_changed = stage is not None and stage != self.stage
+            self.progress = progress
+            if stage is not None:
+                self.stage = stage
+            now = time.monotonic()
+            if not stage_changed and now - self._flushed_at < JOB_PROGRESS_FLUSH_SECONDS:
+                return
+            self._flushed_at = now
+            values = {'progress': self.progress, 'stage': self.stage}
+        self._write(values)
+
+    def last_attempt(self):
+        """True when a failure of this run will not be retried."""
+        return self.attempts >= self.max_attempts
+
+    def step_reporter(self, stage, start, end):
+        """Callback(step, total) that maps diffusion steps onto the [start, end] progress range."""
+        def on_step(step, total):
+            self.report(start + (end - start) * step / max(1, total), stage)
+        return on_step
+
+    def _write(self, values):
+        try:
+            with self.app.app_context():
+                db, Job = lookup('db', 'Job')
+                Job.query.filter_by(id=self.job_id).update(values, synchronize_session=False)
+                db.session.commit()
+        except Exception as e:
+            print(f"[job_queue] 写入任务 #{self.job_id} 进度失败: {type(e).__name__}: {e}")
+
+    def cancelled(self):
+        """Reason the job should stop, or None."""
+        check = _cancel_checks.get(self.job_type)
+        with self._lock:
+            if self._cancel_reason or check is None:
+                return self._cancel_reason
+            now = time.monotonic()
+            if now - self._checked_at < JOB_CANCEL_CHECK_SECONDS:
+                return None
+            self._checked_at = now
+        try:
+            with self.app.app_context():
+                reason = check(**self.payload)
+        except Exception as e:
+            print(f"[job_queue] 任务 #{self.job_id} 取消检查失败: {type(e).__name__}: {e}")
+            return None
+        if reason:
+            with self._lock:
+                self._cancel_reason = reason
+        return reason
+
+    def raise_if_cancelled(self):
+        reason = self.cancelled()
+        if reason:
+            raise JobCancelled(reason)
+
+
+def current_job():
+    """JobContext of the job running on this worker thread, or None outside a job."""
+    return getattr(_local, 'job', None)
+
+
+def register_job(job_type, handler, cancel_check=None):
+    """Register `handler(**payload)` for jobs of `job_type`.
+
+    `cancel_check(**payload)` returns a reason string when a job of this type
+    should stop, and None otherwise. It runs in an app context.
+    """
+    _handlers[job_type] = handler
+    if cancel_check is not None:
+        _cancel_checks[job_type] = cancel_check
+
+
+def enqueue(job_type, payload=None, delay_seconds=0, idempotency_key=None, max_attempts=3):
+    """Persist a job and wake a worker. Must run inside an app context.
+
+    If a job with the same idempotency_key already exists, that job is
+    returned instead of creating a new one.
+    """
+    from sqlalchemy.exc import IntegrityError
+
+    db, Job = lookup('db', 'Job')
+
+    if job_type not in _handlers:
+        raise ValueError(f"未注册的任务类型: {job_type}")
+
+    if idempotency_key:
+        existing = Job.query.filter_by(idempotency_key=idempotency_key).first()
+        if existing:
+            print(f"[job_queue] 跳过重复任务 {idempotency_key} (job #{existing.id})")
+            return existing
+
+    job = Job(
+        job_type=job_type,
+        payload=json.dumps(payload or {}, ensure_ascii=False),
+        run_at=datetime.utcnow() + timedelta(seconds=max(0, delay_seconds)),
+        max_attempts=max_attempts,
+        idempotency_key=idempotency_key,
+        story_id=(payload or {}).get('story_id'),
+    )
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # 另一个请求/进程刚插入了同一个 idempotency_key
+        db.session.rollback()
+        return Job.query.filter_by(idempotency_key=idempotency_key).first()
+
+    start_job_workers(current_app._get_current_object())
+    _wakeup.set()
+    return job
+
+
+def _retry_delay(attempts):
+    return min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * (2 ** max(0, attempts - 1)))
+
+
+def _requeue_stale_jobs():
+    db, Job = lookup('db', 'Job')
+
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+    count = Job.query.filter(Job.status == 'running', Job.locked_at < cutoff).update(
+        {'status': 'pending', 'locked_at': None}, synchronize_session=False
+    )
+    db.session.commit()
+    if count:
+        print(f"[job_queue] 重新排队 {count} 个中断的任务")
+
+
+def _claim_next():
+    """Claim one due job. Returns (job, None) or (None, seconds until the next job is due)."""
+    db, Job = lookup('db', 'Job')
+
+    now = datetime.utcnow()
+    candidates = Job.query.filter(Job.status == 'pending', Job.run_at <= now) \
+        .order_by(Job.run_at, Job.id).limit(JOB_WORKERS + 1).all()
+    for candidate in candidates:
+        claimed = Job.query.filter_by(id=candidate.id, status='pending').update(
+            {'status': 'running', 'locked_at': now, 'attempts': Job.attempts + 1, 'progress': 0, 'stage': None},
+            synchronize_session=False
+        )
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, candidate.id), None
+
+    upcoming = Job.query.filter(Job.status == 'pending').order_by(Job.run_at).first()
+    db.session.rollback()
+    if upcoming is None:
+        return None, JOB_POLL_SECONDS
+    return None, max(0.0, min(JOB_POLL_SECONDS, (upcoming.run_at - now).total_seconds()))
+
+
+def _finish(job_id, error=None, cancelled=None):
+    db, Job = lookup('db', 'Job')
+
+    # 进度由 JobContext 在其他会话中写入，这里重新读取整行
+    job = db.session.get(Job, job_id, populate_existing=True)
+    if job is None:
+        return
+    job.locked_at = None
+    if cancelled is not None:
+        job.status = 'cancelled'
+        job.last_error = cancelled
+        print(f"[job_queue] 任务 #{job.id} ({job.job_type}) 已取消: {cancelled}")
+    elif error is None:
+        job.status = 'done'
+        job.progress = 100
+        job.stage = None
+        job.last_error = None
+    elif job.attempts < job.max_attempts:
+        delay = _retry_delay(job.attempts)
+        job.status = 'pending'
+        job.run_at = datetime.utcnow() + timedelta(seconds=delay)
+        job.last_error = error
+        print(f"[job_queue] 任务 #{job.id} ({job.job_type}) 失败，{delay:.0f}秒后重试 ({job.attempts}/{job.max_attempts})")
+    else:
+        job.status = 'failed'
+        job.last_error = error
+        print(f"[job_queue] ❌ 任务 #{job.id} ({job.job_type}) 重试 {job.attempts} 次后放弃: {error}")
+    db.session.commit()
+
+
+def _run_job(app, job):
+    """Run one claimed job. Returns (error, cancel reason)."""
+    handler = _handlers.get(job.job_type)
+    if handler is None:
+        return f"未注册的任务类型: {job.job_type}", None
+    payload = json.loads(job.payload or '{}')
+    context = JobContext(app, job.id, job.job_type, payload, job.attempts, job.max_attempts)
+    # 排队期间对象已消失（故事被删除/封贴）的任务不必开始
+    reason = context.cancelled()
+    if reason:
+        return None, reason
+    _local.job = context
+    try:
+        handler(**payload)
+        return None, None
+    except JobCancelled as e:
+        return None, str(e) or context.cancelled() or 'cancelled'
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return f"{type(e).__name__}: {e}", None
+    finally:
+        _local.job = None
+
+
+def _worker_loop(app, index):
+    print(f"[job_queue] worker {index} 启动")
+    while True:
+        # 先清除再查询：查询期间入队的任务会让下面的 wait 立即返回
+        _wakeup.clear()
+        try:
+            with app.app_context():
+                job, wait = _claim_next()
+                if job is not None:
+                    print(f"[job_queue] worker {index} 执行任务 #{job.id} ({job.job_type}, 第{job.attempts}次)")
+                    job_id = job.id
+                    error, cancelled = _run_job(app, job)
+                    _finish(job_id, error, cancelled)
+                    continue
+        except Exception as e:
+            print(f"[job_queue] worker {index} 出错: {type(e).__name__}: {e}")
+            wait = JOB_POLL_SECONDS
+        _wakeup.wait(wait)
+
+
+def start_job_workers(app=None):
+    """Start the worker pool once per process and resume jobs left from a previous run."""
+    with _workers_lock:
+        if _workers:
+            return
+        if app is None:
+            app = current_app._get_current_object()
+        with app.app_context():
+            _requeue_stale_jobs()
+        for index in range(max(1, JOB_WORKERS)):
+            worker = threading.Thread(target=_worker_loop, args=(app, index), daemon=True,
+                                      name=f'job-worker-{index}')
+            worker.start()
+            _workers.append(worker)
+    print(f"[job_queue] ✅ {len(_workers)} 个后台任务 worker 已启动")
@@ -0,0 +1,65 @@
+"""Compiled keyword tables for the scene, audio and comment matchers.
+
+generate_evidence_image, extract_audio_keywords and generate_contextual_comment
+each rebuilt a keyword table on every call and then tested every keyword
+against the text with `in`. A KeywordIndex is built once from a table of
+(keywords, value) entries in priority order. One regex scan tells it which
+keywords occur anywhere in the text, and all matching entries come back in
+priority order.
+
+The scan is a zero-width lookahead tried at every position, with longer
+keywords listed first. It reports the longest keyword starting at each
+position. A keyword hidden inside a longer hit (e.g. 窗 inside 窗外) is
+recovered from a precomputed "substrings of" table, so the result is exactly
+the set of keywords for which `keyword in text` is true.
+"""
+import re
+
+
+class KeywordIndex:
+    def __init__(self, table):
+        """`table` is an iterable of (keywords, value); keywords is a str or an iterable of str.
+
+        A '|'-separated string is split into several keywords. Entry order is priority order.
+        """
+        self.entries = []
+        for keywords, value in table:
+            if isinstance(keywords, str):
+                keywords = keywords.split('|')
+            keywords = tuple(k.strip() for k in keywords if k and k.strip())
+            self.entries.append((keywords, value))
+
+        vocabulary = sorted({k for keywords, _ in self.entries for k in keywords}, key=lambda k: (-len(k), k))
+        self._pattern = re.compile('(?=(' + '|'.join(map(re.escape, vocabulary)) + '))') if vocabulary else None
+        # 每个关键词命中时，顺带命中所有作为它子串的关键词
+        self._implied = {k: frozenset(other for other in vocabulary if other in k) for k in vocabulary}
+
+    def present(self, text):
+        """Set of keywords that occur in `text`."""
+        if not text or self._pattern is None:
+            return frozenset()
+        found = set()
+        for longest in set(self._pattern.findall(text)):
+            found |= self._implied[longest]
+        return found
+
+    def matches(self, text):
+        """All matching entries in priority order as (priority, keyword, value).
+
+        `keyword` is the entry's first listed keyword that occurs in the text.
+        """
+        found = self.present(text)
+        if not found:
+            return []
+        hits = []
+        for priority, (keywords, value) in enumerate(self.entries):
+            for keyword in keywords:
+                if keyword in found:
+                    hits.append((priority, keyword, value))
+                    break
+        return hits
+
+    def first(self, text):
+        """Highest-priority match as (priority, keyword, value), or None."""
+        hits = self.matches(text)
+        return hits[0] if hits else None
@@ -0,0 +1,132 @@
+"""Circuit breaker for the LM Studio backend.
+
+When LM Studio is down every call used to wait for its full read timeout before
+the caller fell back to templates. The breaker remembers the backend health:
+
+- closed: requests go through; LLM_BREAKER_FAILURES consecutive failures open it
+- open: requests fail immediately until LLM_BREAKER_RESET_SECONDS have passed
+  (or the health probe sees the server again), then it becomes half-open
+- half-open: a single trial request is let through; success closes the
+  breaker, failure opens it again
+
+Failures are reported by llm_client (connection errors, timeouts, 5xx) and by
+probe_llm_health(), which the background scheduler runs periodically.
+"""
+import os
+import threading
+import time
+
+import requests
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=3, reset_timeout=30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started = None   # 半开状态下试探请求的开始时间
+        self._last_error = None
+
+    def _open_locked(self, error):
+        if self._state != OPEN:
+            print(f"[llm_breaker] LM Studio 熔断打开: {error}")
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._trial_started = None
+
+    def allow(self):
+        """Return True if a request may be sent to the backend now."""
+        with self._lock:
+            now = time.monotonic()
+            if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+                self._trial_started = None
+            if self._state == CLOSED:
+                return True
+            # 试探请求被调度器丢弃时不会回报结果，超过 reset_timeout 后允许新的试探
+            if self._state == HALF_OPEN and (self._trial_started is None
+                                             or now - self._trial_started >= self.reset_timeout):
+                self._trial_started = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                print("[llm_breaker] LM Studio 恢复，熔断关闭")
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_started = None
+            self._last_error = None
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self._last_error = str(error) if error else None
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._open_locked(error)
+
+    def record_probe(self, healthy, error=None):
+        """Feed a health-probe result.
+
+        A healthy probe only moves an open breaker to half-open, so the next real
+        request still has to succeed before traffic fully resumes.
+        """
+        if not healthy:
+            self.record_failure(error)
+            return
+        with self._lock:
+            if self._state == OPEN:
+                self._state = HALF_OPEN
+                self._trial_started = None
+
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'last_error': self._last_error,
+                'open_for_seconds': round(time.monotonic() - self._opened_at, 1) if self._state == OPEN else 0,
+            }
+
+
+breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv('LLM_BREAKER_FAILURES', 3)),
+    reset_timeout=float(os.getenv('LLM_BREAKER_RESET_SECONDS', 30)),
+)
+
+
+def probe_llm_health(timeout=3):
+    """Cheap health check (GET /v1/models) that updates the shared breaker.
+
+    Healthy means the server answers and has at least one model loaded, the
+    same criteria as test_lm_studio_connection().
+    """
+    from llm_client import get_session, lm_studio_base_url
+
+    try:
+        response = get_session().get(f"{lm_studio_base_url()}/v1/models", timeout=(min(timeout, 2), timeout))
+        if response.status_code != 200:
+            breaker.record_probe(False, f"HTTP {response.status_code}")
+            return False
+        models = response.json().get('data') or []
+        if not models:
+            breaker.record_probe(False, "没有加载模型")
+            return False
+    except (requests.RequestException, ValueError, AttributeError) as e:
+        breaker.record_probe(False, f"{type(e).__name__}: {e}")
+        return False
+
+    breaker.record_probe(True)
+    return True
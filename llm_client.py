@@ -0,0 +1,201 @@
+"""Shared HTTP client for the LM Studio (OpenAI-compatible) local server.
+
+All LM Studio call sites in ai_engine go through chat_completion() so they share
+one keep-alive connection pool instead of spawning a curl process per request.
+Every request first takes a slot from llm_scheduler, which bounds concurrency
+and sheds low-priority work before LM Studio starts answering 503, and is
+refused immediately while the llm_breaker circuit breaker is open.
+"""
+import os
+import json
+import threading
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from llm_breaker import breaker
+from llm_scheduler import (
+    scheduler, SchedulerOverloaded,
+    PRIORITY_INTERACTIVE, PRIORITY_TRANSLATION, PRIORITY_BACKGROUND,
+)
+
+
+class LLMError(Exception):
+    """Raised when the local LLM request fails or returns an unusable payload."""
+
+
+class LLMOverloaded(LLMError):
+    """Raised when the scheduler sheds a request; callers should use their fallback."""
+
+
+class LLMUnavailable(LLMError):
+    """Raised without contacting LM Studio while the circuit breaker is open."""
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _build_session():
+    pool_size = int(os.getenv('LLM_POOL_SIZE', 8))
+    session = requests.Session()
+    # 本地服务器不走系统代理（之前改用 curl 的"兼容性问题"主要就是代理环境变量导致的）
+    session.trust_env = False
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Content-Type': 'application/json; charset=utf-8'})
+    return session
+
+
+def get_session():
+    """Return the process-wide pooled session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def lm_studio_base_url(url=None):
+    """Normalise LM_STUDIO_URL to the server root (without a trailing /v1)."""
+    base = (url if url is not None else os.getenv('LM_STUDIO_URL', 'http://localhost:1234/v1')).strip().rstrip('/')
+    if base.endswith('/v1'):
+        base = base[:-3]
+    return base
+
+
+def chat_url(url=None):
+    return f"{lm_studio_base_url(url)}/v1/chat/completions"
+
+
+def _timeouts(timeout):
+    connect_timeout = float(os.getenv('LLM_CONNECT_TIMEOUT', 5))
+    return (min(connect_timeout, timeout), timeout)
+
+
+def _record_response(response):
+    # 5xx 说明后端不可用（模型未加载等）；4xx 是请求本身的问题，服务器是健康的
+    if response.status_code >= 500:
+        breaker.record_failure(f"HTTP {response.status_code}")
+    else:
+        breaker.record_success()
+
+
+@contextmanager
+def _llm_slot(priority):
+    """Take a scheduler slot, translating a shed request into LLMOverloaded.
+
+    Raises LLMUnavailable first if the circuit breaker is open.
+    """
+    if not breaker.allow():
+        raise LLMUnavailable("LM Studio 熔断中，跳过请求")
+    try:
+        with scheduler.slot(priority):
+            yield
+    except SchedulerOverloaded as e:
+        raise LLMOverloaded(str(e)) from e
+
+
+def chat_completion(messages, temperature=0.7, max_tokens=200, timeout=60, url=None,
+                    priority=PRIORITY_BACKGROUND, **extra):
+    """Send one chat completion request to LM Studio and return the message text.
+
+    Args:
+        messages: OpenAI-style message list
+        temperature: sampling temperature
+        max_tokens: completion token limit
+        timeout: read timeout in seconds for this call
+        url: override for LM_STUDIO_URL
+        priority: llm_scheduler priority class of this request
+        **extra: additional request fields (model, top_p, ...)
+
+    Raises:
+        LLMUnavailable: if the circuit breaker is open
+        LLMOverloaded: if the scheduler sheds the request
+        LLMError: on transport errors, non-200 responses or malformed payloads
+    """
+    request_data = {
+        'messages': messages,
+        'temperature': temperature,
+        'max_tokens': max_tokens,
+    }
+    request_data.update(extra)
+    body = json.dumps(request_data, ensure_ascii=False).encode('utf-8')
+
+    with _llm_slot(priority):
+        try:
+            response = get_session().post(chat_url(url), data=body, timeout=_timeouts(timeout))
+        except requests.RequestException as e:
+            breaker.record_failure(f"{type(e).__name__}: {e}")
+            raise LLMError(f"LM Studio 请求失败: {type(e).__name__}: {e}") from e
+        _record_response(response)
+
+    if response.status_code != 200:
+        raise LLMError(f"LM Studio HTTP {response.status_code}: {response.text[:200]}")
+
+    try:
+        response.encoding = 'utf-8'
+        data = response.json()
+        return data['choices'][0]['message']['content']
+    except (ValueError, KeyError, IndexError, TypeError) as e:
+        raise LLMError(f"LM Studio 响应解析失败: {e}") from e
+
+
+def stream_chat_completion(messages, temperature=0.7, max_tokens=200, timeout=60, url=None,
+                           priority=PRIORITY_INTERACTIVE, **extra):
+    """Stream a chat completion from LM Studio, yielding content deltas as they arrive.
+
+    Uses the same pooled session as chat_completion(); `timeout` bounds the wait
+    between two chunks rather than the whole response. The scheduler slot is
+    held until the stream is exhausted or the generator is closed.
+
+    Raises:
+        LLMUnavailable: if the circuit breaker is open
+        LLMOverloaded: if the scheduler sheds the request
+        LLMError: on transport errors, non-200 responses or malformed chunks
+    """
+    request_data = {
+        'messages': messages,
+        'temperature': temperature,
+        'max_tokens': max_tokens,
+        'stream': True,
+    }
+    request_data.update(extra)
+    body = json.dumps(request_data, ensure_ascii=False).encode('utf-8')
+
+    with _llm_slot(priority):
+        try:
+            response = get_session().post(chat_url(url), data=body, timeout=_timeouts(timeout), stream=True)
+        except requests.RequestException as e:
+            breaker.record_failure(f"{type(e).__name__}: {e}")
+            raise LLMError(f"LM Studio 请求失败: {type(e).__name__}: {e}") from e
+        _record_response(response)
+
+        try:
+            if response.status_code != 200:
+                raise LLMError(f"LM Studio HTTP {response.status_code}: {response.text[:200]}")
+
+            for raw_line in response.iter_lines(decode_unicode=False):
+                if not raw_line:
+                    continue
+                line = raw_line.decode('utf-8', errors='ignore').strip()
+                if not line.startswith('data:'):
+                    continue
+                payload = line[5:].strip()
+                if payload == '[DONE]':
+                    break
+                try:
+                    chunk = json.loads(payload)
+                    delta = chunk['choices'][0].get('delta', {}).get('content')
+                except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+                    raise LLMError(f"LM Studio 流式响应解析失败: {e}") from e
+                if delta:
+                    yield delta
+        except requests.RequestException as e:
+            breaker.record_failure(f"{type(e).__name__}: {e}")
+            raise LLMError(f"LM Studio 流式读取中断: {type(e).__name__}: {e}") from e
+        finally:
+            response.close()
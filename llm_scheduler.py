@@ -0,0 +1,157 @@
+"""Priority-aware admission control in front of the local LLM server.
+
+LM Studio answers 503 once too many requests run at the same time, so every
+LLM call has to take a slot here first. At most LLM_MAX_INFLIGHT requests run
+concurrently; the rest wait in a bounded queue ordered by priority class.
+A request is shed (SchedulerOverloaded) when the queue is full or when its
+expected or actual wait exceeds the deadline of its class, so callers can fall
+back to their templates instead of piling up.
+"""
+import os
+import threading
+import time
+from bisect import insort
+from contextlib import contextmanager
+from itertools import count
+
+PRIORITY_INTERACTIVE = 0   # 楼主回复
+PRIORITY_TRANSLATION = 1   # /api/translate
+PRIORITY_BACKGROUND = 2    # 定时生成故事、扩写、音频描述
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_TRANSLATION: 'translation',
+    PRIORITY_BACKGROUND: 'background',
+}
+
+DEFAULT_DEADLINES = {
+    PRIORITY_INTERACTIVE: float(os.getenv('LLM_DEADLINE_INTERACTIVE', 20)),
+    PRIORITY_TRANSLATION: float(os.getenv('LLM_DEADLINE_TRANSLATION', 30)),
+    PRIORITY_BACKGROUND: float(os.getenv('LLM_DEADLINE_BACKGROUND', 300)),
+}
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when a request is shed instead of being queued."""
+
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'shed')
+
+    def __init__(self, priority, seq):
+        self.priority = priority
+        self.seq = seq
+        self.shed = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LLMScheduler:
+    def __init__(self, max_inflight=2, max_queue=32, deadlines=None, initial_service_time=8.0):
+        self.max_inflight = max(1, max_inflight)
+        self.max_queue = max(0, max_queue)
+        self.deadlines = dict(DEFAULT_DEADLINES if deadlines is None else deadlines)
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._waiters = []          # sorted by (priority, seq)
+        self._seq = count()
+        # 平均服务时间（指数滑动平均），用于估算排队等待时间
+        self._avg_service = initial_service_time
+        self._stats = {'admitted': 0, 'shed': 0, 'completed': 0}
+
+    def _estimated_wait(self, priority):
+        ahead = sum(1 for w in self._waiters if w.priority <= priority)
+        if self._inflight < self.max_inflight and ahead == 0:
+            return 0.0
+        return (ahead // self.max_inflight + 1) * self._avg_service
+
+    def _shed(self, reason):
+        self._stats['shed'] += 1
+        raise SchedulerOverloaded(reason)
+
+    def _acquire(self, priority, deadline):
+        with self._cond:
+            if self._inflight < self.max_inflight and not self._waiters:
+                self._inflight += 1
+                self._stats['admitted'] += 1
+                return
+
+            name = PRIORITY_NAMES.get(priority, priority)
+            expected = self._estimated_wait(priority)
+            if expected > deadline:
+                self._shed(f"LLM 队列繁忙: {name} 预计等待 {expected:.1f}s 超过 {deadline:.0f}s")
+
+            if len(self._waiters) >= self.max_queue:
+                # 队列已满：若有更低优先级的等待者则挤掉它，否则拒绝自己
+                worst = self._waiters[-1] if self._waiters else None
+                if worst is None or worst.priority <= priority:
+                    self._shed(f"LLM 队列已满 ({self.max_queue})，丢弃 {name} 请求")
+                self._waiters.pop()
+                worst.shed = True
+                self._cond.notify_all()
+
+            waiter = _Waiter(priority, next(self._seq))
+            insort(self._waiters, waiter)
+            give_up_at = time.monotonic() + deadline
+            try:
+                while True:
+                    if waiter.shed:
+                        self._shed(f"LLM 队列已满，{name} 请求被更高优先级请求挤出")
+                    if self._waiters[0] is waiter and self._inflight < self.max_inflight:
+                        self._waiters.pop(0)
+                        self._inflight += 1
+                        self._stats['admitted'] += 1
+                        if self._inflight < self.max_inflight and self._waiters:
+                            # 还有空闲槽位：下一个等待者可能已先被唤醒又睡回去了，再叫醒一次
+                            self._cond.notify_all()
+                        return
+                    remaining = give_up_at - time.monotonic()
+                    if remaining <= 0:
+                        self._shed(f"LLM 队列等待超过 {deadline:.0f}s，放弃 {name} 请求")
+                    self._cond.wait(remaining)
+            except SchedulerOverloaded:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    self._cond.notify_all()
+                raise
+
+    def _release(self, service_time):
+        with self._cond:
+            self._inflight -= 1
+            self._stats['completed'] += 1
+            self._avg_service = 0.8 * self._avg_service + 0.2 * service_time
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_BACKGROUND, deadline=None):
+        """Hold one in-flight slot for the duration of the block.
+
+        Raises:
+            SchedulerOverloaded: if the request is shed instead of admitted
+        """
+        if deadline is None:
+            deadline = self.deadlines.get(priority, DEFAULT_DEADLINES[PRIORITY_BACKGROUND])
+        self._acquire(priority, deadline)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - started)
+
+    def stats(self):
+        with self._cond:
+            return dict(
+                self._stats,
+                inflight=self._inflight,
+                queued=len(self._waiters),
+                avg_service_seconds=round(self._avg_service, 2),
+                max_inflight=self.max_inflight,
+                max_queue=self.max_queue,
+            )
+
+
+scheduler = LLMScheduler(
+    max_inflight=int(os.getenv('LLM_MAX_INFLIGHT', 2)),
+    max_queue=int(os.getenv('LLM_MAX_QUEUE', 32)),
+)
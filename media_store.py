@@ -0,0 +1,289 @@
+"""Sharded storage and garbage collection for generated evidence media.
+
+Generated images and audio used to be written into one flat
+static/generated/ directory. They were never deleted, even after
+admin_reset_ai_stories / daily_story_refresh bulk-deleted the stories
+pointing at them. New files go into hashed subdirectories:
+
+    static/generated/<aa>/<bb>/<filename>      (aa/bb = sha1(filename)[:2], [2:4])
+
+Each one is recorded in the MediaFile table (path, story, type, size).
+Evidence.file_path rows are the references.
+
+collect_garbage(), run periodically from scheduler_tasks:
+  1. deletes Evidence rows whose story no longer exists;
+  2. deletes media files (tracked or not) that no Evidence row references
+     once they are older than MEDIA_GC_GRACE_SECONDS;
+  3. moves referenced files left in the flat directory into their shard and
+     updates Evidence.file_path;
+  4. enforces MEDIA_DISK_BUDGET_MB: first replaces images of ended stories
+     with copies downscaled to MEDIA_DOWNSCALE_WIDTH (under a new file name,
+     since media URLs are cached as immutable), then evicts the oldest media
+     of ended stories.
+"""
+import hashlib
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+from PIL import Image
+from sqlalchemy.orm import Session
+
+from app_models import lookup
+
+MEDIA_ROOT = os.path.join('static', 'generated')
+MEDIA_DISK_BUDGET_MB = float(os.getenv('MEDIA_DISK_BUDGET_MB', 2048))
+MEDIA_GC_GRACE_SECONDS = int(os.getenv('MEDIA_GC_GRACE_SECONDS', 3600))
+MEDIA_DOWNSCALE_WIDTH = int(os.getenv('MEDIA_DOWNSCALE_WIDTH', 256))
+MEDIA_CACHE_MAX_AGE = int(os.getenv('MEDIA_CACHE_MAX_AGE', 365 * 24 * 3600))
+MEDIA_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.wav', '.mp3', '.ogg', '.opus')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+_gc_lock = threading.Lock()
+_last_gc = {}
+
+
+def _shard(filename):
+    digest = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+    return digest[:2], digest[2:4]
+
+
+def allocate(filename):
+    """Sharded location for a new media file. Returns (filepath on disk, URL)."""
+    a, b = _shard(filename)
+    directory = os.path.join(MEDIA_ROOT, a, b)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, filename), f"/static/generated/{a}/{b}/{filename}"
+
+
+def relpath_for_url(url):
+    """'/static/generated/ab/cd/x.png' or '/generated/x.wav' -> path under static/ ('generated/...')."""
+    rel = (url or '').lstrip('/')
+    if rel.startswith('static/'):
+        rel = rel[len('static/'):]
+    return rel if rel.startswith('generated/') else None
+
+
+def register(filepath, story_id=None, media_type=None):
+    """Record a freshly written media file. Safe to call outside an app context (then a no-op).
+
+    Uses its own session, so the caller's pending changes are neither committed
+    nor rolled back.
+    """
+    try:
+        db, MediaFile = lookup('db', 'MediaFile')
+        rel = os.path.relpath(filepath, 'static').replace(os.sep, '/')
+        if media_type is None:
+            media_type = _media_type(rel)
+        with Session(db.engine) as session:
+            session.add(MediaFile(path=rel, story_id=story_id, media_type=media_type,
+                                  size_bytes=os.path.getsize(filepath)))
+            session.commit()
+    except Exception as e:
+        print(f"[media_store] 登记文件失败（GC 时会重新发现）: {type(e).__name__}: {e}")
+
+
+def _remove_derivatives(rel):
+    from image_assets import DERIVED_DIR
+    stem = os.path.splitext(os.path.basename(rel))[0] + '.'
+    derived_dir = os.path.join('static', DERIVED_DIR, os.path.dirname(rel))
+    try:
+        for name in os.listdir(derived_dir):
+            if name.startswith(stem):
+                os.remove(os.path.join(derived_dir, name))
+    except OSError:
+        pass
+
+
+def _remove_file(rel):
+    """Delete static/<rel> and its image_assets derivatives. Returns the bytes freed."""
+    freed = 0
+    path = os.path.join('static', rel)
+    try:
+        freed = os.path.getsize(path)
+        os.remove(path)
+    except OSError:
+        pass
+    _remove_derivatives(rel)
+    return freed
+
+
+def _walk_media():
+    """Yield (relpath under static/, full path) for every media file under MEDIA_ROOT."""
+    for root, _, files in os.walk(MEDIA_ROOT):
+        for name in files:
+            if name.lower().endswith(MEDIA_EXTENSIONS):
+                full = os.path.join(root, name)
+                yield os.path.relpath(full, 'static').replace(os.sep, '/'), full
+
+
+def _downscale(rel):
+    """Write a copy of an image shrunk to MEDIA_DOWNSCALE_WIDTH under a new name.
+
+    Media URLs are served as immutable, so the file behind a URL is never
+    rewritten. The caller repoints references to the copy and removes the
+    original. Returns (new relpath, new URL, bytes saved), or None when the
+    image is already small enough.
+    """
+    from image_assets import create_derivatives
+    path = os.path.join('static', rel)
+    with Image.open(path) as opened:
+        if opened.width <= MEDIA_DOWNSCALE_WIDTH:
+            return None
+        height = max(1, round(opened.height * MEDIA_DOWNSCALE_WIDTH / opened.width))
+        image = opened.convert('RGB').resize((MEDIA_DOWNSCALE_WIDTH, height), Image.Resampling.LANCZOS)
+    stem, extension = os.path.splitext(os.path.basename(rel))
+    new_path, new_url = allocate(f"{stem}_w{MEDIA_DOWNSCALE_WIDTH}{extension}")
+    image.save(new_path + '.tmp', format=opened.format or 'PNG', optimize=True)
+    os.replace(new_path + '.tmp', new_path)
+    create_derivatives(new_url, force=True)
+    new_rel = os.path.relpath(new_path, 'static').replace(os.sep, '/')
+    return new_rel, new_url, os.path.getsize(path) - os.path.getsize(new_path)
+
+
+def _media_type(rel):
+    return 'image' if rel.lower().endswith(IMAGE_EXTENSIONS) else 'audio'
+
+
+def collect_garbage():
+    """Run one GC pass. Must run inside an app context. Returns a summary dict."""
+    db, Evidence, Story, MediaFile = lookup('db', 'Evidence', 'Story', 'MediaFile')
+
+    if not _gc_lock.acquire(blocking=False):
+        return {'skipped': 'GC 正在运行'}
+    try:
+        started = time.monotonic()
+        summary = {'orphan_evidence': 0, 'deleted_files': 0, 'migrated': 0, 'adopted': 0,
+                   'downscaled': 0, 'evicted': 0, 'freed_mb': 0.0}
+        freed = 0
+
+        # 1) 故事被批量删除（不走级联）后遗留的 Evidence 行
+        summary['orphan_evidence'] = Evidence.query.filter(
+            ~Evidence.story_id.in_(db.session.query(Story.id))
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+        refs = {}
+        for evidence in Evidence.query.filter(Evidence.file_path.isnot(None)).all():
+            rel = relpath_for_url(evidence.file_path)
+            if rel:
+                refs.setdefault(rel, []).append(evidence)
+        tracked = {m.path: m for m in MediaFile.query.all()}
+        cutoff = time.time() - MEDIA_GC_GRACE_SECONDS
+
+        # 2) 删除无引用的文件；3) 把仍被引用的扁平目录旧文件迁入分片目录
+        for rel, full in list(_walk_media()):
+            if rel not in refs:
+                if os.path.getmtime(full) < cutoff:
+                    freed += _remove_file(rel)
+                    summary['deleted_files'] += 1
+                    if rel in tracked:
+                        db.session.delete(tracked.pop(rel))
+                continue
+            if rel.count('/') == 1:
+                new_full, new_url = allocate(os.path.basename(rel))
+                shutil.move(full, new_full)
+                _remove_derivatives(rel)
+                new_rel = os.path.relpath(new_full, 'static').replace(os.sep, '/')
+                for evidence in refs[rel]:
+                    evidence.file_path = new_url
+                refs[new_rel] = refs.pop(rel)
+                if rel in tracked:
+                    tracked[new_rel] = tracked.pop(rel)
+                    tracked[new_rel].path = new_rel
+                rel, full = new_rel, new_full
+                summary['migrated'] += 1
+            media = tracked.get(rel)
+            if media is None:
+                media = MediaFile(path=rel, media_type=_media_type(rel), size_bytes=os.path.getsize(full),
+                                  created_at=datetime.utcfromtimestamp(os.path.getmtime(full)))
+                db.session.add(media)
+                tracked[rel] = media
+                summary['adopted'] += 1
+            if media.story_id is None:
+                media.story_id = refs[rel][0].story_id
+        for rel, media in list(tracked.items()):
+            if not os.path.exists(os.path.join('static', rel)):
+                db.session.delete(media)
+                del tracked[rel]
+        db.session.commit()
+
+        # 4) 磁盘预算：先缩小已完结故事的图片，仍超出则按时间淘汰已完结故事的媒体
+        budget = int(MEDIA_DISK_BUDGET_MB * 1024 * 1024)
+        total = sum(m.size_bytes or 0 for m in tracked.values())
+        if total > budget:
+            replaced = []
+            ended = MediaFile.query.join(Story, Story.id == MediaFile.story_id) \
+                .filter(Story.current_state == 'ended').order_by(MediaFile.created_at).all()
+            for media in ended:
+                if total <= budget:
+                    break
+                if media.media_type != 'image' or media.downscaled:
+                    continue
+                try:
+                    result = _downscale(media.path)
+                except OSError as e:
+                    print(f"[media_store] 缩小 {media.path} 失败: {e}")
+                    continue
+                media.downscaled = True
+                if result is None:
+                    continue
+                # 缩小后的图片换了文件名，引用改指新文件，原文件在提交后删除
+                new_rel, new_url, saved = result
+                for evidence in refs.get(media.path, ()):
+                    evidence.file_path = new_url
+                refs[new_rel] = refs.pop(media.path, [])
+                tracked[new_rel] = tracked.pop(media.path, media)
+                replaced.append(media.path)
+                media.path = new_rel
+                media.size_bytes = (media.size_bytes or 0) - saved
+                total -= saved
+                freed += saved
+                summary['downscaled'] += 1
+            for media in ended:
+                if total <= budget:
+                    break
+                freed += _remove_file(media.path)
+                total -= media.size_bytes or 0
+                for evidence in refs.get(media.path, ()):
+                    db.session.delete(evidence)
+                db.session.delete(media)
+                tracked.pop(media.path, None)
+                summary['evicted'] += 1
+            db.session.commit()
+            for rel in replaced:
+                _remove_file(rel)
+            if total > budget:
+                print(f"[media_store] ⚠️ 已完结故事的媒体清理后仍超出预算: {total / 1024 / 1024:.1f}MB")
+
+        summary['freed_mb'] = round(freed / 1024 / 1024, 2)
+        summary['total_mb'] = round(total / 1024 / 1024, 2)
+        summary['files'] = len(tracked)
+        summary['seconds'] = round(time.monotonic() - started, 2)
+        summary['finished_at'] = datetime.utcnow().isoformat()
+        _last_gc.clear()
+        _last_gc.update(summary)
+        print(f"[media_store] GC 完成: {summary}")
+        return summary
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        _gc_lock.release()
+
+
+def stats():
+    return {'budget_mb': MEDIA_DISK_BUDGET_MB, 'last_gc': dict(_last_gc) or None}
+
+
+def discard(url):
+    """Delete a media file that is no longer referenced, with its derivatives and MediaFile row."""
+    db, MediaFile = lookup('db', 'MediaFile')
+    rel = relpath_for_url(url)
+    if rel is None:
+        return
+    _remove_file(rel)
+    MediaFile.query.filter_by(path=rel).delete(synchronize_session=False)
+    db.session.commit()
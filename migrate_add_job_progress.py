@@ -0,0 +1,73 @@
+"""
+数据库迁移脚本：为Job表添加story_id、progress、stage字段（证据任务进度/取消）
+运行此脚本来更新现有数据库
+"""
+import sqlite3
+import os
+
+COLUMNS = [
+    ('story_id', 'INTEGER'),
+    ('progress', 'INTEGER NOT NULL DEFAULT 0'),
+    ('stage', 'VARCHAR(50)'),
+]
+
+def migrate():
+    # 尝试多个可能的数据库路径
+    possible_paths = [
+        'instance/ai_urban_legends.db',
+        'ai_urban_legends.db'
+    ]
+    
+    db_path = None
+    for path in possible_paths:
+        if os.path.exists(path):
+            db_path = path
+            break
+    
+    if not db_path:
+        print("ℹ️  数据库文件不存在")
+        print("💡 这是正常的!首次运行时数据库会自动创建")
+        return
+    
+    print(f"📂 找到数据库文件: {db_path}")
+    
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("PRAGMA table_info(job)")
+        columns = [col[1] for col in cursor.fetchall()]
+        
+        if not columns:
+            print("ℹ️  job表不存在，服务器启动时会自动创建")
+            return
+        
+        added = []
+        for name, ddl in COLUMNS:
+            if name in columns:
+                continue
+            print(f"📝 添加{name}字段到job表...")
+            cursor.execute(f"ALTER TABLE job ADD COLUMN {name} {ddl}")
+            added.append(name)
+        
+        if 'story_id' in added:
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_job_story_id ON job (story_id)")
+            # 已有任务从 payload 里回填 story_id
+            cursor.execute("UPDATE job SET story_id = json_extract(payload, '$.story_id') WHERE story_id IS NULL")
+        
+        conn.commit()
+        if added:
+            print("✅ 数据库迁移完成!")
+            print(f"   - 已添加 job.{', job.'.join(added)} 字段")
+        else:
+            print("✅ 字段已存在，无需迁移")
+        
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    print("🔄 开始数据库迁移...")
+    migrate()
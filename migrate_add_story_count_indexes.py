@@ -0,0 +1,65 @@
+"""
+数据库迁移脚本：为comment.story_id和evidence.story_id添加索引（/api/stories按故事统计评论数/证据数）
+运行此脚本来更新现有数据库
+"""
+import sqlite3
+import os
+
+INDEXES = [
+    ('ix_comment_story_id', 'comment'),
+    ('ix_evidence_story_id', 'evidence'),
+]
+
+def migrate():
+    # 尝试多个可能的数据库路径
+    possible_paths = [
+        'instance/ai_urban_legends.db',
+        'ai_urban_legends.db'
+    ]
+    
+    db_path = None
+    for path in possible_paths:
+        if os.path.exists(path):
+            db_path = path
+            break
+    
+    if not db_path:
+        print("ℹ️  数据库文件不存在")
+        print("💡 这是正常的!首次运行时数据库会自动创建")
+        return
+    
+    print(f"📂 找到数据库文件: {db_path}")
+    
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        added = []
+        for index, table in INDEXES:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
+            if cursor.fetchone() is None:
+                print(f"ℹ️  {table}表不存在，服务器启动时会自动创建")
+                continue
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='index' AND name=?", (index,))
+            if cursor.fetchone() is not None:
+                continue
+            print(f"📝 为{table}.story_id添加索引...")
+            cursor.execute(f"CREATE INDEX {index} ON {table} (story_id)")
+            added.append(index)
+        
+        conn.commit()
+        if added:
+            print("✅ 数据库迁移完成!")
+            print(f"   - 已添加索引 {', '.join(added)}")
+        else:
+            print("✅ 索引已存在，无需迁移")
+        
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    print("🔄 开始数据库迁移...")
+    migrate()
@@ -0,0 +1,155 @@
+"""NumPy renderer for placeholder evidence photos (USE_DIFFUSER_IMAGE=false).
+
+The placeholder path of generate_evidence_image used to add grain pixel by
+pixel through img.load() and round-trip the whole image through NumPy once per
+scanline. Here every step (grain, blur, desaturation and overlays through
+evidence_look, scanlines) works on one float32 buffer of shape (N, 512, 512, 3),
+so a batch of placeholders costs a handful of vectorised passes and a single
+conversion back to PIL per image. The scene layers only depend on the title
+keywords and are cached.
+"""
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+from evidence_look import PLACEHOLDER_LOOK
+
+SIZE = 512
+BACKGROUND = (30, 32, 35)
+
+# 根据标题关键词选择具象的简单几何场景：(关键词, [(形状, 坐标, 颜色), ...])
+# 坐标与 PIL ImageDraw 一致：rect/ellipse 为 [x0, y0, x1, y1]（含端点），
+# vline/hline 为 (位置, 起点, 终点, 线宽)
+SCENE_LAYOUTS = [
+    (('地铁', '车厢'), [   # 地铁车厢内部：座椅、扶手
+        ('rect', (50, 300, 150, 450), (40, 42, 45)),
+        ('rect', (350, 300, 450, 450), (38, 40, 43)),
+        ('vline', (256, 0, 200, 5), (60, 60, 60)),
+    ]),
+    (('镜子',), [          # 镜子和洗手台
+        ('rect', (100, 100, 400, 400), (45, 48, 52)),
+        ('rect', (150, 350, 350, 450), (55, 55, 58)),
+    ]),
+    (('门', '楼道'), [     # 门和走廊
+        ('rect', (180, 50, 330, 480), (50, 45, 40)),
+        ('ellipse', (235, 240, 275, 280), (70, 70, 70)),
+        ('rect', (10, 100, 100, 150), (60, 55, 50)),
+    ]),
+]
+DEFAULT_LAYOUT = [         # 默认：房间内部物品
+    ('rect', (80, 250, 200, 450), (45, 43, 40)),
+    ('rect', (320, 200, 450, 400), (42, 40, 38)),
+    ('hline', (380, 0, 512, 3), (35, 33, 30)),
+]
+
+GRAIN_AMPLITUDE = 8        # 胶片颗粒：隔行隔列的像素加 [-8, 8] 的噪声，蓝色通道再偏移 +2
+BLUR_SIGMA = 1.5           # 对焦不准/手抖
+SCANLINE_STEP = 8
+SCANLINE_GAIN = 0.95
+
+def layout_for_title(title):
+    title = title or ''
+    for index, (keywords, _) in enumerate(SCENE_LAYOUTS):
+        if any(k in title for k in keywords):
+            return index
+    return -1
+
+
+@lru_cache(maxsize=None)
+def _scene_layer(layout_index):
+    """Float32 (512, 512, 3) base image for one scene layout (read-only, cached)."""
+    layer = np.empty((SIZE, SIZE, 3), dtype=np.float32)
+    layer[:] = BACKGROUND
+    shapes = SCENE_LAYOUTS[layout_index][1] if layout_index >= 0 else DEFAULT_LAYOUT
+    for kind, coords, color in shapes:
+        if kind == 'rect':
+            x0, y0, x1, y1 = coords
+            layer[y0:y1 + 1, x0:x1 + 1] = color
+        elif kind == 'ellipse':
+            x0, y0, x1, y1 = coords
+            cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+            rx, ry = (x1 - x0) / 2, (y1 - y0) / 2
+            yy, xx = np.ogrid[y0:y1 + 1, x0:x1 + 1]
+            mask = ((xx - cx) / rx) ** 2 + ((yy - cy) / ry) ** 2 <= 1.0
+            layer[y0:y1 + 1, x0:x1 + 1][mask] = color
+        elif kind == 'vline':
+            x, y0, y1, width = coords
+            half = width // 2
+            layer[y0:y1 + 1, x - half:x + half + 1] = color
+        elif kind == 'hline':
+            y, x0, x1, width = coords
+            half = width // 2
+            layer[y - half:y + half + 1, x0:x1] = color
+    layer.setflags(write=False)
+    return layer
+
+
+@lru_cache(maxsize=8)
+def _gaussian_kernel(sigma):
+    radius = max(1, int(round(3 * sigma)))
+    x = np.arange(-radius, radius + 1, dtype=np.float32)
+    kernel = np.exp(-(x * x) / (2 * sigma * sigma))
+    return kernel / kernel.sum()
+
+
+def _blur(batch, sigma):
+    """Separable Gaussian blur over axes 1 (rows) and 2 (columns) with edge padding."""
+    kernel = _gaussian_kernel(sigma)
+    radius = len(kernel) // 2
+    height, width = batch.shape[1:3]
+    scratch = np.empty_like(batch)
+
+    padded = np.pad(batch, ((0, 0), (radius, radius), (0, 0), (0, 0)), mode='edge')
+    out = np.multiply(padded[:, :height], kernel[0])
+    for offset in range(1, len(kernel)):
+        np.multiply(padded[:, offset:offset + height], kernel[offset], out=scratch)
+        out += scratch
+
+    padded = np.pad(out, ((0, 0), (0, 0), (radius, radius), (0, 0)), mode='edge')
+    np.multiply(padded[:, :, :width], kernel[0], out=out)
+    for offset in range(1, len(kernel)):
+        np.multiply(padded[:, :, offset:offset + width], kernel[offset], out=scratch)
+        out += scratch
+    return out
+
+
+def render_placeholder_batch(titles, rng=None, overlays=None):
+    """Render one placeholder photo per title. Returns a list of PIL RGB images.
+
+    `overlays` is an optional list (one entry per title) of evidence_look
+    overlays, e.g. surveillance_overlays(), blended in before the scanlines.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    count = len(titles)
+    if count == 0:
+        return []
+
+    batch = np.empty((count, SIZE, SIZE, 3), dtype=np.float32)
+    for i, title in enumerate(titles):
+        batch[i] = _scene_layer(layout_for_title(title))
+
+    # 1) 胶片颗粒（隔行隔列）
+    grain = rng.integers(-GRAIN_AMPLITUDE, GRAIN_AMPLITUDE + 1, size=(count, SIZE // 2, SIZE // 2, 1)).astype(np.float32)
+    sub = batch[:, ::2, ::2]
+    sub += grain
+    sub[..., 2] += 2
+    np.clip(sub, 0, 255, out=sub)
+
+    # 2) 模糊
+    batch = _blur(batch, BLUR_SIGMA)
+
+    # 3) 降低饱和度 + 时间戳/REC 叠加层
+    for i in range(count):
+        PLACEHOLDER_LOOK.apply(batch[i], rng=rng, overlays=overlays[i] if overlays else ())
+
+    # 4) 监控录像风格的扫描线
+    batch[:, ::SCANLINE_STEP] *= SCANLINE_GAIN
+
+    np.clip(batch, 0, 255, out=batch)
+    pixels = batch.astype(np.uint8)
+    return [Image.fromarray(pixels[i], 'RGB') for i in range(count)]
+
+
+def render_placeholder(title, rng=None, overlays=()):
+    return render_placeholder_batch([title], rng=rng, overlays=[overlays])[0]
@@ -0,0 +1,119 @@
+"""In-process registry of 楼主 replies that are still being generated.
+
+add_comment opens a stream per user comment, the reply worker pushes visible
+text into it, and the SSE endpoint reads from it. Streams are kept for a short
+while after they finish so late subscribers still get the final reply.
+
+When an attempt fails and the ai_reply job will be retried, the stream is
+marked failed instead of finished. The retry reopens it with empty text and
+subscribers receive a 'reset' event before the new tokens.
+"""
+import os
+import threading
+import time
+
+STREAM_RETENTION_SECONDS = int(os.getenv('REPLY_STREAM_RETENTION_SECONDS', 120))
+
+_streams = {}
+_streams_lock = threading.Lock()
+
+
+class ReplyStream:
+    def __init__(self, comment_id):
+        self.comment_id = comment_id
+        self.text = ''
+        self.attempt = 0
+        self.failed = False
+        self.done = False
+        self.result = None
+        self.finished_at = None
+        self._cond = threading.Condition()
+
+    def push(self, delta):
+        if not delta:
+            return
+        with self._cond:
+            self.text += delta
+            self._cond.notify_all()
+
+    def finish(self, result):
+        """Mark the reply as complete. `result` is the payload of the final `done` event."""
+        with self._cond:
+            self.done = True
+            self.result = result
+            self.finished_at = time.time()
+            self._cond.notify_all()
+
+    def fail(self):
+        """Mark the current attempt as failed; the next open_reply_stream() starts over."""
+        with self._cond:
+            self.failed = True
+
+    def restart(self):
+        """Drop the text of a failed attempt and notify subscribers."""
+        with self._cond:
+            self.text = ''
+            self.attempt += 1
+            self.failed = False
+            self._cond.notify_all()
+
+    def events(self, heartbeat=15, max_duration=300):
+        """Yield (event, data) tuples: 'token' with new text, 'ping' while idle, then 'done'.
+
+        Each subscriber keeps its own read offset, so one that joins late first
+        receives everything streamed so far in a single token event. A 'reset'
+        event means a retry started over and the text received so far is void.
+        """
+        sent = 0
+        attempt = self.attempt
+        deadline = time.time() + max_duration
+        while True:
+            with self._cond:
+                if len(self.text) == sent and not self.done and self.attempt == attempt:
+                    self._cond.wait(timeout=heartbeat)
+                reset = self.attempt != attempt
+                if reset:
+                    attempt = self.attempt
+                    sent = 0
+                chunk = self.text[sent:]
+                sent = len(self.text)
+                done = self.done
+                result = self.result
+
+            if reset:
+                yield 'reset', {}
+            if chunk:
+                yield 'token', {'text': chunk}
+            if done:
+                yield 'done', result or {}
+                return
+            if time.time() > deadline:
+                yield 'done', {'timeout': True}
+                return
+            if not chunk and not reset:
+                yield 'ping', {}
+
+
+def _prune_locked(now):
+    expired = [cid for cid, s in _streams.items()
+               if s.done and s.finished_at and now - s.finished_at > STREAM_RETENTION_SECONDS]
+    for cid in expired:
+        del _streams[cid]
+
+
+def open_reply_stream(comment_id):
+    with _streams_lock:
+        _prune_locked(time.time())
+        stream = _streams.get(comment_id)
+        if stream is None:
+            stream = ReplyStream(comment_id)
+            _streams[comment_id] = stream
+        elif stream.failed:
+            # 上一次尝试失败、任务重试：清空已推送的文本重新开始
+            stream.restart()
+        return stream
+
+
+def get_reply_stream(comment_id):
+    with _streams_lock:
+        return _streams.get(comment_id)
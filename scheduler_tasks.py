@@ -57,9 +57,10 @@ def daily_story_refresh():
         print(f"   Result: {result}")
 
 def scheduled_state_progression():
-    """Check and progress story states"""
+    """Check story states and hand due transitions to the state_evidence workers"""
     from app import app, db, Story
-    from story_engine import check_state_transition, transition_story_state
+    from story_engine import check_state_transition
+    from state_evidence import submit_transition
     
     with app.app_context():
         print(f"[{datetime.now()}] Checking story state transitions...")
@@ -68,10 +69,25 @@ def scheduled_state_progression():
         
         for story in active_stories:
             if check_state_transition(story):
-                print(f"🔄 Transitioning story: {story.title}")
-                transition_story_state(story, app.app_context)
-                db.session.commit()
-                print(f"✅ Story transitioned to: {story.current_state}")
+                if submit_transition(app, story.id):
+                    print(f"🔄 Transitioning story: {story.title}")
+                else:
+                    print(f"⏭️  Skipped story: {story.title} (previous transition still running)")
+        
+        # check_state_transition 会为缺失状态数据的故事初始化状态
+        db.session.commit()
+
+def scheduled_media_gc():
+    """Delete orphaned generated media and enforce the media disk budget"""
+    from app import app
+    from media_store import collect_garbage
+
+    with app.app_context():
+        print(f"[{datetime.now()}] Collecting generated media garbage...")
+        try:
+            collect_garbage()
+        except Exception as e:
+            print(f"[media_gc] 媒体清理失败: {type(e).__name__}: {e}")
 
 def start_scheduler(app):
     """Initialize and start the background scheduler"""
@@ -157,6 +173,32 @@ def start_scheduler(app):
     )
     print(f"   - 🔄 State progression: every 30 minutes")
     
+    # 生成媒体垃圾回收：删除无引用文件，超出磁盘预算时缩小/淘汰已完结故事的媒体
+    media_gc_hours = float(os.getenv('MEDIA_GC_INTERVAL_HOURS', 6))
+    scheduler.add_job(
+        func=scheduled_media_gc,
+        trigger='interval',
+        hours=media_gc_hours,
+        id='media_gc',
+        name='Collect generated media garbage',
+        replace_existing=True
+    )
+    print(f"   - 🧹 Media GC: every {media_gc_hours:g} hours")
+    
+    # LM Studio 健康探测：驱动 llm_breaker 熔断器，宕机时请求直接走回退而不是等超时
+    if os.getenv('USE_LM_STUDIO', 'true').lower() == 'true':
+        from llm_breaker import probe_llm_health
+        probe_seconds = int(os.getenv('LLM_PROBE_INTERVAL_SECONDS', 30))
+        scheduler.add_job(
+            func=probe_llm_health,
+            trigger='interval',
+            seconds=probe_seconds,
+            id='llm_health_probe',
+            name='Probe LM Studio health',
+            replace_existing=True
+        )
+        print(f"   - 🩺 LM Studio health probe: every {probe_seconds} seconds")
+    
     scheduler.start()
     
     return scheduler
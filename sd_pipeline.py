@@ -0,0 +1,203 @@
+"""Process-wide Stable Diffusion pipeline cache.
+
+generate_evidence_image used to call StableDiffusionPipeline.from_pretrained()
+for every evidence image, reloading gigabytes of weights each time. The
+manager here loads a pipeline once, keeps it warm and serialises inference on
+it (diffusers pipelines are not safe to call from several threads at once).
+A pipeline that has not been used for SD_PIPELINE_IDLE_SECONDS is unloaded to
+give the memory back; the next request loads it again.
+
+SD_PROFILE selects how the pipeline is set up on CPU-only nodes. "default"
+keeps the stock scheduler and 20 steps. "cpu-fast" swaps in the
+DPM-Solver++ multistep scheduler (similar quality in about 12 steps), enables
+attention slicing and channels-last tensors, pins torch's intra-op thread
+count and can replace the VAE decoder with a tiny one (SD_TINY_VAE).
+"""
+import gc
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+SD_PIPELINE_IDLE_SECONDS = float(os.getenv('SD_PIPELINE_IDLE_SECONDS', 900))
+SD_PROFILE = os.getenv('SD_PROFILE', 'default').strip().lower()
+SD_FAST_STEPS = int(os.getenv('SD_FAST_STEPS', 12))
+SD_TORCH_THREADS = int(os.getenv('SD_TORCH_THREADS', 0))   # 0 = os.cpu_count()
+SD_TINY_VAE = os.getenv('SD_TINY_VAE', '').strip()         # 例如 madebyollin/taesd，留空则使用原 VAE
+
+# 只在 CPU 上生效；GPU 始终使用默认设置
+PROFILES = {
+    'default': {
+        'steps': None,
+        'scheduler': None,
+        'attention_slicing': False,
+        'channels_last': False,
+        'threads': None,
+        'tiny_vae': None,
+    },
+    'cpu-fast': {
+        'steps': SD_FAST_STEPS,
+        'scheduler': 'dpm-multistep',
+        'attention_slicing': True,
+        'channels_last': True,
+        'threads': SD_TORCH_THREADS or os.cpu_count() or 1,
+        'tiny_vae': SD_TINY_VAE or None,
+    },
+}
+
+
+class DiffusionPipelineManager:
+    def __init__(self, idle_ttl=900.0, profile='default'):
+        if profile not in PROFILES:
+            print(f"[sd_pipeline] ⚠️ 未知的 SD_PROFILE={profile}，使用 default")
+            profile = 'default'
+        self.idle_ttl = idle_ttl
+        self.profile = profile
+        self._lock = threading.RLock()
+        self._pipe = None
+        self._model_id = None
+        self._device = None
+        self._last_used = 0.0
+        self._reaper_running = False
+        self._stats = {'loads': 0, 'hits': 0, 'evictions': 0, 'last_load_seconds': None, 'applied': []}
+
+    def _load(self, model_id):
+        from diffusers import StableDiffusionPipeline
+        import torch
+
+        started = time.monotonic()
+        use_cuda = torch.cuda.is_available()
+        pipe = StableDiffusionPipeline.from_pretrained(
+            model_id,
+            torch_dtype=torch.float16 if use_cuda else torch.float32,
+            safety_checker=None,  # 禁用安全检查以允许恐怖内容
+            requires_safety_checker=False
+        )
+        if use_cuda:
+            pipe = pipe.to("cuda")
+            applied = ['gpu']
+        else:
+            applied = self._apply_cpu_profile(pipe, torch)
+
+        self._pipe = pipe
+        self._model_id = model_id
+        self._device = 'cuda' if use_cuda else 'cpu'
+        self._stats['loads'] += 1
+        self._stats['last_load_seconds'] = round(time.monotonic() - started, 2)
+        self._stats['applied'] = applied
+        print(f"[sd_pipeline] ✅ 已加载 {model_id} ({self._device}, profile={self.profile}: {', '.join(applied) or 'stock'}), "
+              f"用时 {self._stats['last_load_seconds']}s")
+        self._start_reaper()
+
+    def _apply_cpu_profile(self, pipe, torch):
+        """Apply the CPU settings of the active profile. Returns the list of applied tweaks."""
+        settings = PROFILES[self.profile]
+        applied = []
+        if settings['threads']:
+            torch.set_num_threads(settings['threads'])
+            applied.append(f"threads={settings['threads']}")
+        if settings['scheduler'] == 'dpm-multistep':
+            from diffusers import DPMSolverMultistepScheduler
+            pipe.scheduler = DPMSolverMultistepScheduler.from_config(pipe.scheduler.config)
+            applied.append('DPMSolverMultistep')
+        if settings['attention_slicing']:
+            pipe.enable_attention_slicing()
+            applied.append('attention_slicing')
+        if settings['tiny_vae']:
+            # 小 VAE 只是可选加速，加载失败时保留原 VAE
+            try:
+                from diffusers import AutoencoderTiny
+                pipe.vae = AutoencoderTiny.from_pretrained(settings['tiny_vae'], torch_dtype=torch.float32)
+                applied.append(f"tiny_vae={settings['tiny_vae']}")
+            except Exception as e:
+                print(f"[sd_pipeline] ⚠️ 小 VAE {settings['tiny_vae']} 加载失败，使用原 VAE: {type(e).__name__}: {e}")
+        if settings['channels_last']:
+            pipe.unet.to(memory_format=torch.channels_last)
+            pipe.vae.to(memory_format=torch.channels_last)
+            applied.append('channels_last')
+        return applied
+
+    def inference_steps(self, default):
+        """Number of denoising steps for a CPU render under the active profile."""
+        return PROFILES[self.profile]['steps'] or default
+
+    def _release_locked(self):
+        device = self._device
+        self._pipe = None
+        self._model_id = None
+        self._device = None
+        gc.collect()
+        if device == 'cuda':
+            try:
+                import torch
+                torch.cuda.empty_cache()
+            except Exception:
+                pass
+
+    def _start_reaper(self):
+        if self.idle_ttl <= 0 or self._reaper_running:
+            return
+        self._reaper_running = True
+        threading.Thread(target=self._reap_idle, daemon=True, name='sd-pipeline-reaper').start()
+
+    def _reap_idle(self):
+        interval = max(5.0, min(60.0, self.idle_ttl / 4))
+        while True:
+            time.sleep(interval)
+            # 推理进行中时拿不到锁，下一轮再检查
+            if not self._lock.acquire(blocking=False):
+                continue
+            try:
+                if self._pipe is None:
+                    self._reaper_running = False
+                    return
+                idle = time.monotonic() - self._last_used
+                if idle >= self.idle_ttl:
+                    print(f"[sd_pipeline] 空闲 {idle:.0f}s，卸载 {self._model_id}")
+                    self._stats['evictions'] += 1
+                    self._release_locked()
+                    self._reaper_running = False
+                    return
+            finally:
+                self._lock.release()
+
+    @contextmanager
+    def pipeline(self, model_id):
+        """Yield the warm pipeline for `model_id`, loading it on first use.
+
+        The pipeline is held exclusively for the duration of the block.
+        """
+        with self._lock:
+            if self._pipe is not None and self._model_id != model_id:
+                print(f"[sd_pipeline] 模型切换 {self._model_id} -> {model_id}")
+                self._release_locked()
+            if self._pipe is None:
+                self._load(model_id)
+            else:
+                self._stats['hits'] += 1
+            try:
+                yield self._pipe
+            finally:
+                self._last_used = time.monotonic()
+
+    @property
+    def device(self):
+        return self._device
+
+    def unload(self):
+        with self._lock:
+            if self._pipe is not None:
+                self._release_locked()
+
+    def stats(self):
+        return dict(
+            self._stats,
+            profile=self.profile,
+            loaded=self._pipe is not None,
+            model_id=self._model_id,
+            device=self._device,
+            idle_seconds=round(time.monotonic() - self._last_used, 1) if self._pipe is not None else None,
+        )
+
+
+diffusion_pipelines = DiffusionPipelineManager(idle_ttl=SD_PIPELINE_IDLE_SECONDS, profile=SD_PROFILE)
@@ -1,8 +1,18 @@
 from app import app
 from scheduler_tasks import start_scheduler
+from job_queue import start_job_workers
+from image_assets import start_static_derivatives
+from evidence_pool import start_evidence_pool
+from audio_bank import start_audio_bank
+from view_counter import start_view_counter
 
 if __name__ == '__main__':
     scheduler = start_scheduler(app)
+    start_job_workers(app)
+    start_static_derivatives()
+    start_evidence_pool()
+    start_audio_bank()
+    start_view_counter(app)
     try:
         app.run(debug=False, port=5002, use_reloader=False)
     except (KeyboardInterrupt, SystemExit):
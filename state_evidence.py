@@ -0,0 +1,142 @@
+"""Parallel story state transitions and evidence generation.
+
+scheduled_state_progression used to transition active stories one at a time
+in the APScheduler thread. For each story, generate_state_evidence produced
+the image, audio and text evidence in sequence, so one slow diffusion run
+held up the progression of every other story.
+
+The scheduler now only picks the stories that are due. Each one goes to a
+transition worker (STATE_TRANSITION_WORKERS threads). A per-story guard
+ensures two transitions of the same story never overlap: a story whose
+previous transition is still running is skipped until the next check.
+
+The worker chooses the next state and fans the story's image and audio items
+out to a shared item pool (STATE_EVIDENCE_WORKERS threads). Once every item
+has finished, it reloads the story, applies the state change, adds the
+Evidence and update Comment rows and commits once. If the story was deleted
+or moved on in the meantime, the generated files are discarded.
+
+Both pools are threads, not processes. Images are rendered by
+evidence_renderer, which owns the process's only diffusion pipeline and
+batches concurrent requests (torch releases the GIL). Image items from
+several stories therefore share diffusion batches, whereas a process pool
+would load one pipeline per process. Audio is mixed from audio_bank in under
+a millisecond and encoded in about 20ms. The rest of the work is LLM and
+database I/O.
+"""
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+STATE_TRANSITION_WORKERS = int(os.getenv('STATE_TRANSITION_WORKERS', 4))
+STATE_EVIDENCE_WORKERS = int(os.getenv('STATE_EVIDENCE_WORKERS', 4))
+
+_transitions = ThreadPoolExecutor(max_workers=max(1, STATE_TRANSITION_WORKERS),
+                                  thread_name_prefix='state-transition')
+_items = ThreadPoolExecutor(max_workers=max(1, STATE_EVIDENCE_WORKERS), thread_name_prefix='state-evidence')
+
+_lock = threading.Lock()
+_running = {}   # story_id -> 开始时间（time.monotonic），同一故事同时只允许一次转换
+_stats = {'submitted': 0, 'skipped_busy': 0, 'transitioned': 0, 'abandoned': 0, 'failed': 0,
+          'items': 0, 'item_failures': 0}
+
+
+def _count(name, n=1):
+    with _lock:
+        _stats[name] += n
+
+
+def submit_transition(app, story_id):
+    """Queue a state transition of `story_id`. Returns False when one is already running."""
+    with _lock:
+        if story_id in _running:
+            _stats['skipped_busy'] += 1
+            return False
+        _running[story_id] = time.monotonic()
+        _stats['submitted'] += 1
+    try:
+        _transitions.submit(_transition, app, story_id)
+    except RuntimeError:
+        # 解释器退出时线程池已关闭
+        with _lock:
+            _running.pop(story_id, None)
+        return False
+    return True
+
+
+def _render_item(app, evidence_type, snapshot):
+    from story_engine import render_state_evidence
+    with app.app_context():
+        return render_state_evidence(evidence_type, snapshot)
+
+
+def _transition(app, story_id):
+    from app import db, Story
+    from story_engine import (STATE_EVIDENCE_TYPES, check_state_transition, choose_next_state,
+                              apply_state_transition, add_state_evidence, story_snapshot)
+    import media_store
+
+    started = time.monotonic()
+    try:
+        # 1) 决定下一个状态（不修改数据库，长时间生成期间不占用会话）
+        with app.app_context():
+            story = Story.query.get(story_id)
+            if story is None or not check_state_transition(story):
+                # check_state_transition 可能为缺失状态数据的故事初始化了状态
+                db.session.commit()
+                return
+            from_state = story.current_state
+            next_state = choose_next_state(story)
+            if next_state is None:
+                return
+            snapshot = story_snapshot(story)
+            title = story.title
+
+        # 2) 图片/音频证据并行生成
+        kinds = [kind for kind in STATE_EVIDENCE_TYPES.get(next_state, ['text']) if kind in ('image', 'audio')]
+        futures = {kind: _items.submit(_render_item, app, kind, snapshot) for kind in kinds}
+        media = {}
+        for kind, future in futures.items():
+            try:
+                media[kind] = future.result()
+            except Exception as e:
+                media[kind] = None
+                _count('item_failures')
+                print(f"[state_evidence] 故事 #{story_id} 的 {kind} 证据生成失败: {type(e).__name__}: {e}")
+        _count('items', len(futures))
+
+        # 3) 状态变化和全部证据一次提交
+        with app.app_context():
+            story = Story.query.get(story_id)
+            if story is None or story.current_state != from_state:
+                for url in media.values():
+                    if url:
+                        media_store.discard(url)
+                _count('abandoned')
+                print(f"[state_evidence] 故事 #{story_id} 已被删除或状态已变化，丢弃生成的证据")
+                return
+            apply_state_transition(story, next_state)
+            add_state_evidence(story, next_state, media)
+            db.session.commit()
+        _count('transitioned')
+        print(f"✅ Story transitioned to: {next_state} ({title}, {time.monotonic() - started:.1f}s)")
+    except Exception as e:
+        traceback.print_exc()
+        _count('failed')
+        print(f"[state_evidence] 故事 #{story_id} 状态转换失败: {type(e).__name__}: {e}")
+    finally:
+        with _lock:
+            _running.pop(story_id, None)
+
+
+def stats():
+    now = time.monotonic()
+    with _lock:
+        return dict(
+            _stats,
+            transition_workers=STATE_TRANSITION_WORKERS,
+            evidence_workers=STATE_EVIDENCE_WORKERS,
+            running={story_id: round(now - started, 1) for story_id, started in _running.items()},
+        )
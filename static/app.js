@@ -1298,7 +1298,11 @@ async function showStoryDetail(storyId) {
                 html += '<div class="evidence-item" style="border:1px solid #6a6a5a; padding:8px; background:#c8c8b8;">';
                 const evidenceType = e.type || e.evidence_type || 'image';
                 if (evidenceType === 'image') {
-                    html += '<img src="' + e.file_path + '" style="width:100%; aspect-ratio: 1/1; object-fit: contain; background-color: #000; border: 1px solid #666; margin-bottom:6px;">';
+                    // 有 WebP 衍生图时按显示宽度挑选尺寸，原图只作为兜底
+                    const variants = e.variants;
+                    const srcset = variants && variants.srcset ? ' srcset="' + variants.srcset + '" sizes="(max-width: 700px) 45vw, 320px"' : '';
+                    const src = variants && variants.webp ? variants.webp : e.file_path;
+                    html += '<img src="' + src + '"' + srcset + ' loading="lazy" decoding="async" style="width:100%; aspect-ratio: 1/1; object-fit: contain; background-color: #000; border: 1px solid #666; margin-bottom:6px;">';
                 } else if (evidenceType === 'audio') {
                     html += '<audio controls style="width:100%; height:30px; margin-bottom:6px;"><source src="' + e.file_path + '"></audio>';
                 }
@@ -1307,6 +1311,9 @@ async function showStoryDetail(storyId) {
             html += '</div></div>';
         }
         
+        // 证据生成进度（由 watchEvidenceProgress 填充）
+        html += '<div id="evidence-progress" style="display:none; margin-top:10px; padding:8px; background:#b8b8a8; border:1px solid #7a7a6a; font-size:11px; color:#2a2a1a;"></div>';
+        
         html += '</div>'; // 结束content-area
         html += '</div>'; // 结束floor-body
         html += '</div>'; // 结束floor-container
@@ -1397,7 +1404,7 @@ async function showStoryDetail(storyId) {
             
             // 渲染子回复
             const renderReply = (reply) => {
-                let replyHtml = '<div class="tieba-reply-item">';
+                let replyHtml = '<div id="reply-' + reply.id + '" class="tieba-reply-item">';
                 replyHtml += '<div class="tieba-reply-header">' +
                     '<span class="tieba-reply-author">' + reply.author.avatar + ' ' + escapeHtml(reply.author.username) + '</span>' +
                     '<span class="tieba-reply-time">' + formatDate(reply.created_at) + '</span>' +
@@ -1463,6 +1470,7 @@ async function showStoryDetail(storyId) {
                 btn.addEventListener('click', handler);
             });
             console.log('✅ 故事内容已渲染到模态框（贴吧风格）');
+            watchEvidenceProgress(storyId);
         }
         
         const storyModal = document.getElementById('story-modal');
@@ -1563,8 +1571,11 @@ async function submitReply(event, parentCommentId) {
         });
         
         if (res.ok) {
+            const data = await res.json();
             showToast('已回复', 'success');
-            setTimeout(() => showStoryDetail(storyId), 1500);
+            await showStoryDetail(storyId);
+            if (data.evidence_status) watchEvidenceProgress(storyId);
+            if (data.ai_response_stream) streamAiReply(data.comment.id, data.ai_response_stream);
         } else {
             const err = await res.json();
             showToast(err.error || '回复失败', 'error');
@@ -1601,8 +1612,11 @@ async function submitComment(event, storyId) {
         });
         
         if (res.ok) {
+            const data = await res.json();
             showToast('已发表', 'success');
-            setTimeout(() => showStoryDetail(storyId), 1500);
+            await showStoryDetail(storyId);
+            if (data.evidence_status) watchEvidenceProgress(storyId);
+            if (data.ai_response_stream) streamAiReply(data.comment.id, data.ai_response_stream);
         } else {
             const err = await res.json();
             showToast(err.error || '发表失败', 'error');
@@ -1613,6 +1627,112 @@ async function submitComment(event, storyId) {
     }
 }
 
+// 证据生成进度：只在有任务排队/运行时按服务端建议的间隔查询；
+// 新证据（渐进模式下先是预览图）出现或任务完成时刷新详情页
+let evidenceWatch = null;
+
+function watchEvidenceProgress(storyId) {
+    if (evidenceWatch && evidenceWatch.storyId === storyId) return;
+    if (evidenceWatch) clearTimeout(evidenceWatch.timer);
+    const watch = { storyId: storyId, timer: null, seen: false, count: null };
+    evidenceWatch = watch;
+
+    const stop = () => {
+        clearTimeout(watch.timer);
+        if (evidenceWatch === watch) evidenceWatch = null;
+    };
+    const poll = async () => {
+        if (evidenceWatch !== watch || window.currentStoryId !== storyId) return stop();
+        let data;
+        try {
+            const res = await fetch(API_BASE + '/stories/' + storyId + '/evidence/status');
+            data = await res.json();
+        } catch (error) {
+            return stop();
+        }
+        const countChanged = watch.count !== null && data.evidence_count !== watch.count;
+        watch.count = data.evidence_count;
+        if (data.active) {
+            watch.seen = true;
+            if (countChanged) await showStoryDetail(storyId);
+            const el = document.getElementById('evidence-progress');
+            if (el) {
+                const refining = data.job_type === 'evidence_refine';
+                const label = data.status === 'pending' ? '排队中' : ({ preparing: '准备中', rendering: '冲洗照片', saving: '上传中', refining: '高清处理中' }[data.stage] || '处理中');
+                el.style.display = 'block';
+                el.innerHTML = (refining ? '📷 证据照片高清版处理中（' : '📷 楼主正在上传新的证据照片（') + label + ' ' + data.progress + '%）' +
+                    '<div style="margin-top:5px; height:6px; background:#8a8a7a;"><div style="height:100%; width:' + data.progress + '%; background:#3a3a2a;"></div></div>';
+            }
+            watch.timer = setTimeout(poll, data.poll_after_ms || 2000);
+            return;
+        }
+        stop();
+        const el = document.getElementById('evidence-progress');
+        if (el) el.style.display = 'none';
+        // 本次查看期间有任务完成：刷新以显示新证据
+        if (countChanged || (watch.seen && data.status === 'done')) await showStoryDetail(storyId);
+    };
+    poll();
+}
+
+// 通过 SSE 实时显示楼主回复：先插入一个临时回复块，逐字追加，完成后替换为最终内容
+function streamAiReply(commentId, streamUrl) {
+    if (!window.EventSource) return;
+
+    const item = document.createElement('div');
+    item.className = 'tieba-reply-item';
+    item.innerHTML = '<div class="tieba-reply-header">' +
+        '<span class="tieba-reply-author">👻 ' + escapeHtml('楼主') + '</span>' +
+        '<span class="tieba-reply-time">正在输入...</span>' +
+        '</div>' +
+        '<div class="tieba-reply-content"></div>';
+    const contentEl = item.querySelector('.tieba-reply-content');
+    const timeEl = item.querySelector('.tieba-reply-time');
+
+    const floor = document.getElementById('comment-' + commentId);
+    const replyEl = document.getElementById('reply-' + commentId);
+    if (floor) {
+        let section = floor.querySelector('.tieba-reply-section');
+        if (!section) {
+            section = document.createElement('div');
+            section.className = 'tieba-reply-section';
+            floor.querySelector('.tieba-content-area').appendChild(section);
+        }
+        section.appendChild(item);
+    } else if (replyEl) {
+        replyEl.insertAdjacentElement('afterend', item);
+    } else {
+        return;
+    }
+
+    let text = '';
+    const source = new EventSource(streamUrl);
+    source.addEventListener('token', (e) => {
+        text += JSON.parse(e.data).text;
+        contentEl.textContent = text;
+    });
+    // 生成失败后任务重试：丢弃已显示的半截回复，等待新的 token
+    source.addEventListener('reset', () => {
+        text = '';
+        contentEl.textContent = '';
+    });
+    source.addEventListener('done', (e) => {
+        source.close();
+        const result = JSON.parse(e.data);
+        if (result.content) {
+            contentEl.textContent = result.content;
+            timeEl.textContent = formatDate(new Date().toISOString());
+        } else {
+            // 没有最终回复（重试后仍失败）：不留下半截文本
+            item.remove();
+        }
+    });
+    source.onerror = () => {
+        source.close();
+        if (!text) item.remove();
+    };
+}
+
 function showLoginForm() {
     const titleEl = document.getElementById('modal-title');
     const emailGroup = document.getElementById('email-group');
@@ -112,24 +112,27 @@ def check_state_transition(story):
     
     return False
 
-def transition_story_state(story, app_context):
-    """Transition story to next state"""
-    from app import db, Evidence
-    from ai_engine import generate_ai_story, generate_evidence_image, generate_evidence_audio
-    
-    if not story.state_data:
-        initialize_story_state(story)
-        db.session.commit()
-        return
-    
+# 各状态下生成的证据类型
+STATE_EVIDENCE_TYPES = {
+    'init': ['text'],
+    'unfolding': ['image', 'text'],
+    'investigation': ['image', 'audio'],
+    'escalation': ['image', 'audio', 'text'],
+    'danger': ['image', 'audio'],
+    'revelation': ['text', 'image'],
+    'twist': ['image', 'audio'],
+    'climax': ['image', 'audio', 'text']
+}
+
+def choose_next_state(story):
+    """Pick the state `story` moves to next, or None when it has ended"""
     state_data = json.loads(story.state_data)
-    current_state = state_data['current_state']
     
     # Get possible next states
-    possible_next_states = STORY_STATES[current_state]['next_states']
+    possible_next_states = STORY_STATES[state_data['current_state']]['next_states']
     
     if not possible_next_states:
-        return  # Story has ended
+        return None  # Story has ended
     
     # Choose next state based on user interaction
     # More interactions = more investigation/revelation path
@@ -137,17 +140,21 @@ def transition_story_state(story, app_context):
     interaction_ratio = state_data['user_interaction_count'] / 10.0
     
     if interaction_ratio > 0.7 and 'investigation' in possible_next_states:
-        next_state = 'investigation'
+        return 'investigation'
     elif interaction_ratio > 0.5 and 'revelation' in possible_next_states:
-        next_state = 'revelation'
+        return 'revelation'
     elif interaction_ratio < 0.3 and 'escalation' in possible_next_states:
-        next_state = 'escalation'
+        return 'escalation'
     elif interaction_ratio < 0.5 and 'danger' in possible_next_states:
-        next_state = 'danger'
+        return 'danger'
     else:
         # Random choice from available
         import random
-        next_state = random.choice(possible_next_states)
+        return random.choice(possible_next_states)
+
+def apply_state_transition(story, next_state):
+    """Move `story` to `next_state` (state history, next transition time, interaction counter)"""
+    state_data = json.loads(story.state_data)
     
     # Update state
     state_data['current_state'] = next_state
@@ -167,6 +174,21 @@ def transition_story_state(story, app_context):
     
     story.state_data = json.dumps(state_data)
     story.current_state = next_state
+
+def transition_story_state(story, app_context):
+    """Transition story to next state"""
+    from app import db
+    
+    if not story.state_data:
+        initialize_story_state(story)
+        db.session.commit()
+        return
+    
+    next_state = choose_next_state(story)
+    if next_state is None:
+        return
+    
+    apply_state_transition(story, next_state)
     
     # Generate new evidence based on state
     with app_context():
@@ -174,27 +196,44 @@ def transition_story_state(story, app_context):
     
     db.session.commit()
 
-def generate_state_evidence(story, state):
-    """Generate appropriate evidence for current state"""
-    from app import db, Evidence, Comment
-    
-    # Generate evidence based on state
-    evidence_types = {
-        'init': ['text'],
-        'unfolding': ['image', 'text'],
-        'investigation': ['image', 'audio'],
-        'escalation': ['image', 'audio', 'text'],
-        'danger': ['image', 'audio'],
-        'revelation': ['text', 'image'],
-        'twist': ['image', 'audio'],
-        'climax': ['image', 'audio', 'text']
+def story_snapshot(story):
+    """Plain copy of the story fields evidence generation needs (usable outside the ORM session)"""
+    return {
+        'id': story.id,
+        'title': story.title,
+        'content': story.content,
+        'category': story.category,
     }
+
+def render_state_evidence(evidence_type, story):
+    """Generate one media evidence file ('image' / 'audio') for a story snapshot. Returns its URL or None"""
+    if evidence_type == 'image':
+        image_paths = generate_evidence_image(story['id'], story['title'], story['content'],
+                                              category=story['category'])
+        if not image_paths:
+            return None
+        image_path = image_paths[0][1]
+        try:
+            from image_assets import create_derivatives
+            create_derivatives(image_path)
+        except Exception as e:
+            print(f"[render_state_evidence] ⚠️ 衍生图生成失败（使用原图）: {e}")
+        return image_path
+    
+    if evidence_type == 'audio':
+        return generate_evidence_audio(story['content'])
+    
+    return None
+
+def add_state_evidence(story, state, media):
+    """Add the evidence rows of `state` to the session; `media` maps 'image'/'audio' to generated URLs"""
+    from app import db, Evidence, Comment
     
-    types_to_generate = evidence_types.get(state, ['text'])
+    types_to_generate = STATE_EVIDENCE_TYPES.get(state, ['text'])
     
     for evidence_type in types_to_generate:
         if evidence_type == 'image':
-            image_path = generate_evidence_image(story.title, story.content)
+            image_path = media.get('image')
             if image_path:
                 evidence = Evidence(
                     story_id=story.id,
@@ -205,7 +244,7 @@ def generate_state_evidence(story, state):
                 db.session.add(evidence)
         
         elif evidence_type == 'audio':
-            audio_path = generate_evidence_audio(story.content)
+            audio_path = media.get('audio')
             if audio_path:
                 evidence = Evidence(
                     story_id=story.id,
@@ -244,6 +283,15 @@ def generate_state_evidence(story, state):
         state_data['evidence_generated'] += len(types_to_generate)
         story.state_data = json.dumps(state_data)
 
+def generate_state_evidence(story, state):
+    """Generate appropriate evidence for current state (sequentially; see state_evidence for the parallel path)"""
+    snapshot = story_snapshot(story)
+    media = {}
+    for evidence_type in STATE_EVIDENCE_TYPES.get(state, ['text']):
+        if evidence_type in ('image', 'audio'):
+            media[evidence_type] = render_state_evidence(evidence_type, snapshot)
+    add_state_evidence(story, state, media)
+
 def record_user_interaction(story):
     """Record user interaction with story"""
     if not story.state_data:
@@ -0,0 +1,24 @@
+import os
+import runpy
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def main_app(tmp_path, monkeypatch):
+    """Globals of app.py executed the way `python app.py` runs it.
+
+    The module is not registered as `app`, so it has its own Flask app and
+    SQLAlchemy instance. Code that does `from app import db` would import a
+    second copy and fail under this app. Uses a throwaway SQLite database and
+    no LLM backends.
+    """
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv('USE_LM_STUDIO', 'false')
+    monkeypatch.setenv('LM_STUDIO_URL', '')
+    return runpy.run_path(os.path.join(ROOT, 'app.py'), run_name='__app_main__')
@@ -0,0 +1,17 @@
+from PIL import Image
+
+from evidence_cache import EvidenceImageCache
+
+
+def test_put_and_get_under_main_app(main_app, tmp_path):
+    app, EvidenceRenderCache = main_app['app'], main_app['EvidenceRenderCache']
+    cache = EvidenceImageCache(str(tmp_path / 'evidence_cache'), max_bytes=1024 * 1024)
+    image = Image.new('RGB', (8, 8), (30, 20, 40))
+
+    with app.app_context():
+        assert cache.get('render-key') is None
+        cache.put('render-key', image)
+        assert EvidenceRenderCache.query.filter_by(cache_key='render-key').count() == 1
+        assert cache.get('render-key').getpixel((0, 0)) == (30, 20, 40)
+
+    assert cache.stats()['errors'] == 0
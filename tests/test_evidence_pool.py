@@ -0,0 +1,35 @@
+import importlib.util
+import threading
+
+from evidence_pool import EvidencePool
+
+
+def test_start_skips_filler_without_diffusers(tmp_path, monkeypatch):
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(importlib.util, 'find_spec', lambda name: None if name == 'diffusers' else find_spec(name))
+    monkeypatch.setenv('USE_DIFFUSER_IMAGE', 'true')
+    pool = EvidencePool(root=str(tmp_path))
+
+    pool.start()
+
+    stats = pool.stats()
+    assert not stats['running']
+    assert 'diffusers' in stats['disabled']
+
+
+def test_filler_stops_after_import_error(tmp_path):
+    pool = EvidencePool(root=str(tmp_path), idle_seconds=0, check_seconds=0.01)
+    renders = []
+
+    def render(slot):
+        renders.append(slot)
+        raise ImportError("No module named 'torch'")
+
+    pool._render = render
+    filler = threading.Thread(target=pool._run, daemon=True)
+    filler.start()
+    filler.join(5)
+
+    assert not filler.is_alive()
+    assert len(renders) == 1
+    assert pool.stats()['disabled'] and pool.stats()['failures'] == 0
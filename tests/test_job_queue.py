@@ -0,0 +1,59 @@
+import job_queue
+
+
+def _token(client):
+    response = client.post('/api/register', json={'username': 'night_rider', 'email': 'n@example.com',
+                                                  'password': 'secret'})
+    return response.get_json()['token']
+
+
+def test_add_comment_enqueues_reply_under_main_app(main_app, monkeypatch):
+    monkeypatch.setattr(job_queue, 'start_job_workers', lambda app=None: None)
+    app, Story, Job = main_app['app'], main_app['Story'], main_app['Job']
+    client = app.test_client()
+    token = _token(client)
+    with app.app_context():
+        story_id = Story.query.first().id
+
+    response = client.post(f'/api/stories/{story_id}/comments', json={'content': '昨晚我也在那一站'},
+                           headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == 201
+    with app.app_context():
+        assert Job.query.filter_by(job_type='ai_reply', story_id=story_id).count() == 1
+
+
+def test_claim_and_finish_under_main_app(main_app, monkeypatch):
+    monkeypatch.setattr(job_queue, 'start_job_workers', lambda app=None: None)
+    app, db, Job = main_app['app'], main_app['db'], main_app['Job']
+    with app.app_context():
+        job_id = job_queue.enqueue('ai_reply', {'story_id': 1, 'comment_id': 1}).id
+
+        job, _ = job_queue._claim_next()
+        assert job.id == job_id and job.status == 'running'
+        job_queue._finish(job_id)
+
+        assert db.session.get(Job, job_id).status == 'done'
+
+
+def test_progress_and_cancel_check_under_main_app(main_app, monkeypatch):
+    monkeypatch.setattr(job_queue, 'start_job_workers', lambda app=None: None)
+    monkeypatch.setattr(job_queue, 'JOB_PROGRESS_FLUSH_SECONDS', 0)
+    app, db, Story, Job = main_app['app'], main_app['db'], main_app['Story'], main_app['Job']
+    with app.app_context():
+        story_id = Story.query.first().id
+        payload = {'story_id': story_id}
+        job_id = job_queue.enqueue('story_evidence', payload).id
+
+    context = job_queue.JobContext(app, job_id, 'story_evidence', payload)
+    context.report(40, 'rendering')
+    assert context.cancelled() is None
+
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        assert (job.progress, job.stage) == (40, 'rendering')
+        db.session.delete(db.session.get(Story, story_id))
+        db.session.commit()
+
+    monkeypatch.setattr(job_queue, 'JOB_CANCEL_CHECK_SECONDS', 0)
+    assert context.cancelled() == '故事已删除'
@@ -0,0 +1,38 @@
+import threading
+import time
+
+from llm_scheduler import LLMScheduler, PRIORITY_INTERACTIVE
+
+
+def _wait_for(predicate, timeout=2.0):
+    give_up_at = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > give_up_at:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def test_back_to_back_releases_admit_every_waiter():
+    for _ in range(30):
+        scheduler = LLMScheduler(max_inflight=2, max_queue=8, deadlines={PRIORITY_INTERACTIVE: 10})
+        scheduler._acquire(PRIORITY_INTERACTIVE, 10)
+        scheduler._acquire(PRIORITY_INTERACTIVE, 10)
+        admitted = []
+
+        def wait_for_slot(name):
+            scheduler._acquire(PRIORITY_INTERACTIVE, 10)
+            admitted.append(name)
+
+        waiters = [threading.Thread(target=wait_for_slot, args=(name,), daemon=True) for name in 'ab']
+        for thread in waiters:
+            thread.start()
+            assert _wait_for(lambda: len(scheduler._waiters) == waiters.index(thread) + 1)
+
+        # 两个槽位在同一时刻释放：两个等待者都被唤醒，但谁先拿到锁不确定
+        with scheduler._cond:
+            scheduler._release(0.0)
+            scheduler._release(0.0)
+
+        assert _wait_for(lambda: len(admitted) == 2), '空闲槽位没有唤醒排在后面的等待者'
+        assert scheduler.stats()['inflight'] == 2
@@ -0,0 +1,80 @@
+import os
+
+import media_store
+
+
+def _write_media(name, data=b'RIFF0000WAVE'):
+    filepath, url = media_store.allocate(name)
+    with open(filepath, 'wb') as f:
+        f.write(data)
+    return filepath, url
+
+
+def test_register_keeps_caller_session_under_main_app(main_app, tmp_path, monkeypatch):
+    app, db, Story, MediaFile = main_app['app'], main_app['db'], main_app['Story'], main_app['MediaFile']
+    monkeypatch.chdir(tmp_path)
+    filepath, _ = _write_media('evidence_audio_test.wav')
+
+    with app.app_context():
+        stories = Story.query.count()
+        story = Story(title='未提交的故事', content='正文', category='subway_ghost', location='地铁站')
+        db.session.add(story)
+
+        media_store.register(filepath, media_type='audio')
+
+        # register 用独立会话提交，调用方未提交的修改仍在，也没有被它提交
+        assert story in db.session.new
+        db.session.rollback()
+        assert Story.query.count() == stories
+        assert MediaFile.query.filter_by(path=os.path.relpath(filepath, 'static')).one().media_type == 'audio'
+
+
+def test_discard_and_collect_garbage_under_main_app(main_app, tmp_path, monkeypatch):
+    app, MediaFile = main_app['app'], main_app['MediaFile']
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(media_store, 'MEDIA_GC_GRACE_SECONDS', -1)
+    kept, kept_url = _write_media('evidence_audio_kept.wav')
+    stale, _ = _write_media('evidence_audio_stale.wav')
+
+    with app.app_context():
+        media_store.register(kept)
+        media_store.register(stale)
+        media_store.discard(kept_url)
+        summary = media_store.collect_garbage()
+
+        assert not os.path.exists(kept) and not os.path.exists(stale)
+        assert summary['deleted_files'] == 1
+        assert MediaFile.query.count() == 0
+
+
+def test_downscale_writes_new_file_and_repoints_evidence(main_app, tmp_path, monkeypatch):
+    import numpy as np
+    from PIL import Image
+
+    app, db = main_app['app'], main_app['db']
+    Story, Evidence, MediaFile = main_app['Story'], main_app['Evidence'], main_app['MediaFile']
+    monkeypatch.chdir(tmp_path)
+    filepath, url = media_store.allocate('evidence_downscale.png')
+    pixels = np.random.default_rng(0).integers(0, 256, (512, 512, 3), dtype=np.uint8)
+    Image.fromarray(pixels, 'RGB').save(filepath)
+    monkeypatch.setattr(media_store, 'MEDIA_DISK_BUDGET_MB', os.path.getsize(filepath) / 2 / 1024 / 1024)
+
+    with app.app_context():
+        story = Story(title='已完结', content='正文', category='subway_ghost', current_state='ended')
+        db.session.add(story)
+        db.session.commit()
+        db.session.add(Evidence(story_id=story.id, evidence_type='image', file_path=url))
+        db.session.commit()
+        media_store.register(filepath, story.id, 'image')
+
+        summary = media_store.collect_garbage()
+
+        assert summary['downscaled'] == 1 and summary['evicted'] == 0
+        new_url = Evidence.query.one().file_path
+        media = MediaFile.query.one()
+        assert new_url != url and media.downscaled
+        assert new_url == '/static/' + media.path
+    # 原 URL 被浏览器当作不可变缓存，文件不能原地改写，只能换名后删除
+    assert not os.path.exists(filepath)
+    with Image.open(os.path.join('static', media.path)) as shrunk:
+        assert shrunk.width == media_store.MEDIA_DOWNSCALE_WIDTH
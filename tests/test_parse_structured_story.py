@@ -0,0 +1,22 @@
+from ai_engine import parse_structured_story
+
+BODY = '昨晚末班车开过旺角站之后，车厢里的灯闪了三下，对面座位上多了一个穿校服的女生，可我明明记得上一站没有人上车。'
+
+
+def test_tagged_sections():
+    assert parse_structured_story(f'【标题】末班车的女生\n【正文】{BODY}') == ('末班车的女生', BODY)
+
+
+def test_content_marker_inside_body_stays_in_body():
+    body = f'{BODY}\n内容：她手里那张车票上印着十年前的日期。\n正文：后来我再也没坐过末班车。'
+
+    title, content = parse_structured_story(f'标题：末班车的女生\n正文：{body}')
+
+    assert title == '末班车的女生'
+    assert content == body
+
+
+def test_title_marker_inside_body_stays_in_body():
+    body = f'{BODY}\n标题：这是她留在座位上的纸条写的字。'
+
+    assert parse_structured_story(f'【标题】末班车的女生\n【正文】{body}') == ('末班车的女生', body)
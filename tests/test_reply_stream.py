@@ -0,0 +1,52 @@
+import pytest
+
+import job_queue
+from reply_stream import open_reply_stream
+
+
+def test_retry_resets_text_of_failed_attempt():
+    stream = open_reply_stream(9001)
+    events = stream.events(heartbeat=0.01)
+    stream.push('partial-')
+    assert next(events) == ('token', {'text': 'partial-'})
+
+    stream.fail()
+    assert open_reply_stream(9001) is stream
+    stream.push('RETRY REPLY')
+    stream.finish({'content': 'RETRY REPLY'})
+
+    assert list(events) == [('reset', {}), ('token', {'text': 'RETRY REPLY'}), ('done', {'content': 'RETRY REPLY'})]
+    # 重试开始后才订阅的客户端只看到新的文本
+    assert list(stream.events(heartbeat=0.01)) == [('token', {'text': 'RETRY REPLY'}),
+                                                   ('done', {'content': 'RETRY REPLY'})]
+
+
+def _run_attempt(main_app, monkeypatch, comment_id, attempts, generate):
+    monkeypatch.setitem(main_app['delayed_ai_response'].__globals__, '_generate_ai_reply', generate)
+    monkeypatch.setattr(job_queue._local, 'job',
+                        job_queue.JobContext(main_app['app'], 1, 'ai_reply', {}, attempts, 3), raising=False)
+    main_app['delayed_ai_response'](story_id=1, comment_id=comment_id)
+
+
+def test_failed_reply_attempt_keeps_stream_open_until_last_attempt(main_app, monkeypatch):
+    def fail(story_id, comment_id, delay_seconds, on_token):
+        on_token('partial-')
+        raise RuntimeError('LM Studio 503')
+
+    def succeed(story_id, comment_id, delay_seconds, on_token):
+        on_token('RETRY REPLY')
+        return {'comment_id': 7, 'content': 'RETRY REPLY'}
+
+    with pytest.raises(RuntimeError):
+        _run_attempt(main_app, monkeypatch, 9002, 1, fail)
+    stream = open_reply_stream(9002)
+    assert not stream.done and stream.text == ''
+
+    _run_attempt(main_app, monkeypatch, 9002, 2, succeed)
+    assert stream.done and stream.text == 'RETRY REPLY'
+
+    # 最后一次尝试失败：结束流，前端移除半截回复
+    with pytest.raises(RuntimeError):
+        _run_attempt(main_app, monkeypatch, 9003, 3, fail)
+    last = open_reply_stream(9003)
+    assert last.done and last.result == {}
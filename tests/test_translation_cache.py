@@ -0,0 +1,23 @@
+import ai_engine
+import translation_cache
+from translation_cache import cache_key, cached_translate
+
+
+def test_fallback_translation_is_stored_under_its_backend(main_app, monkeypatch):
+    app, TranslationCache = main_app['app'], main_app['TranslationCache']
+    monkeypatch.setattr(ai_engine, 'translation_backends', lambda: ['lmstudio:local-model', 'openai:gpt-test'])
+    # LM Studio 失败，回退到 OpenAI
+    monkeypatch.setattr(ai_engine, 'translate_text_with_backend',
+                        lambda text, target='en': ('The last train', 'openai:gpt-test'))
+    monkeypatch.setattr(translation_cache, '_memory', translation_cache.TranslationLRU(8))
+
+    with app.app_context():
+        assert cached_translate('末班车', target='en') == 'The last train'
+        row = TranslationCache.query.one()
+        assert row.model == 'openai:gpt-test'
+        assert row.cache_key == cache_key('末班车', 'en', 'openai:gpt-test')
+
+        # 重启后（内存缓存为空）仍从数据库命中回退后端的译文，不再调用 LLM
+        translation_cache._memory.clear()
+        monkeypatch.setattr(ai_engine, 'translate_text_with_backend', lambda text, target='en': (None, None))
+        assert cached_translate('末班车', target='en') == 'The last train'
@@ -0,0 +1,38 @@
+from view_counter import ViewCounter
+
+
+def test_flush_writes_through_started_app(main_app):
+    app, Story = main_app['app'], main_app['Story']
+    with app.app_context():
+        story_id = Story.query.first().id
+        before = Story.query.get(story_id).views or 0
+
+    counter = ViewCounter(flush_seconds=3600, flush_events=1000)
+    counter.start(app)
+    for _ in range(3):
+        counter.record(story_id)
+    assert counter.pending(story_id) == 3
+
+    counter._flush_in_app()
+
+    assert counter.pending(story_id) == 0
+    assert counter.stats()['failures'] == 0
+    with app.app_context():
+        assert Story.query.get(story_id).views == before + 3
+
+
+def test_get_story_counts_view_under_main_app(main_app, monkeypatch):
+    app, Story = main_app['app'], main_app['Story']
+    counter = ViewCounter(flush_seconds=3600, flush_events=1000)
+    monkeypatch.setitem(main_app['get_story'].__globals__, 'view_counter', counter)
+    with app.app_context():
+        story_id = Story.query.first().id
+        before = Story.query.get(story_id).views or 0
+    client = app.test_client()
+
+    assert client.get(f'/api/stories/{story_id}').get_json()['views'] == before + 1
+    assert client.get(f'/api/stories/{story_id}').get_json()['views'] == before + 2
+
+    counter._flush_in_app()
+    with app.app_context():
+        assert Story.query.get(story_id).views == before + 2
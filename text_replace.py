@@ -0,0 +1,79 @@
+"""Single-pass literal replacement tables for the story text filters.
+
+The filters in ai_engine used to loop over their replacement dicts calling
+str.replace once per entry. ReplacementTable compiles such an ordered table
+into one alternation regex at import time and rewrites the text in a single
+scan, while keeping the exact result of the sequential loop:
+
+- keys that contain an earlier key can never match after the earlier pass and
+  are dropped;
+- an alternation picks the leftmost match, the loop picks the earliest key.
+  They only disagree where a lower-priority key overlaps a higher-priority key
+  on its right, so such overlap strings are compiled into a "witness" regex and
+  texts containing one take the sequential path;
+- if a replacement value could itself form or break a later key, the table is
+  not fused at all and always runs sequentially.
+"""
+import re
+
+
+def _overlaps(a, b):
+    """True if some string contains overlapping occurrences of a and b."""
+    if a in b or b in a:
+        return True
+    for n in range(1, min(len(a), len(b))):
+        if a.endswith(b[:n]) or b.endswith(a[:n]):
+            return True
+    return False
+
+
+class ReplacementTable:
+    def __init__(self, pairs):
+        # 保留顺序并去重：与 dict 顺序上的 str.replace 循环语义一致
+        self.pairs = []
+        seen = set()
+        for old, new in pairs:
+            if old and old not in seen:
+                seen.add(old)
+                self.pairs.append((old, new))
+
+        live = []
+        for i, (old, new) in enumerate(self.pairs):
+            if any(prev in old for prev, _ in self.pairs[:i]):
+                continue
+            live.append(i)
+
+        self.fused = all(new and not any(_overlaps(new, later) for later, _ in self.pairs[i + 1:])
+                         for i, (_, new) in ((i, self.pairs[i]) for i in live))
+        self._pattern = None
+        self._witness = None
+        if not self.fused:
+            return
+
+        self._mapping = {self.pairs[i][0]: self.pairs[i][1] for i in live}
+        self._pattern = re.compile('|'.join(re.escape(self.pairs[i][0]) for i in live))
+
+        witnesses = set()
+        for rank, i in enumerate(live):
+            left = self.pairs[i][0]
+            for j in live[:rank]:
+                right = self.pairs[j][0]
+                for n in range(1, min(len(left), len(right))):
+                    if left.endswith(right[:n]):
+                        witnesses.add(left + right[n:])
+        if witnesses:
+            self._witness = re.compile('|'.join(re.escape(w) for w in sorted(witnesses, key=len, reverse=True)))
+
+    def apply_sequential(self, text):
+        """Reference semantics: one str.replace per entry, in table order."""
+        for old, new in self.pairs:
+            text = text.replace(old, new)
+        return text
+
+    def apply(self, text):
+        if not text or self._pattern is None:
+            return self.apply_sequential(text) if text else text
+        if self._witness is not None and self._witness.search(text):
+            return self.apply_sequential(text)
+        mapping = self._mapping
+        return self._pattern.sub(lambda m: mapping[m.group(0)], text)
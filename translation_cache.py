@@ -0,0 +1,146 @@
+"""Content-addressed cache in front of ai_engine.translate_text().
+
+Entries are keyed by sha256(model, target, text), where model is the
+backend that produced the translation. Lookups go through an
+in-process LRU first, then the TranslationCache table, so translations survive
+restarts and are shared between workers. Concurrent requests for the same key
+wait for the first one instead of each calling the LLM.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from app_models import lookup
+
+TRANSLATION_CACHE_SIZE = int(os.getenv('TRANSLATION_CACHE_SIZE', 512))
+# 等待同一 key 的在途翻译的最长时间，超时后自己去翻译
+TRANSLATION_COALESCE_TIMEOUT = float(os.getenv('TRANSLATION_COALESCE_TIMEOUT', 90))
+
+
+def cache_key(text, target, model):
+    digest = hashlib.sha256()
+    for part in (model, target, text):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class _InFlight:
+    __slots__ = ('event', 'result')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+class TranslationLRU:
+    def __init__(self, maxsize=512):
+        self.maxsize = max(0, maxsize)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_memory = TranslationLRU(TRANSLATION_CACHE_SIZE)
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _load(keys):
+    """(key, translated) of the first of `keys` stored in the database, or (None, None)."""
+    try:
+        TranslationCache = lookup('TranslationCache')
+        rows = TranslationCache.query.filter(TranslationCache.cache_key.in_(keys)).all()
+        stored = {row.cache_key: row.translated for row in rows}
+    except Exception as e:
+        print(f"[translation_cache] 读取缓存失败: {e}")
+        return None, None
+    for key in keys:
+        if key in stored:
+            return key, stored[key]
+    return None, None
+
+
+def _store(key, target, model, translated):
+    db, TranslationCache = lookup('db', 'TranslationCache')
+    try:
+        db.session.add(TranslationCache(cache_key=key, target=target, model=model, translated=translated))
+        db.session.commit()
+    except Exception as e:
+        # 另一个 worker 可能刚写入同一个 key（唯一约束），忽略即可
+        db.session.rollback()
+        print(f"[translation_cache] 写入缓存跳过: {type(e).__name__}")
+
+
+def cached_translate(text, target='en'):
+    """Cached translate_text(). Must run inside an app context.
+
+    A translation is stored under the backend that produced it, so an OpenAI
+    fallback is never cached as an LM Studio result. Lookups accept an entry
+    of any backend translate_text() may use, in the order it tries them.
+
+    Returns the translated string, or None when no translation service is
+    available (None results are never cached).
+    """
+    from ai_engine import translate_text, translate_text_with_backend, translation_backends
+
+    if not text:
+        return ''
+    backends = translation_backends()
+    if not backends:
+        return None
+
+    keys = [cache_key(text, target, model) for model in backends]
+    for key in keys:
+        cached = _memory.get(key)
+        if cached is not None:
+            return cached
+
+    # 并发合并以首选后端的 key 为准
+    with _inflight_lock:
+        pending = _inflight.get(keys[0])
+        leader = pending is None
+        if leader:
+            pending = _InFlight()
+            _inflight[keys[0]] = pending
+
+    if not leader:
+        if pending.event.wait(TRANSLATION_COALESCE_TIMEOUT) and pending.result is not None:
+            return pending.result
+        return translate_text(text, target=target)
+
+    try:
+        key, translated = _load(keys)
+        if translated is None:
+            translated, model = translate_text_with_backend(text, target=target)
+            if translated and model:
+                key = cache_key(text, target, model)
+                _store(key, target, model, translated)
+        if translated and key:
+            _memory.put(key, translated)
+        pending.result = translated
+        return translated
+    finally:
+        with _inflight_lock:
+            _inflight.pop(keys[0], None)
+        pending.event.set()
@@ -0,0 +1,135 @@
+"""Write-behind counter for story views.
+
+GET /api/stories/<id> used to do `story.views += 1; db.session.commit()`.
+That turned every page view into a SQLite write transaction competing for
+the database lock with the job workers, the scheduler and state_evidence.
+
+Views are now added to an in-memory, thread-safe tally. A background thread
+flushes the tally with one batched UPDATE (views = views + CASE id ... END)
+every VIEW_FLUSH_SECONDS, or sooner once VIEW_FLUSH_EVENTS views are
+pending. It also flushes once more at interpreter exit. Increments that are
+not yet in the database, including those of a flush in progress, are added
+to the views the API reports. A failed flush puts its increments back into
+the tally.
+"""
+import atexit
+import os
+import threading
+import time
+
+from flask import current_app
+
+from app_models import lookup
+
+VIEW_FLUSH_SECONDS = float(os.getenv('VIEW_FLUSH_SECONDS', 5))
+VIEW_FLUSH_EVENTS = int(os.getenv('VIEW_FLUSH_EVENTS', 200))
+
+
+class ViewCounter:
+    def __init__(self, flush_seconds=5.0, flush_events=200):
+        self.flush_seconds = flush_seconds
+        self.flush_events = max(1, flush_events)
+        self._pending = {}    # story_id -> 尚未写入的浏览次数
+        self._flushing = {}   # 正在写入的一批，提交前仍计入 pending()
+        self._events = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._app = None
+        self._thread = None
+        self._stats = {'recorded': 0, 'flushes': 0, 'rows_updated': 0, 'failures': 0, 'last_flush_ms': None}
+
+    def record(self, story_id):
+        """Count one view of `story_id`."""
+        if self._thread is None:
+            self.start(current_app._get_current_object())
+        with self._lock:
+            self._pending[story_id] = self._pending.get(story_id, 0) + 1
+            self._events += 1
+            self._stats['recorded'] += 1
+            if self._events >= self.flush_events:
+                self._wakeup.set()
+
+    def pending(self, story_id):
+        """Views of `story_id` that are not in Story.views yet."""
+        with self._lock:
+            return self._pending.get(story_id, 0) + self._flushing.get(story_id, 0)
+
+    def flush(self):
+        """Write all pending views in one UPDATE. Must run inside the context of the app given to start()."""
+        db, Story = lookup('db', 'Story', app=self._app)
+
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._flushing = self._pending
+                self._pending = {}
+                self._events = 0
+            started = time.monotonic()
+            try:
+                Story.query.filter(Story.id.in_(list(batch))).update(
+                    {Story.views: db.func.coalesce(Story.views, 0) + db.case(batch, value=Story.id, else_=0)},
+                    synchronize_session=False
+                )
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                with self._lock:
+                    # 写入失败：放回 pending，下次再试
+                    for story_id, count in batch.items():
+                        self._pending[story_id] = self._pending.get(story_id, 0) + count
+                    self._events += sum(batch.values())
+                    self._flushing = {}
+                    self._stats['failures'] += 1
+                print(f"[view_counter] 写入浏览数失败（稍后重试）: {type(e).__name__}: {e}")
+                return 0
+            with self._lock:
+                self._flushing = {}
+                self._stats['flushes'] += 1
+                self._stats['rows_updated'] += len(batch)
+                self._stats['last_flush_ms'] = round((time.monotonic() - started) * 1000, 1)
+            return len(batch)
+
+    def _flush_in_app(self):
+        with self._app.app_context():
+            self.flush()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            try:
+                self._flush_in_app()
+            except Exception as e:
+                print(f"[view_counter] 出错: {type(e).__name__}: {e}")
+
+    def start(self, app):
+        """Start the flush thread once per process; pending views are also flushed at exit.
+
+        Views are written with the db and Story that `app` registered in app_models.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._run, daemon=True, name='view-counter')
+            self._thread.start()
+        atexit.register(self._flush_in_app)
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._stats,
+                pending_views=sum(self._pending.values()) + sum(self._flushing.values()),
+                pending_stories=len(self._pending),
+                flush_seconds=self.flush_seconds,
+                flush_events=self.flush_events,
+            )
+
+
+view_counter = ViewCounter(VIEW_FLUSH_SECONDS, VIEW_FLUSH_EVENTS)
+
+
+def start_view_counter(app):
+    view_counter.start(app)